@@ -39,14 +39,15 @@ from proxy import BlockstackRPCClient, get_default_proxy, set_default_proxy, jso
 from proxy import getinfo, ping, get_name_cost, get_namespace_cost, get_all_names, get_names_in_namespace, \
         get_names_owned_by_address, get_consensus_at, get_consensus_range, get_nameops_at, \
         get_nameops_hash_at, get_name_blockchain_record, get_namespace_blockchain_record, \
-        get_name_blockchain_history
+        get_name_blockchain_history, iter_all_names, iter_names_in_namespace, get_name_blockchain_records, \
+        iter_consensus_range
         
 from keys import make_wallet_keys, get_owner_privkey_info, get_data_privkey_info, get_payment_privkey_info
 
 from cli import get_cli_basic_methods, get_cli_advanced_methods
 from client import session, get_default_proxy, set_default_proxy, register_storage, load_storage
 
-from snv import snv_lookup, lookup_snv
+from snv import snv_lookup, snv_lookup_many, lookup_snv
 from data import get_immutable, get_immutable_by_name, get_mutable, put_immutable, put_mutable, delete_immutable, \
         delete_mutable, list_mutable_data, list_immutable_data, list_immutable_data_history, list_update_history, list_zonefile_history, \
         get_app_data, put_app_data, delete_app_data
@@ -55,7 +56,7 @@ from data import blockstack_url_fetch as fetch_data
 from data import data_get, data_put, data_delete, data_list
 from data import set_data_pubkey
 from storage import get_announcement, put_announcement, verify_zonefile
-from profile import get_name_profile, get_name_zonefile, get_and_migrate_profile
+from profile import get_name_profile, get_name_zonefile, get_and_migrate_profile, iter_name_profiles
 from accounts import list_accounts, get_account, put_account, delete_account, create_app_account
 
 from config import get_logger, get_config, CONFIG_PATH, CONFIG_FILENAME, get_utxo_provider_client, get_tx_broadcaster, default_bitcoind_opts
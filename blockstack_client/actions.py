@@ -79,6 +79,7 @@ from blockstack_client import \
     delete_mutable, \
     get_all_names, \
     get_consensus_at, \
+    get_consensus_range, \
     get_immutable, \
     get_immutable_by_name, \
     get_mutable, \
@@ -103,7 +104,7 @@ from blockstack_client import \
     put_immutable, \
     put_mutable
 
-from blockstack_client.profile import profile_update, zonefile_data_replicate
+from blockstack_client.profile import profile_update, zonefile_data_replicate, iter_name_profiles, NameResolverStats
 
 from rpc import local_rpc_connect, local_rpc_status, local_rpc_stop, start_rpc_endpoint
 import rpc as local_rpc
@@ -714,7 +715,7 @@ def cli_info( args, config_path=CONFIG_PATH ):
 
 def cli_ping( args, config_path=CONFIG_PATH ):
     """
-    command: ping
+    command: ping parallel
     help: Check server status and get server details
     """
     return get_server_info( args, config_path=config_path )
@@ -722,7 +723,7 @@ def cli_ping( args, config_path=CONFIG_PATH ):
 
 def cli_lookup( args, config_path=CONFIG_PATH ):
     """
-    command: lookup
+    command: lookup parallel
     help: Get the zone file and profile for a particular name
     arg: name (str) "The name to look up"
     """
@@ -767,7 +768,7 @@ def cli_lookup( args, config_path=CONFIG_PATH ):
 
 def cli_whois( args, config_path=CONFIG_PATH ):
     """
-    command: whois
+    command: whois parallel
     help: Look up the blockchain info for a name
     arg: name (str) "The name to look up"
     """
@@ -1582,7 +1583,7 @@ def cli_advanced_import_wallet( args, config_path=CONFIG_PATH, password=None, fo
 
 def cli_advanced_list_accounts( args, proxy=None, config_path=CONFIG_PATH, password=None ):
     """
-    command: list_accounts
+    command: list_accounts parallel
     help: List the set of accounts associated with a name.
     arg: name (str) "The name to query."
     """ 
@@ -1601,7 +1602,7 @@ def cli_advanced_list_accounts( args, proxy=None, config_path=CONFIG_PATH, passw
 
 def cli_advanced_get_account( args, proxy=None, config_path=CONFIG_PATH, password=None ):
     """
-    command: get_account
+    command: get_account parallel
     help: Get a particular account from a name.
     arg: name (str) "The name to query."
     arg: service (str) "The service for which this account was created."
@@ -1755,7 +1756,7 @@ def cli_advanced_wallet( args, config_path=CONFIG_PATH, password=None ):
 
 def cli_advanced_consensus( args, config_path=CONFIG_PATH ):
     """
-    command: consensus
+    command: consensus parallel
     help: Get current consensus information 
     opt: block_height (int) "The block height at which to query the consensus information.  If not given, the current height is used."
     """
@@ -1783,6 +1784,22 @@ def cli_advanced_consensus( args, config_path=CONFIG_PATH ):
     return result
 
 
+def cli_advanced_consensus_range( args, config_path=CONFIG_PATH ):
+    """
+    command: consensus_range parallel
+    help: Get the consensus hashes for a range of block heights
+    arg: start_block (int) "The start block height"
+    arg: end_block (int) "The end block height (inclusive)"
+    opt: cached (str) "If 'cached', reuse the consensus hashes this server sent us before, instead of fetching them again.  Do not use this to audit the server."
+    """
+    use_cache = (args.cached == 'cached')
+    resp = get_consensus_range(int(args.start_block), int(args.end_block), use_cache=use_cache)
+    if 'error' in resp:
+        return resp
+
+    return {'consensus': resp}
+
+
 def cli_advanced_rpcctl( args, config_path=CONFIG_PATH ):
     """
     command: rpcctl norpc
@@ -2025,7 +2042,7 @@ def cli_advanced_get_mutable( args, config_path=CONFIG_PATH, proxy=None ):
 
 def cli_advanced_get_immutable( args, config_path=CONFIG_PATH, proxy=None ):
     """
-    command: get_immutable
+    command: get_immutable parallel
     help: Get immutable data from a zonefile
     arg: name (str) "The name that has the data"
     arg: data_id_or_hash (str) "Either the name or the SHA256 of the data to obtain"
@@ -2046,7 +2063,7 @@ def cli_advanced_get_immutable( args, config_path=CONFIG_PATH, proxy=None ):
 
 def cli_advanced_list_update_history( args, config_path=CONFIG_PATH ):
     """
-    command: list_update_history
+    command: list_update_history parallel
     help: List the history of update hashes for a name
     arg: name (str) "The name whose data to list"
     """
@@ -2056,7 +2073,7 @@ def cli_advanced_list_update_history( args, config_path=CONFIG_PATH ):
 
 def cli_advanced_list_zonefile_history( args, config_path=CONFIG_PATH ):
     """
-    command: list_zonefile_history
+    command: list_zonefile_history parallel
     help: List the history of zonefiles for a name (if they can be obtained)
     arg: name (str) "The name whose zonefiles to list"
     """
@@ -2066,7 +2083,7 @@ def cli_advanced_list_zonefile_history( args, config_path=CONFIG_PATH ):
 
 def cli_advanced_list_immutable_data_history( args, config_path=CONFIG_PATH ):
     """
-    command: list_immutable_data_history
+    command: list_immutable_data_history parallel
     help: List all prior hashes of a given immutable datum
     arg: name (str) "The name whose data to list"
     arg: data_id (str) "The data identifier whose history to list"
@@ -2128,7 +2145,7 @@ def cli_advanced_delete_mutable( args, config_path=CONFIG_PATH ):
 
 def cli_advanced_get_name_blockchain_record( args, config_path=CONFIG_PATH ):
     """
-    command: get_name_blockchain_record
+    command: get_name_blockchain_record parallel
     help: Get the raw blockchain record for a name
     arg: name (str) "The name to list"
     """
@@ -2138,7 +2155,7 @@ def cli_advanced_get_name_blockchain_record( args, config_path=CONFIG_PATH ):
 
 def cli_advanced_get_name_blockchain_history( args, config_path=CONFIG_PATH ):
     """
-    command: get_name_blockchain_history
+    command: get_name_blockchain_history parallel
     help: Get a sequence of historic blockchain records for a name
     arg: name (str) "The name to query"
     opt: start_block (int) "The start block height"
@@ -2165,7 +2182,7 @@ def cli_advanced_get_name_blockchain_history( args, config_path=CONFIG_PATH ):
 
 def cli_advanced_get_namespace_blockchain_record( args, config_path=CONFIG_PATH ):
     """
-    command: get_namespace_blockchain_record
+    command: get_namespace_blockchain_record parallel
     help: Get the raw namespace blockchain record for a name
     arg: namespace_id (str) "The namespace ID to list"
     """
@@ -2175,7 +2192,7 @@ def cli_advanced_get_namespace_blockchain_record( args, config_path=CONFIG_PATH
 
 def cli_advanced_lookup_snv( args, config_path=CONFIG_PATH ):
     """
-    command: lookup_snv
+    command: lookup_snv parallel
     help: Use SNV to look up a name at a particular block height
     arg: name (str) "The name to query"
     arg: block_id (int) "The block height at which to query the name"
@@ -2189,7 +2206,7 @@ def cli_advanced_lookup_snv( args, config_path=CONFIG_PATH ):
 
 def cli_advanced_get_name_zonefile( args, config_path=CONFIG_PATH ):
     """
-    command: get_name_zonefile
+    command: get_name_zonefile parallel
     help: Get a name's zonefile
     arg: name (str) "The name to query"
     opt: json (str) "If 'true' is given, try to parse as JSON"
@@ -2225,7 +2242,7 @@ def cli_advanced_get_name_zonefile( args, config_path=CONFIG_PATH ):
 
 def cli_advanced_get_names_owned_by_address( args, config_path=CONFIG_PATH ):
     """
-    command: get_names_owned_by_address
+    command: get_names_owned_by_address parallel
     help: Get the list of names owned by an address
     arg: address (str) "The address to query"
     """
@@ -2235,7 +2252,7 @@ def cli_advanced_get_names_owned_by_address( args, config_path=CONFIG_PATH ):
 
 def cli_advanced_get_namespace_cost( args, config_path=CONFIG_PATH ):
     """
-    command: get_namespace_cost
+    command: get_namespace_cost parallel
     help: Get the cost of a namespace
     arg: namespace_id (str) "The namespace ID to query"
     """
@@ -2284,9 +2301,154 @@ def cli_advanced_get_names_in_namespace( args, config_path=CONFIG_PATH ):
     return result
 
 
+def load_export_checkpoint( checkpoint_path, namespace_id, output_path ):
+    """
+    Load the checkpoint of an interrupted export_profiles run,
+    and cut the output file back to what the checkpoint covers.
+    Return the number of names already exported (0 if there is nothing to resume)
+    """
+    if not os.path.exists(checkpoint_path) or not os.path.exists(output_path):
+        return 0
+
+    try:
+        with open(checkpoint_path, "r") as f:
+            checkpoint = json.loads(f.read())
+
+        assert checkpoint['namespace_id'] == namespace_id, "Checkpoint is for namespace '%s'" % checkpoint['namespace_id']
+        assert os.stat(output_path).st_size >= checkpoint['output_len'], "Output file is shorter than the checkpoint"
+
+        with open(output_path, "r+") as f:
+            f.truncate(checkpoint['output_len'])
+
+        return int(checkpoint['offset'])
+
+    except Exception, e:
+        log.exception(e)
+        log.error("Ignoring unusable checkpoint %s" % checkpoint_path)
+        return 0
+
+
+def save_export_checkpoint( checkpoint_path, namespace_id, offset, output_len ):
+    """
+    Atomically record how far an export_profiles run got
+    """
+    checkpoint = {
+        'namespace_id': namespace_id,
+        'offset': offset,
+        'output_len': output_len,
+        'updated_at': time.time(),
+    }
+
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(json.dumps(checkpoint))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.rename(tmp_path, checkpoint_path)
+
+
+def cli_advanced_export_profiles( args, config_path=CONFIG_PATH, proxy=None ):
+    """
+    command: export_profiles norpc
+    help: Write the zonefile and profile of every name in a namespace to a file, as newline-delimited JSON
+    arg: namespace_id (str) "The ID of the namespace to export"
+    arg: path (str) "The file to write.  If a previous export to it was interrupted, it is resumed."
+    opt: workers (int) "The number of profiles to fetch at once"
+    """
+    namespace_id = str(args.namespace_id)
+    output_path = str(args.path)
+    checkpoint_path = output_path + ".checkpoint"
+
+    max_workers = config.PROFILE_RESOLVER_MAX_WORKERS
+    if getattr(args, 'workers', None) is not None:
+        max_workers = max(1, int(args.workers))
+
+    if proxy is None:
+        proxy = get_default_proxy(config_path=config_path)
+
+    offset = load_export_checkpoint( checkpoint_path, namespace_id, output_path )
+    if offset > 0:
+        print >> sys.stderr, "Resuming export of '%s' after %s names" % (namespace_id, offset)
+        output = open(output_path, "a")
+    else:
+        output = open(output_path, "w")
+
+    names_error = {}
+    def names():
+        for name in iter_names_in_namespace( namespace_id, offset=offset, proxy=proxy ):
+            if isinstance(name, dict):
+                names_error.update(name)
+                return
+
+            yield name
+
+    stats = NameResolverStats()
+    num_names = 0
+    num_errors = 0
+    last_report = time.time()
+    interrupted = False
+    failed = False
+
+    try:
+        for res in iter_name_profiles( names(), proxy=proxy, max_workers=max_workers, stats=stats ):
+            output.write(json.dumps(res, sort_keys=True) + "\n")
+            num_names += 1
+            if 'error' in res:
+                num_errors += 1
+
+            if num_names % config.PROFILE_RESOLVER_BATCH_SIZE == 0:
+                output.flush()
+                save_export_checkpoint( checkpoint_path, namespace_id, offset + num_names, output.tell() )
+
+            if time.time() - last_report >= config.PROFILE_EXPORT_REPORT_INTERVAL:
+                last_report = time.time()
+                stage_stats = stats.get_stats()
+                print >> sys.stderr, "%s names exported (%s errors), %.1f names/sec (%s)" % \
+                        (offset + num_names, num_errors, num_names / stage_stats['elapsed'],
+                         ", ".join(["%s: %.1f/sec" % (stage_name, stage['items_per_second']) for (stage_name, stage) in sorted(stage_stats['stages'].items())]))
+
+    except KeyboardInterrupt:
+        interrupted = True
+
+    except Exception, e:
+        log.exception(e)
+        failed = True
+
+    output.flush()
+    save_export_checkpoint( checkpoint_path, namespace_id, offset + num_names, output.tell() )
+    output.close()
+
+    if interrupted:
+        return {'error': 'Interrupted after %s names; run again to resume' % (offset + num_names)}
+
+    if failed:
+        return {'error': 'Failed to export profiles after %s names; run again to resume' % (offset + num_names)}
+
+    if 'error' in names_error:
+        return {'error': 'Failed to list names after %s names: %s; run again to resume' % (offset + num_names, names_error['error'])}
+
+    # done
+    os.unlink(checkpoint_path)
+
+    stage_stats = stats.get_stats()
+    result = {
+        'status': True,
+        'path': output_path,
+        'names': offset + num_names,
+        'exported': num_names,
+        'errors': num_errors,
+        'elapsed': stage_stats['elapsed'],
+        'names_per_second': num_names / stage_stats['elapsed'] if stage_stats['elapsed'] > 0 else None,
+        'stages': stage_stats['stages'],
+    }
+
+    return result
+
+
 def cli_advanced_get_nameops_at( args, config_path=CONFIG_PATH ):
     """
-    command: get_nameops_at
+    command: get_nameops_at parallel
     help: Get the list of name operations that occurred at a given block number
     arg: block_id (int) "The block height to query"
     """
@@ -2542,7 +2704,8 @@ def cli_advanced_sync_zonefile( args, config_path=CONFIG_PATH, proxy=None, inter
             return {'error': "Unable to lookup txid that wrote zonefile"}
  
     # can proceed to replicate
-    res = zonefile_data_replicate( name, user_data, txid, [(conf['server'], conf['port'])], config_path=config_path )
+    # NOTE: the CLI exits when we return, so don't leave any pushes running in the background
+    res = zonefile_data_replicate( name, user_data, txid, [(conf['server'], conf['port'])], config_path=config_path, background=False )
     if 'error' in res:
         log.error("Failed to replicate zonefile: %s" % res['error'])
         return res
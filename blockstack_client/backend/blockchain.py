@@ -27,6 +27,10 @@ import virtualchain
 import pybitcoin
 import json
 import traceback
+import threading
+import time
+import socket
+import httplib
 
 # Hack around absolute paths
 current_dir = os.path.abspath(os.path.dirname(__file__))
@@ -37,6 +41,7 @@ from ..config import MAXIMUM_NAMES_PER_ADDRESS
 from ..config import BLOCKSTACKD_SERVER, BLOCKSTACKD_PORT
 
 from ..config import MINIMUM_BALANCE, CONFIG_PATH
+from ..config import BITCOIND_CLIENT_IDLE_TIMEOUT, BLOCK_HEIGHT_CACHE_TTL
 from ..config import get_logger, get_utxo_provider_client
 
 from ..utils import satoshis_to_btc
@@ -49,27 +54,98 @@ from ..scripts import tx_get_unspents
 
 log = get_logger() 
 
+class BitcoindClient(object):
+    """
+    A connection to bitcoind that is reused across calls.
+
+    bitcoind's RPC methods are called as methods on this object.
+    We reconnect if the connection has been idle for longer than
+    BITCOIND_CLIENT_IDLE_TIMEOUT seconds (e.g. we were asleep, and
+    bitcoind dropped us), and retry once on socket errors.
+    Calls are serialized, since the underlying connection is not thread-safe.
+    """
+    def __init__(self, config_path):
+        self.config_path = config_path
+        self.opts = virtualchain.get_bitcoind_config(config_file=config_path)
+        self.lock = threading.Lock()
+        self.client = None
+        self.last_used = 0
+        self.reconnects = 0
+
+
+    def connect(self):
+        """
+        (Re)connect to bitcoind.
+        Must be called with the lock held.
+        """
+        log.debug("Connect to bitcoind at %s:%s (%s)" % (self.opts['bitcoind_server'], self.opts['bitcoind_port'], self.config_path))
+        self.client = virtualchain.connect_bitcoind( self.opts )
+
+
+    def call(self, method_name, *args):
+        """
+        Call a bitcoind RPC method, reconnecting if need be.
+        Raise on error
+        """
+        with self.lock:
+            if self.client is None or time.time() - self.last_used > BITCOIND_CLIENT_IDLE_TIMEOUT:
+                self.connect()
+
+            try:
+                ret = getattr(self.client, method_name)(*args)
+            except (socket.error, httplib.HTTPException), e:
+                log.debug("Lost connection to bitcoind (%s); reconnecting" % e)
+                self.reconnects += 1
+                self.connect()
+                ret = getattr(self.client, method_name)(*args)
+
+            self.last_used = time.time()
+            return ret
+
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return lambda *args: self.call(name, *args)
+
+
+bitcoind_clients = {}       # config path => BitcoindClient
+bitcoind_clients_lock = threading.Lock()
+
+block_heights = {}          # config path => (block height, time fetched)
+block_heights_lock = threading.Lock()
+
+
 def get_bitcoind_client(config_path=CONFIG_PATH):
     """
-    Connect to bitcoind
+    Get the (shared) connection to bitcoind for this config file
     """
-    bitcoind_opts = virtualchain.get_bitcoind_config(config_file=config_path)
-    log.debug("Connect to bitcoind at %s:%s (%s)" % (bitcoind_opts['bitcoind_server'], bitcoind_opts['bitcoind_port'], config_path))
-    client = virtualchain.connect_bitcoind( bitcoind_opts )
+    with bitcoind_clients_lock:
+        client = bitcoind_clients.get(config_path, None)
+        if client is None:
+            client = BitcoindClient(config_path)
+            bitcoind_clients[config_path] = client
 
     return client
 
 
 def get_block_height(config_path=CONFIG_PATH):
     """
-    Return block height (currently uses bitcoind)
+    Return block height (currently uses bitcoind).
+    The height is cached for BLOCK_HEIGHT_CACHE_TTL seconds,
+    so callers in the same registrar pass agree on it.
     Return the height on success
     Return None on error
     """
 
-    resp = None
+    with block_heights_lock:
+        if block_heights.has_key(config_path):
+            height, fetched_at = block_heights[config_path]
+            if time.time() - fetched_at < BLOCK_HEIGHT_CACHE_TTL:
+                return height
 
-    # get a fresh local client (needed after waking up from sleep)
+    resp = None
     bitcoind_client = get_bitcoind_client(config_path=config_path)
 
     try:
@@ -82,6 +158,10 @@ def get_block_height(config_path=CONFIG_PATH):
         log.debug("ERROR: block height")
         log.debug(e)
 
+    if resp is not None:
+        with block_heights_lock:
+            block_heights[config_path] = (resp, time.time())
+
     return resp
 
 
@@ -92,8 +172,6 @@ def get_tx_confirmations(tx_hash, config_path=CONFIG_PATH):
     """
 
     resp = None
-
-    # get a fresh local client (needed after waking up from sleep)
     bitcoind_client = get_bitcoind_client(config_path=config_path)
 
     try:
@@ -117,6 +195,163 @@ def get_tx_confirmations(tx_hash, config_path=CONFIG_PATH):
     return resp
 
 
+class TxConfirmationTracker(object):
+    """
+    Track the confirmations of the transactions the registrar is waiting on.
+
+    Each txid is looked up once (with getrawtransaction) to find the
+    block it was mined in, if any.  After that, each refresh only reads
+    the chain height and scans the blocks that arrived since the last
+    refresh for the txids that are still unconfirmed.  If more blocks
+    arrived than it would take calls to look the unconfirmed txids up
+    again, or the chain tip changed under us (a reorg), we look them up instead.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mined = {}             # txid => height of the block it was mined in, or None if unconfirmed
+        self.unresolved = set()     # txids we have yet to look up
+        self.block_height = None    # chain height as of the last refresh
+        self.block_hash = None      # hash of the block at that height
+
+
+    def watch(self, txids):
+        """
+        Start tracking a list of txids
+        """
+        with self.lock:
+            for txid in txids:
+                if not self.mined.has_key(txid):
+                    self.unresolved.add(txid)
+
+
+    def unwatch(self, txids):
+        """
+        Stop tracking a list of txids
+        """
+        with self.lock:
+            for txid in txids:
+                self.mined.pop(txid, None)
+                self.unresolved.discard(txid)
+
+
+    def lookup(self, bitcoind_client, txid):
+        """
+        Find out which block a transaction was mined in.
+        Must be called with the lock held.
+        """
+        try:
+            # second argument of '1' asks for results in JSON
+            tx_data = bitcoind_client.getrawtransaction(txid, 1)
+            mined_height = None
+            if tx_data is not None and tx_data.get('confirmations', 0) > 0:
+                mined_height = bitcoind_client.getblock(tx_data['blockhash'])['height']
+
+        except Exception as e:
+            log.debug("ERROR: failed to query tx details for %s" % txid)
+            return
+
+        self.unresolved.discard(txid)
+        if mined_height is not None:
+            self.mined[txid] = mined_height
+        else:
+            log.debug("Tx %s is not yet confirmed" % txid)
+            self.mined[txid] = None
+
+
+    def refresh(self, config_path=CONFIG_PATH):
+        """
+        Bring all confirmation counts up to date with the chain tip.
+        Return the chain height on success
+        Return None on error
+        """
+        with self.lock:
+            bitcoind_client = get_bitcoind_client(config_path=config_path)
+            block_height = get_block_height(config_path=config_path)
+            if block_height is None:
+                return None
+
+            try:
+                pending = [txid for (txid, height) in self.mined.items() if height is None]
+
+                if self.block_height is not None:
+                    reorged = False
+                    try:
+                        reorged = (bitcoind_client.getblockhash(self.block_height) != self.block_hash)
+                    except Exception as e:
+                        reorged = True
+
+                    num_blocks = block_height - self.block_height
+                    if reorged or num_blocks < 0:
+                        log.debug("Chain tip changed at %s; re-checking all transactions" % self.block_height)
+                        self.unresolved.update(self.mined.keys())
+
+                    elif num_blocks == 0:
+                        pass
+
+                    elif 2 * num_blocks > len(pending):
+                        # cheaper to look them up again
+                        self.unresolved.update(pending)
+
+                    else:
+                        pending = set(pending)
+                        for height in xrange(self.block_height + 1, block_height + 1):
+                            block = bitcoind_client.getblock(bitcoind_client.getblockhash(height))
+                            for txid in pending.intersection(block['tx']):
+                                log.debug("Tx %s was mined in block %s" % (txid, height))
+                                self.mined[txid] = height
+
+                for txid in list(self.unresolved):
+                    self.lookup(bitcoind_client, txid)
+
+                self.block_hash = bitcoind_client.getblockhash(block_height)
+                self.block_height = block_height
+
+            except Exception as e:
+                log.exception(e)
+                log.error("Failed to refresh transaction confirmations")
+                return None
+
+            return block_height
+
+
+    def get_confirmations(self, txid):
+        """
+        Get the number of confirmations for a tracked transaction, as of the last refresh.
+        Return None if not known
+        """
+        with self.lock:
+            if txid in self.unresolved or not self.mined.has_key(txid) or self.block_height is None:
+                return None
+
+            height = self.mined[txid]
+            if height is None:
+                return 0
+
+            # may have been mined after the (cached) block height we last refreshed at
+            return max(0, self.block_height - height + 1)
+
+
+tx_confirmation_tracker = TxConfirmationTracker()
+
+
+def get_tx_confirmations_many(txids, config_path=CONFIG_PATH):
+    """
+    Get the number of confirmations for each of a list of transactions,
+    using (and updating) the shared confirmation tracker.
+    Return {txid: confirmations}, where confirmations is None if not known
+    """
+    tx_confirmation_tracker.watch(txids)
+    tx_confirmation_tracker.refresh(config_path=config_path)
+    return dict( [(txid, tx_confirmation_tracker.get_confirmations(txid)) for txid in txids] )
+
+
+def untrack_tx_confirmations(txids):
+    """
+    Stop tracking a list of transactions (i.e. once they have been dequeued)
+    """
+    tx_confirmation_tracker.unwatch(txids)
+
+
 def get_tx_fee( tx_hex, config_path=CONFIG_PATH ):
     """
     Get the tx fee from bitcoind
@@ -38,6 +38,9 @@ from common import get_logger, DEBUG
 
 log = get_logger("blockstack-storage-driver-blockstack-s3-readonly")
 
+# each read is its own HTTP request to the resolver
+READ_THREAD_SAFE = True
+
 if os.environ.get("BLOCKSTACK_TEST") is None:
     RESOLVER_URL = "https://onename.com"
     STORAGE_URL = "https://blockstack.s3.amazonaws.com"
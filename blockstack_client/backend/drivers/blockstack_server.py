@@ -54,6 +54,9 @@ else:
     SERVER_PORT = 6264
 
 log = get_logger("blockstack-storage-driver-blockstack-server")
+
+# each read makes its own xmlrpclib.ServerProxy
+READ_THREAD_SAFE = True
 log.setLevel(logging.DEBUG)
 
 
@@ -67,6 +67,9 @@ def hostname_to_ip(servers):
 # client to the DHT
 dht_server = None
 
+# each read makes its own DHT client (get_dht_client())
+READ_THREAD_SAFE = True
+
 
 def dht_data_hash(data):
     """
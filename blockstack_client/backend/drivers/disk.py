@@ -32,6 +32,9 @@ from common import get_logger, DEBUG
 
 log = get_logger("blockstack-storage-driver-disk")
 
+# reads only open and read local files
+READ_THREAD_SAFE = True
+
 if os.environ.get("BLOCKSTACK_TEST", None) is not None:
     DISK_ROOT = "/tmp/blockstack-disk"
 else:
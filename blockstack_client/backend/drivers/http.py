@@ -28,6 +28,9 @@ from common import get_logger
 
 log = get_logger("blockstack-storage-drivers-http")
 
+# each read is its own HTTP request
+READ_THREAD_SAFE = True
+
 def storage_init(conf):
     return True
 
@@ -39,6 +39,9 @@ from common import get_logger, DEBUG
 
 log = get_logger("blockstack-storage-driver-s3")
 
+# each read makes its own S3 connection (get_bucket())
+READ_THREAD_SAFE = True
+
 log.setLevel( logging.DEBUG if DEBUG else logging.INFO )
 
 AWS_BUCKET = None
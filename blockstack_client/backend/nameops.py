@@ -22,6 +22,7 @@
 
 import os
 import sys
+import threading
 import json
 import simplejson
 import pybitcoin
@@ -67,6 +68,26 @@ import virtualchain
 
 log = get_logger("blockstack-client")
 
+# transactions from the same payment address must be built and sent one at a time,
+# or they will pick the same UTXOs
+payment_address_locks = {}
+payment_address_locks_lock = threading.Lock()
+
+
+def get_payment_address_lock( payment_address ):
+    """
+    Get the lock to hold while building and sending
+    a transaction funded by payment_address
+    """
+    with payment_address_locks_lock:
+        lock = payment_address_locks.get(payment_address, None)
+        if lock is None:
+            lock = threading.RLock()
+            payment_address_locks[payment_address] = lock
+
+    return lock
+
+
 
 def estimate_dust_fee( tx, fee_estimator ):
     """
@@ -1356,7 +1377,8 @@ def async_preorder(fqu, payment_privkey_info, owner_address, cost, owner_privkey
         return {'error': 'Already in preorder queue'}
 
     try:
-        resp = do_preorder( fqu, payment_privkey_info, owner_address, cost, utxo_client, tx_broadcaster, owner_privkey_params=owner_privkey_params, config_path=CONFIG_PATH )
+        with get_payment_address_lock( get_privkey_info_address(payment_privkey_info) ):
+            resp = do_preorder( fqu, payment_privkey_info, owner_address, cost, utxo_client, tx_broadcaster, owner_privkey_params=owner_privkey_params, config_path=CONFIG_PATH )
     except Exception, e:
         log.exception(e)
         return {'error': 'Failed to sign and broadcast preorder transaction'}
@@ -1423,7 +1445,8 @@ def async_register(fqu, payment_privkey_info, owner_address, owner_privkey_param
         return {'error': 'Waiting on preorder confirmations'}
 
     try:
-        resp = do_register( fqu, payment_privkey_info, owner_address, utxo_client, tx_broadcaster, owner_privkey_params=owner_privkey_params, config_path=config_path, proxy=proxy )
+        with get_payment_address_lock( get_privkey_info_address(payment_privkey_info) ):
+            resp = do_register( fqu, payment_privkey_info, owner_address, utxo_client, tx_broadcaster, owner_privkey_params=owner_privkey_params, config_path=config_path, proxy=proxy )
     except Exception, e:
         log.exception(e)
         return {'error': 'Failed to sign and broadcast registration transaction'}
@@ -1479,7 +1502,8 @@ def async_update(fqu, zonefile_data, profile, owner_privkey_info, payment_privke
 
     resp = {}
     try:
-        resp = do_update( fqu, zonefile_hash, owner_privkey_info, payment_privkey_info, utxo_client, tx_broadcaster, config_path=config_path, proxy=proxy )
+        with get_payment_address_lock( get_privkey_info_address(payment_privkey_info) ):
+            resp = do_update( fqu, zonefile_hash, owner_privkey_info, payment_privkey_info, utxo_client, tx_broadcaster, config_path=config_path, proxy=proxy )
     except Exception, e:
         log.exception(e)
         return {'error': 'Failed to sign and broadcast update transaction'}
@@ -1529,7 +1553,8 @@ def async_transfer(fqu, transfer_address, owner_privkey_info, payment_privkey_in
         return {'error': 'Already in transfer queue'}
 
     try:
-        resp = do_transfer( fqu, transfer_address, True, owner_privkey_info, payment_privkey_info, utxo_client, tx_broadcaster, config_path=config_path, proxy=proxy )
+        with get_payment_address_lock( get_privkey_info_address(payment_privkey_info) ):
+            resp = do_transfer( fqu, transfer_address, True, owner_privkey_info, payment_privkey_info, utxo_client, tx_broadcaster, config_path=config_path, proxy=proxy )
     except Exception, e:
         log.exception(e)
         return {'error': 'Failed to sign and broadcast transfer transaction'}
@@ -1570,7 +1595,8 @@ def async_renew(fqu, owner_privkey_info, payment_privkey_info, renewal_fee, prox
         return {'error': 'Already in renew queue'}
 
     try:
-        resp = do_renewal( fqu, owner_privkey_info, payment_privkey_info, renewal_fee, utxo_client, tx_broadcaster, config_path=config_path, proxy=proxy )
+        with get_payment_address_lock( get_privkey_info_address(payment_privkey_info) ):
+            resp = do_renewal( fqu, owner_privkey_info, payment_privkey_info, renewal_fee, utxo_client, tx_broadcaster, config_path=config_path, proxy=proxy )
     except Exception, e:
         log.exception(e)
         return {'error': 'Failed to sign and broadcast renewal transaction'}
@@ -1606,7 +1632,8 @@ def async_revoke(fqu, owner_privkey_info, payment_privkey_info, proxy=None, conf
         return {'error': 'Already in revoke queue'}
 
     try:
-        resp = do_revoke( fqu, owner_privkey_info, payment_privkey_info, utxo_client, tx_broadcaster, config_path=config_path, proxy=proxy )
+        with get_payment_address_lock( get_privkey_info_address(payment_privkey_info) ):
+            resp = do_revoke( fqu, owner_privkey_info, payment_privkey_info, utxo_client, tx_broadcaster, config_path=config_path, proxy=proxy )
     except Exception, e:
         log.exception(e)
         return {'error': 'Failed to sign and broadcast revoke transaction'}
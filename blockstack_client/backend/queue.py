@@ -28,23 +28,39 @@ import json
 import base64
 import random
 import time
+import threading
 
 from ..config import DEFAULT_QUEUE_PATH, QUEUE_LENGTH_TO_MONITOR, PREORDER_MAX_CONFIRMATIONS, CONFIG_PATH
+from ..config import QUEUE_DB_BUSY_TIMEOUT, QUEUE_DB_CACHED_STATEMENTS, TX_CONFIRMATIONS_NEEDED, TX_EXPIRED_INTERVAL
 from ..proxy import get_default_proxy
 
 from ..storage import hash_zonefile
 from ..profile import get_name_zonefile
 from ..proxy import is_name_registered, is_name_owner, has_zonefile_hash
 from .blockchain import get_block_height, get_tx_confirmations, is_tx_rejected, is_tx_accepted
+from .blockchain import get_tx_confirmations_many, untrack_tx_confirmations
 
+# block_height:         the height at which the entry was queued (copied out of data)
+# confirmations:        the transaction's confirmations, as of last_checked_height
+# last_checked_height:  the block height at which we last asked bitcoind about the transaction
 QUEUE_SQL = """
 CREATE TABLE entries( fqu STRING NOT NULL,
                       queue_id STRING NOT NULL,
                       tx_hash TEXT NOT NULL,
                       data NOT NULL,
+                      block_height INTEGER,
+                      confirmations INTEGER,
+                      last_checked_height INTEGER,
                       PRIMARY KEY(fqu,queue_id) );
+CREATE INDEX entries_confirmations ON entries(queue_id, confirmations);
+CREATE INDEX entries_block_height ON entries(queue_id, block_height);
+CREATE INDEX entries_last_checked_height ON entries(queue_id, last_checked_height);
+CREATE INDEX entries_tx_hash ON entries(tx_hash);
 """
 
+# bump whenever QUEUE_SQL changes, and teach queuedb_migrate how to upgrade
+QUEUE_SCHEMA_VERSION = 2
+
 
 from ..utils import pretty_print as pprint
 
@@ -53,6 +69,27 @@ from ..config import get_logger
 
 log = get_logger()
 
+# each thread keeps one open connection per queue database
+queuedb_connections = threading.local()
+
+# the registrar's stages run concurrently, but only one thread
+# in this process writes to the queues at a time
+queuedb_write_lock = threading.Lock()
+
+
+def queuedb_connect( path ):
+    """
+    Make a new connection to a queue database.
+    Use WAL journaling, so readers don't block the writer,
+    and let sqlite wait out lock contention for us.
+    """
+    con = sqlite3.connect( path, isolation_level=None, timeout=QUEUE_DB_BUSY_TIMEOUT, cached_statements=QUEUE_DB_CACHED_STATEMENTS )
+    con.execute("PRAGMA journal_mode=WAL;")
+    con.execute("PRAGMA busy_timeout=%d;" % int(QUEUE_DB_BUSY_TIMEOUT * 1000))
+    con.row_factory = queuedb_row_factory
+    return con
+
+
 def queuedb_create( path ):
     """
     Create a sqlite3 db at the given path.
@@ -65,25 +102,106 @@ def queuedb_create( path ):
         raise Exception("Database '%s' already exists" % path)
 
     lines = [l + ";" for l in QUEUE_SQL.split(";")]
-    con = sqlite3.connect( path, isolation_level=None )
+    con = queuedb_connect( path )
 
     for line in lines:
         con.execute(line)
 
-    con.row_factory = queuedb_row_factory
+    con.execute("PRAGMA user_version=%d;" % QUEUE_SCHEMA_VERSION)
     return con
 
 
+def queuedb_migrate( con ):
+    """
+    Bring an existing queue database up to QUEUE_SCHEMA_VERSION.
+    This happens in place, in one transaction, so other
+    threads and processes can keep using the database.
+    Raise on error
+    """
+    version = con.execute("PRAGMA user_version;").fetchone()['user_version']
+    if version >= QUEUE_SCHEMA_VERSION:
+        return
+
+    con.execute("BEGIN IMMEDIATE;")
+    try:
+        # someone else may have done it while we waited for the lock
+        version = con.execute("PRAGMA user_version;").fetchone()['user_version']
+        if version < 2:
+            log.debug("Migrating queue database to schema version 2")
+
+            columns = [r['name'] for r in con.execute("PRAGMA table_info(entries);").fetchall()]
+            for column in ['block_height', 'confirmations', 'last_checked_height']:
+                if column not in columns:
+                    con.execute("ALTER TABLE entries ADD COLUMN %s INTEGER;" % column)
+
+            heights = []
+            for row in con.execute("SELECT rowid, data FROM entries;").fetchall():
+                data = json.loads(row['data'])
+                heights.append( (data.get('block_height', None), row['rowid']) )
+
+            con.executemany("UPDATE entries SET block_height = ? WHERE rowid = ?;", heights)
+
+            for line in QUEUE_SQL.split(";"):
+                if line.strip().startswith("CREATE INDEX"):
+                    con.execute(line.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS") + ";")
+
+        con.execute("PRAGMA user_version=%d;" % QUEUE_SCHEMA_VERSION)
+        con.execute("COMMIT;")
+
+    except:
+        con.execute("ROLLBACK;")
+        raise
+
+
 def queuedb_open( path ):
     """
-    Open a connection to our database 
+    Get this thread's connection to our database,
+    opening (or creating) it if need be.
+    The connection stays open; do not close it.
+    """
+    connections = getattr(queuedb_connections, 'connections', None)
+    if connections is None or queuedb_connections.pid != os.getpid():
+        # first use in this thread, or we forked
+        connections = {}
+        queuedb_connections.connections = connections
+        queuedb_connections.pid = os.getpid()
+
+    con = connections.get(path, None)
+    if con is not None and not os.path.exists( path ):
+        # database got deleted out from under us
+        con.close()
+        con = None
+
+    if con is None:
+        if not os.path.exists( path ):
+            con = queuedb_create( path )
+        else:
+            con = queuedb_connect( path )
+            queuedb_migrate( con )
+
+        connections[path] = con
+
+    return con
+
+
+def queuedb_close( path=None ):
+    """
+    Close this thread's connection to a queue database
+    (or to all of them, if path is None).
     """
-    if not os.path.exists( path ):
-        con = queuedb_create( path )
+    connections = getattr(queuedb_connections, 'connections', None)
+    if connections is None or queuedb_connections.pid != os.getpid():
+        return
+
+    if path is None:
+        paths = connections.keys()
     else:
-        con = sqlite3.connect( path, isolation_level=None )
-        con.row_factory = queuedb_row_factory
-    return con
+        paths = [path]
+
+    for p in paths:
+        con = connections.pop(p, None)
+        if con is not None:
+            con.close()
 
 
 def queuedb_row_factory( cursor, row ):
@@ -107,23 +225,27 @@ def queuedb_row_factory( cursor, row ):
     return d
 
 
-def queuedb_query_execute( cur, query, values ):
+def queuedb_query_execute( cur, query, values, many=False ):
     """
-    Execute a query.  If it fails, exit.
+    Execute a query (or, if many is True, execute it once
+    for each tuple in values).  If it fails, exit.
+    sqlite waits out other writers for up to QUEUE_DB_BUSY_TIMEOUT
+    seconds before telling us the database is locked.
 
     DO NOT CALL THIS DIRECTLY.
     """
 
-    timeout = 1.0
     while True:
         try:
-            ret = cur.execute( query, values )
+            if many:
+                ret = cur.executemany( query, values )
+            else:
+                ret = cur.execute( query, values )
+
             return ret
         except sqlite3.OperationalError as oe:
             if oe.message == "database is locked":
-                timeout = timeout * 2 + timeout * random.random()
-                log.error("Query timed out due to lock; retrying in %s: %s" % (timeout, namedb_format_query( query, values )))
-                time.sleep(timeout)
+                log.error("Query timed out after %s seconds due to lock; retrying: (%s, %s)" % (QUEUE_DB_BUSY_TIMEOUT, query, values))
             
             else:
                 log.exception(oe)
@@ -138,38 +260,47 @@ def queuedb_query_execute( cur, query, values ):
             os.abort()
 
 
-def queuedb_find( queue_id, fqu, limit=None, path=DEFAULT_QUEUE_PATH ):
+def queuedb_select( sql, args, limit=None, path=DEFAULT_QUEUE_PATH ):
     """
-    Find a record by fqu and queue ID
-    Return the rows on success (empty list if not found)
-    Raise on error
+    Run a SELECT and fetch at most limit rows.
+    The cursor is always exhausted and closed, so we don't
+    hold a read transaction open on the shared connection.
     """
-    sql = "SELECT * FROM entries WHERE queue_id = ? AND fqu = ?;"
-    args = (queue_id,fqu)
-    
+    if limit is not None:
+        sql = sql.rstrip(";") + " LIMIT ?;"
+        args = args + (limit,)
+
     db = queuedb_open(path)
     if db is None:
         raise Exception("Failed to open %s" % path)
 
     cur = db.cursor()
-    rows = queuedb_query_execute( cur, sql, args )
+    try:
+        rows = queuedb_query_execute( cur, sql, args )
 
-    count = 0
-    ret = []
-    for row in rows:
-        dat = {}
-        dat.update(row)
-        ret.append(dat)
+        ret = []
+        for row in rows.fetchall():
+            dat = {}
+            dat.update(row)
+            ret.append(dat)
 
-        count += 1
-        if limit is not None and count == limit:
-            break
+    finally:
+        cur.close()
 
-    db.commit()
-    db.close()
     return ret
 
 
+def queuedb_find( queue_id, fqu, limit=None, path=DEFAULT_QUEUE_PATH ):
+    """
+    Find a record by fqu and queue ID
+    Return the rows on success (empty list if not found)
+    Raise on error
+    """
+    sql = "SELECT * FROM entries WHERE queue_id = ? AND fqu = ?;"
+    args = (queue_id,fqu)
+    return queuedb_select( sql, args, limit=limit, path=path )
+
+
 def queuedb_findall( queue_id, limit=None, path=DEFAULT_QUEUE_PATH ):
     """
     Get all queued entries
@@ -178,69 +309,175 @@ def queuedb_findall( queue_id, limit=None, path=DEFAULT_QUEUE_PATH ):
     """
     sql = "SELECT * FROM entries WHERE queue_id = ?;"
     args = (queue_id,)
-    
+    return queuedb_select( sql, args, limit=limit, path=path )
+
+
+def queuedb_insert( queue_id, fqu, tx_hash, data_json, path=DEFAULT_QUEUE_PATH ):
+    """
+    Insert an element into a queue
+    Return True on success
+    Raise on error
+    """
+    sql = "INSERT INTO entries (fqu, queue_id, tx_hash, data, block_height) VALUES (?,?,?,?,?);"
+    args = (fqu, queue_id, tx_hash, json.dumps(data_json,sort_keys=True), data_json.get('block_height', None))
+
     db = queuedb_open(path)
     if db is None:
         raise Exception("Failed to open %s" % path)
 
-    cur = db.cursor()
-    rows = queuedb_query_execute( cur, sql, args )
+    with queuedb_write_lock:
+        cur = db.cursor()
+        res = queuedb_query_execute( cur, sql, args )
+        cur.close()
 
-    count = 0
-    ret = []
-    for row in rows:
-        dat = {}
-        dat.update(row)
-        ret.append(dat)
+    return True
 
-        count += 1
-        if limit is not None and count == limit:
-            break
 
-    db.commit()
-    db.close()
-    return ret
+def queuedb_remove( queue_id, fqu, tx_hash, path=DEFAULT_QUEUE_PATH ):
+    """
+    Remove an element from a queue.
+    Return True on success
+    Raise on error
+    """
+    return queuedb_removeall( [(queue_id, fqu, tx_hash)], path=path )
 
 
-def queuedb_insert( queue_id, fqu, tx_hash, data_json, path=DEFAULT_QUEUE_PATH ):
+def queuedb_removeall( keys, path=DEFAULT_QUEUE_PATH ):
     """
-    Insert an element into a queue
+    Remove a list of (queue_id, fqu, tx_hash) elements from their queues,
+    in a single transaction.
     Return True on success
     Raise on error
     """
-    sql = "INSERT INTO entries VALUES (?,?,?,?);"
-    args = (fqu, queue_id, tx_hash, json.dumps(data_json,sort_keys=True)) 
+    if len(keys) == 0:
+        return True
+
+    sql = "DELETE FROM entries WHERE queue_id = ? AND fqu = ? AND tx_hash = ?;"
 
     db = queuedb_open(path)
     if db is None:
         raise Exception("Failed to open %s" % path)
 
-    cur = db.cursor()
-    res = queuedb_query_execute( cur, sql, args )
+    with queuedb_write_lock:
+        cur = db.cursor()
+        try:
+            queuedb_query_execute( cur, "BEGIN IMMEDIATE;", () )
+            try:
+                queuedb_query_execute( cur, sql, list(keys), many=True )
+                queuedb_query_execute( cur, "COMMIT;", () )
+            except:
+                # we issued BEGIN ourselves, so db.rollback() would not know about it
+                cur.execute("ROLLBACK;")
+                raise
+
+        finally:
+            cur.close()
 
-    db.commit()
-    db.close()
     return True
 
 
-def queuedb_remove( queue_id, fqu, tx_hash, path=DEFAULT_QUEUE_PATH ):
+def queuedb_find_unchecked( queue_id, block_height, path=DEFAULT_QUEUE_PATH ):
     """
-    Remove an element from a queue.
+    Find the entries in a queue whose confirmations have not been
+    checked at the given block height (or at all, if block_height is None).
+    Only the key columns are loaded.
+    Return the rows on success (empty list if not found)
+    Raise on error
+    """
+    if block_height is None:
+        sql = "SELECT queue_id, fqu, tx_hash FROM entries WHERE queue_id = ?;"
+        args = (queue_id,)
+    else:
+        sql = "SELECT queue_id, fqu, tx_hash FROM entries WHERE queue_id = ? AND (last_checked_height IS NULL OR last_checked_height < ?);"
+        args = (queue_id, block_height)
+
+    return queuedb_select( sql, args, path=path )
+
+
+def queuedb_find_confirmed( queue_id, min_confirmations, path=DEFAULT_QUEUE_PATH ):
+    """
+    Find the entries in a queue whose transactions had more than
+    min_confirmations confirmations when we last checked.
+    Return the rows on success (empty list if not found)
+    Raise on error
+    """
+    sql = "SELECT * FROM entries WHERE queue_id = ? AND confirmations > ?;"
+    args = (queue_id, min_confirmations)
+    return queuedb_select( sql, args, path=path )
+
+
+def queuedb_find_unconfirmed_before( queue_id, block_height, path=DEFAULT_QUEUE_PATH ):
+    """
+    Find the entries in a queue that were queued before the given
+    block height, and whose transactions had no confirmations when we last checked.
+    Return the rows on success (empty list if not found)
+    Raise on error
+    """
+    sql = "SELECT * FROM entries WHERE queue_id = ? AND block_height < ? AND confirmations = 0;"
+    args = (queue_id, block_height)
+    return queuedb_select( sql, args, path=path )
+
+
+def queuedb_set_confirmations( statuses, block_height, path=DEFAULT_QUEUE_PATH ):
+    """
+    Record the confirmations for a list of entries, as of block_height.
+    statuses is a list of (queue_id, fqu, tx_hash, confirmations).
     Return True on success
     Raise on error
     """
-    sql = "DELETE FROM entries WHERE queue_id = ? AND fqu = ? AND tx_hash = ?;"
-    args = (queue_id, fqu, tx_hash)
+    if len(statuses) == 0:
+        return True
+
+    sql = "UPDATE entries SET confirmations = ?, last_checked_height = ? WHERE queue_id = ? AND fqu = ? AND tx_hash = ?;"
+    args = [(confirmations, block_height, queue_id, fqu, tx_hash) for (queue_id, fqu, tx_hash, confirmations) in statuses]
 
     db = queuedb_open(path)
     if db is None:
         raise Exception("Failed to open %s" % path)
 
-    cur = db.cursor()
-    res = queuedb_query_execute( cur, sql, args )
+    with queuedb_write_lock:
+        cur = db.cursor()
+        try:
+            queuedb_query_execute( cur, "BEGIN IMMEDIATE;", () )
+            try:
+                queuedb_query_execute( cur, sql, args, many=True )
+                queuedb_query_execute( cur, "COMMIT;", () )
+            except:
+                cur.execute("ROLLBACK;")
+                raise
+
+        finally:
+            cur.close()
+
+    return True
+
+
+def queue_refresh_confirmations( queue_id, path=DEFAULT_QUEUE_PATH, config_path=CONFIG_PATH ):
+    """
+    Get the confirmations of each transaction in the queue that we
+    have not yet checked at the current block height from the
+    confirmation tracker, and store them in the queue.  Sweeps can
+    then select rows by their confirmations without decoding every entry.
+    Return True on success
+    Raise on error
+    """
+    block_height = get_block_height(config_path=config_path)
+    rows = queuedb_find_unchecked( queue_id, block_height, path=path )
+    if len(rows) == 0:
+        return True
+
+    tx_confirmations = get_tx_confirmations_many( [row['tx_hash'] for row in rows], config_path=config_path )
 
-    db.commit()
-    db.close()
+    statuses = []
+    for row in rows:
+        confirmations = tx_confirmations[row['tx_hash']]
+        if confirmations is None:
+            # try again next time
+            continue
+
+        statuses.append( (row['queue_id'], row['fqu'], row['tx_hash'], confirmations) )
+
+    queuedb_set_confirmations( statuses, block_height, path=path )
     return True
 
 
@@ -319,7 +556,8 @@ def is_entry_accepted( entry, config_path=CONFIG_PATH ):
     Return True if so.
     Return False on error.
     """
-    return is_tx_accepted( entry['tx_hash'], config_path=config_path )
+    confirmations = get_tx_confirmations_many( [entry['tx_hash']], config_path=config_path )[entry['tx_hash']]
+    return confirmations > TX_CONFIRMATIONS_NEEDED
 
 
 def is_entry_rejected( entry, config_path=CONFIG_PATH ):
@@ -328,7 +566,9 @@ def is_entry_rejected( entry, config_path=CONFIG_PATH ):
     been pending for long enough that we can
     safely assume it won't be incorporated.
     """
-    return is_tx_rejected( entry['tx_hash'], config_path=config_path )
+    current_height = get_block_height(config_path=config_path)
+    confirmations = get_tx_confirmations_many( [entry['tx_hash']], config_path=config_path )[entry['tx_hash']]
+    return (current_height - entry['block_height']) > TX_EXPIRED_INTERVAL and confirmations == 0
 
 
 def is_preorder_expired( entry, config_path=CONFIG_PATH ):
@@ -336,7 +576,7 @@ def is_preorder_expired( entry, config_path=CONFIG_PATH ):
     Given a preorder entry, determine whether or
     not it is expired
     """
-    tx_confirmations = get_tx_confirmations(entry['tx_hash'], config_path=config_path)
+    tx_confirmations = get_tx_confirmations_many( [entry['tx_hash']], config_path=config_path )[entry['tx_hash']]
     if tx_confirmations > PREORDER_MAX_CONFIRMATIONS:
         return True
 
@@ -355,7 +595,7 @@ def is_update_expired( entry, config_path=CONFIG_PATH ):
     """
     Is an update expired?
     """
-    confirmations = get_tx_confirmations(entry['tx_hash'], config_path=config_path)
+    confirmations = get_tx_confirmations_many( [entry['tx_hash']], config_path=config_path )[entry['tx_hash']]
     if confirmations > MAX_TX_CONFIRMATIONS:
         return True
 
@@ -380,7 +620,7 @@ def is_revoke_expired( entry, config_path=CONFIG_PATH ):
     """
     Is a revoke expired?
     """
-    return is_revoke_expired(entry, config_path=CONFIG_PATH)
+    return is_update_expired(entry, config_path=config_path)
 
 
 def display_queue(queue_id, display_details=False, path=DEFAULT_QUEUE_PATH, config_path=CONFIG_PATH):
@@ -390,12 +630,12 @@ def display_queue(queue_id, display_details=False, path=DEFAULT_QUEUE_PATH, conf
     track_confirmations = [0] * QUEUE_LENGTH_TO_MONITOR
 
     rows = queuedb_findall( queue_id, path=path)
+    tx_confirmations = get_tx_confirmations_many( [rowdata['tx_hash'] for rowdata in rows], config_path=config_path )
     for rowdata in rows:
         entry = extract_entry(rowdata)
 
-        try:
-            confirmations = get_tx_confirmations(entry['tx_hash'], config_path=config_path)
-        except:
+        confirmations = tx_confirmations[entry['tx_hash']]
+        if confirmations is None:
             continue
 
         try:
@@ -426,16 +666,15 @@ def cleanup_preorder_queue(path=DEFAULT_QUEUE_PATH, config_path=CONFIG_PATH):
     Return True on success.
     Raise on error
     """
-    rows = queuedb_findall("preorder", path=path)
+    queue_refresh_confirmations("preorder", path=path, config_path=config_path)
+
+    # stale preorders
+    rows = queuedb_find_confirmed("preorder", PREORDER_MAX_CONFIRMATIONS, path=path)
     to_remove = []
     for rowdata in rows:
         entry = extract_entry(rowdata)
-
-        # clear stale preorder
-        if is_preorder_expired( entry, config_path=config_path ):
-            log.debug("Removing stale preorder: %s" % entry['fqu'])
-            to_remove.append(entry)
-            continue
+        log.debug("Removing stale preorder: %s" % entry['fqu'])
+        to_remove.append(entry)
 
     queue_removeall( to_remove, path=path )
     return True
@@ -448,16 +687,15 @@ def cleanup_register_queue(path=DEFAULT_QUEUE_PATH, config_path=CONFIG_PATH):
     Return True on success
     Raise on error.
     """
-    rows = queuedb_findall("register", path=path)
+    queue_refresh_confirmations("register", path=path, config_path=config_path)
+
+    # stale registers (i.e. older than their preorders could be)
+    rows = queuedb_find_confirmed("register", PREORDER_MAX_CONFIRMATIONS, path=path)
     to_remove = []
     for rowdata in rows:
         entry = extract_entry(rowdata)
-
-        # clear stale register
-        if is_register_expired( entry, config_path=config_path ):
-            log.debug("Removing stale register: %s" % entry['fqu'])
-            to_remove.append(entry)
-            continue
+        log.debug("Removing stale register: %s" % entry['fqu'])
+        to_remove.append(entry)
 
     queue_removeall( to_remove, path=path )
     return True
@@ -474,13 +712,13 @@ def cleanup_update_queue(path=DEFAULT_QUEUE_PATH, config_path=CONFIG_PATH):
     TODO: add integration test to ensure our failsafe works
     """
     
-    rows = queuedb_findall("update", path=path)
+    queue_refresh_confirmations("update", path=path, config_path=config_path)
+
+    # only expired updates are candidates
+    rows = queuedb_find_confirmed("update", MAX_TX_CONFIRMATIONS, path=path)
     to_remove = []
     for rowdata in rows:
         entry = extract_entry(rowdata)
-        if not is_update_expired(entry, config_path=config_path):
-            # not expired yet
-            continue
 
         # don't dequeue until we're sure the zonefile has replicated
         zf = get_name_zonefile( entry['fqu'], raw_zonefile=True )
@@ -517,7 +755,10 @@ def cleanup_transfer_queue(path=DEFAULT_QUEUE_PATH, config_path=CONFIG_PATH):
     Return True on success
     Raise on error.
     """
-    rows = queuedb_findall("transfer", path=path)
+    queue_refresh_confirmations("transfer", path=path, config_path=config_path)
+
+    # stale transfers
+    rows = queuedb_find_confirmed("transfer", MAX_TX_CONFIRMATIONS, path=path)
     to_remove = []
     for rowdata in rows:
         entry = extract_entry(rowdata)
@@ -529,13 +770,10 @@ def cleanup_transfer_queue(path=DEFAULT_QUEUE_PATH, config_path=CONFIG_PATH):
             log.debug("Transfer address not saved")
             exit(0)
 
-        # clear stale transfer
-        if is_transfer_expired(entry, config_path=config_path):
-            log.debug("Removing tx with > max confirmations: (%s, %s, confirmations %s)"
-                      % (fqu, transfer_address, confirmations))
+        log.debug("Removing tx with > max confirmations: (%s, %s, confirmations %s)"
+                  % (fqu, transfer_address, rowdata['confirmations']))
 
-            to_remove.append(entry)
-            continue
+        to_remove.append(entry)
 
     queue_removeall( to_remove, path=path )
     return True
@@ -548,18 +786,17 @@ def cleanup_renew_queue(path=DEFAULT_QUEUE_PATH, config_path=CONFIG_PATH):
     Return True on success
     Raise on error
     """
-    rows = queuedb_findall("renew", path=path)
+    queue_refresh_confirmations("renew", path=path, config_path=config_path)
+
+    # stale renews
+    rows = queuedb_find_confirmed("renew", MAX_TX_CONFIRMATIONS, path=path)
     to_remove = []
     for rowdata in rows:
         entry = extract_entry(rowdata)
-        
-        # clear stale renew
-        if is_renew_expired(entry, config_path=config_path):
-            log.debug("Removing tx with > max confirmations: (%s, confirmations %s)"
-                      % (fqu, confirmations))
+        log.debug("Removing tx with > max confirmations: (%s, confirmations %s)"
+                  % (entry['fqu'], rowdata['confirmations']))
 
-            to_remove.append(entry)
-            continue
+        to_remove.append(entry)
 
     queue_removeall( to_remove, path=path )
     return True
@@ -572,18 +809,17 @@ def cleanup_revoke_queue(path=DEFAULT_QUEUE_PATH, config_path=CONFIG_PATH):
     Return True on success
     Raise on error
     """
-    rows = queuedb_findall("revoke", path=path)
+    queue_refresh_confirmations("revoke", path=path, config_path=config_path)
+
+    # stale revokes
+    rows = queuedb_find_confirmed("revoke", MAX_TX_CONFIRMATIONS, path=path)
     to_remove = []
     for rowdata in rows:
         entry = extract_entry(rowdata)
-        
-        # clear stale renew
-        if is_revoke_expired(entry, config_path=config_path):
-            log.debug("Removing tx with > max confirmations: (%s, confirmations %s)"
-                      % (fqu, confirmations))
+        log.debug("Removing tx with > max confirmations: (%s, confirmations %s)"
+                  % (entry['fqu'], rowdata['confirmations']))
 
-            to_remove.append(entry)
-            continue
+        to_remove.append(entry)
 
     queue_removeall( to_remove, path=path )
     return True
@@ -651,13 +887,19 @@ def queue_remove_expired(queue_id, path=DEFAULT_QUEUE_PATH, config_path=CONFIG_P
     Return True on success
     Raise on error
     """
-    rows = queuedb_findall( queue_id, path=path )
+    queue_refresh_confirmations( queue_id, path=path, config_path=config_path )
+
+    current_height = get_block_height(config_path=config_path)
+    if current_height is None:
+        raise Exception("Failed to get block height")
+
+    # still unconfirmed, long after being sent
+    rows = queuedb_find_unconfirmed_before( queue_id, current_height - TX_EXPIRED_INTERVAL, path=path )
     to_remove = []
     for rowdata in rows:
         entry = extract_entry(rowdata)
-        if is_entry_rejected( entry, config_path=config_path ):
-            log.debug("TX rejected by network, removing TX: %s" % entry['tx_hash'])
-            to_remove.append(entry)
+        log.debug("TX rejected by network, removing TX: %s" % entry['tx_hash'])
+        to_remove.append(entry)
 
     queue_removeall( to_remove, path=path )
     return True
@@ -667,10 +909,12 @@ def queue_removeall( entries, path=DEFAULT_QUEUE_PATH ):
     """
     Remove all given entries form their given queues
     """
-    for entry in entries:
-        rc = queuedb_remove( entry['type'], entry['fqu'], entry['tx_hash'], path=path )
-        if not rc:
-            raise Exception("Failed to remove %s.%s.%s" % (entry['type'], entry['fqu'], entry['tx_hash']))
+    keys = [(entry['type'], entry['fqu'], entry['tx_hash']) for entry in entries]
+    rc = queuedb_removeall( keys, path=path )
+    if not rc:
+        raise Exception("Failed to remove %s entries" % len(keys))
+
+    untrack_tx_confirmations( [entry['tx_hash'] for entry in entries] )
 
     return True
 
@@ -680,12 +924,13 @@ def queue_find_accepted( queue_id, path=DEFAULT_QUEUE_PATH, config_path=CONFIG_P
     Find all pending operations in the given queue
     that have been accepted.
     """
-    rows = queuedb_findall( queue_id, path=path )
+    queue_refresh_confirmations( queue_id, path=path, config_path=config_path )
+
+    rows = queuedb_find_confirmed( queue_id, TX_CONFIRMATIONS_NEEDED, path=path )
     accepted = []
     for rowdata in rows:
         entry = extract_entry(rowdata)
-        if is_entry_accepted( entry, config_path=config_path ):
-            accepted.append(entry)
+        accepted.append(entry)
 
     return accepted
 
@@ -44,15 +44,17 @@ from keylib import ECPrivateKey
 import blockstack_profiles
 import blockstack_zones
 
-from .queue import get_queue_state, in_queue, queue_removeall
+from .queue import get_queue_state, in_queue, queue_removeall, queuedb_find
 from .queue import queue_cleanall, queue_find_accepted
 
 from .nameops import async_preorder, async_register, async_update, async_transfer, async_renew, async_revoke
 from .blockchain import get_block_height
 
 from ..keys import get_data_privkey_info, is_singlesig, is_multisig, get_privkey_info_address, get_privkey_info_params, encrypt_private_key_info, decrypt_private_key_info
-from ..proxy import is_name_registered, is_zonefile_hash_current, is_name_owner, get_default_proxy, get_name_blockchain_record, get_name_cost, get_atlas_peers
-from ..profile import get_and_migrate_profile, zonefile_data_replicate
+from ..proxy import is_name_registered, is_zonefile_hash_current, is_name_owner, get_default_proxy, get_name_blockchain_record, get_name_cost, get_atlas_peers, \
+    get_name_blockchain_records
+from ..proxy import get_proxy_concurrency
+from ..profile import get_and_migrate_profile, zonefile_data_replicate, zonefile_data_publish_many
 from ..user import make_empty_user_zonefile, is_user_zonefile 
 from ..storage import put_mutable_data, put_immutable_data, hash_zonefile, get_zonefile_data_hash
 from ..data import get_profile_timestamp, set_profile_timestamp
@@ -60,6 +62,8 @@ from ..data import get_profile_timestamp, set_profile_timestamp
 from .crypto.utils import aes_decrypt, aes_encrypt
 
 from ..config import SLEEP_INTERVAL, get_config, get_logger, CONFIG_PATH, DEFAULT_QUEUE_PATH, url_to_host_port
+from ..config import REGISTRAR_STAGE_MAX_WORKERS
+from ..utils import parallel_map
 
 DEBUG = True
 
@@ -129,6 +133,112 @@ def plugin_shutdown(config_path=None):
     __plugin_state = None
 
 
+class RegistrarStageStats(object):
+    """
+    Throughput and latency of each of the registrar's stages:
+    how long each pass over a queue takes, and how long each
+    name in it takes.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+
+    def get_stage(self, stage_name):
+        """
+        Get the counters for a stage, creating them if need be.
+        Must be called with the lock held.
+        """
+        if not self.stages.has_key(stage_name):
+            self.stages[stage_name] = {
+                'runs': 0,
+                'failed_runs': 0,
+                'run_time': 0.0,
+                'last_run_time': None,
+                'last_run_at': None,
+                'items': 0,
+                'failed_items': 0,
+                'item_time': 0.0,
+                'max_item_time': 0.0,
+            }
+
+        return self.stages[stage_name]
+
+
+    def record_run(self, stage_name, duration, failed):
+        """
+        Record one pass of a stage
+        """
+        with self.lock:
+            stage = self.get_stage(stage_name)
+            stage['runs'] += 1
+            stage['run_time'] += duration
+            stage['last_run_time'] = duration
+            stage['last_run_at'] = time.time()
+            if failed:
+                stage['failed_runs'] += 1
+
+
+    def record_item(self, stage_name, duration, failed):
+        """
+        Record the processing of one queue entry in a stage
+        """
+        with self.lock:
+            stage = self.get_stage(stage_name)
+            stage['items'] += 1
+            stage['item_time'] += duration
+            stage['max_item_time'] = max(stage['max_item_time'], duration)
+            if failed:
+                stage['failed_items'] += 1
+
+
+    def get_stats(self):
+        """
+        Get a summary of each stage's throughput and latency
+        """
+        ret = {}
+        with self.lock:
+            for (stage_name, stage) in self.stages.items():
+                ret[stage_name] = {
+                    'runs': stage['runs'],
+                    'failed_runs': stage['failed_runs'],
+                    'mean_run_time': (stage['run_time'] / stage['runs']) if stage['runs'] > 0 else None,
+                    'last_run_time': stage['last_run_time'],
+                    'last_run_at': stage['last_run_at'],
+                    'items': stage['items'],
+                    'failed_items': stage['failed_items'],
+                    'items_per_second': (stage['items'] / stage['run_time']) if stage['run_time'] > 0 else None,
+                    'mean_item_time': (stage['item_time'] / stage['items']) if stage['items'] > 0 else None,
+                    'max_item_time': stage['max_item_time'],
+                }
+
+        return ret
+
+
+registrar_stage_stats = RegistrarStageStats()
+
+
+def timed_stage_item( stage_name, func ):
+    """
+    Wrap func(entry), which returns True on success and False on failure,
+    so its latency gets recorded against the given stage.
+    Exceptions are logged and count as failures.
+    """
+    def timed_func( entry ):
+        start = time.time()
+        ok = False
+        try:
+            ok = func( entry )
+        except Exception, e:
+            log.exception(e)
+            log.error("%s: failed to process '%s'" % (stage_name, entry.get('fqu', None)))
+
+        registrar_stage_stats.record_item( stage_name, time.time() - start, not ok )
+        return ok
+
+    return timed_func
+
+
 class RegistrarWorker(threading.Thread):
     """
     Worker thread for waiting for transactions to go through.
@@ -229,38 +339,41 @@ class RegistrarWorker(threading.Thread):
 
 
     @classmethod
-    def init_profiles( cls, queue_path, config_path=CONFIG_PATH, proxy=None ):
+    def init_profiles( cls, queue_path, config_path=CONFIG_PATH, proxy=None, max_workers=1 ):
         """
         Find all confirmed registrations, create empty zonefiles for them and broadcast their hashes to the blockchain.
         Queue up the zonefiles and profiles for subsequent replication.
+        Work on up to max_workers names at once.
         Return {'status': True} on success
         Return {'error': ...} on failure
         """
         if proxy is None:
             proxy = get_default_proxy(config_path=config_path)
 
-        ret = {'status': True}
-        registers = cls.get_confirmed_registers( config_path, queue_path )
-        for register in registers:
-
+        def init_registered( register ):
             # already migrated?
             if in_queue("update", register['fqu'], path=queue_path):
                 log.warn("Already initialized profile for name '%s'" % register['fqu'])
                 queue_removeall( [register], path=queue_path )
-                continue
+                return True
 
             log.debug("Register for '%s' (%s) is confirmed!" % (register['fqu'], register['tx_hash']))
             res = cls.init_profile( register, proxy=proxy, queue_path=queue_path, config_path=config_path )
             if 'error' in res:
                 log.error("Failed to make name profile for %s: %s" % (register['fqu'], res['error']))
-                ret = {'error': 'Failed to set up name profile'}
+                return False
 
-            else:
-                # success!
-                log.debug("Sent update for '%s'" % register['fqu'])
-                queue_removeall( [register], path=queue_path )
+            # success!
+            log.debug("Sent update for '%s'" % register['fqu'])
+            queue_removeall( [register], path=queue_path )
+            return True
 
-        return ret
+        registers = cls.get_confirmed_registers( config_path, queue_path )
+        results = parallel_map( timed_stage_item("init_profiles", init_registered), registers, max_workers=max_workers )
+        if False in results:
+            return {'error': 'Failed to set up name profile'}
+
+        return {'status': True}
 
 
     @classmethod
@@ -300,9 +413,10 @@ class RegistrarWorker(threading.Thread):
 
 
     @classmethod 
-    def register_preorders( cls, queue_path, wallet_data, config_path=CONFIG_PATH, proxy=None ):
+    def register_preorders( cls, queue_path, wallet_data, config_path=CONFIG_PATH, proxy=None, max_workers=1 ):
         """
         Find all confirmed preorders, and register them.
+        Work on up to max_workers names at once.
         Return {'status': True} on success
         Return {'error': ...} on error
         'names' maps to the list of queued name data for names that were registered
@@ -311,17 +425,14 @@ class RegistrarWorker(threading.Thread):
         if proxy is None:
             proxy = get_default_proxy(config_path=config_path)
 
-        ret = {'status': True}
-        preorders = cls.get_confirmed_preorders( config_path, queue_path )
-        for preorder in preorders:
-
+        def register_preordered( preorder ):
             log.debug("Preorder for '%s' (%s) is confirmed!" % (preorder['fqu'], preorder['tx_hash']))
             
             # did we already register?
             if in_queue("register", preorder['fqu'], path=queue_path):
                 log.warn("Already queued name '%s' for registration" % preorder['fqu'])
                 queue_removeall( [preorder], path=queue_path )
-                continue
+                return True
 
             res = cls.register_preordered_name( preorder, wallet_data['payment_privkey'], wallet_data['owner_privkey'], proxy=proxy, config_path=config_path, queue_path=queue_path )
             if 'error' in res:
@@ -329,17 +440,22 @@ class RegistrarWorker(threading.Thread):
                     # can clear out, this is a dup
                     log.debug("%s is already registered!" % preorder['fqu'])
                     queue_removeall( [preorder], path=queue_path )
+                    return True
 
-                else:
-                    log.error("Failed to register preordered name %s: %s" % (preorder['fqu'], res['error']))
-                    ret = {'error': 'Failed to preorder a name'} 
+                log.error("Failed to register preordered name %s: %s" % (preorder['fqu'], res['error']))
+                return False
 
-            else:
-                # clear 
-                log.debug("Sent register for %s" % preorder['fqu'] )
-                queue_removeall( [preorder], path=queue_path )
+            # clear 
+            log.debug("Sent register for %s" % preorder['fqu'] )
+            queue_removeall( [preorder], path=queue_path )
+            return True
 
-        return ret
+        preorders = cls.get_confirmed_preorders( config_path, queue_path )
+        results = parallel_map( timed_stage_item("register_preorders", register_preordered), preorders, max_workers=max_workers )
+        if False in results:
+            return {'error': 'Failed to preorder a name'}
+
+        return {'status': True}
 
 
     @classmethod
@@ -360,13 +476,13 @@ class RegistrarWorker(threading.Thread):
 
     
     @classmethod 
-    def replicate_profile_data( cls, name_data, atlas_servers, wallet_data, storage_drivers, config_path, proxy=None ):
+    def replicate_zonefile_data( cls, name_data, storage_drivers, config_path, proxy=None, name_rec=None ):
         """
-        Given an update queue entry,
-        replicate the zonefile to as many
-        blockstack atlas servers as we can.
-        If given, replicate the profile as well.
-        @atlas_servers should be a list of (host, port)
+        Given an update queue entry, make sure its zonefile hash
+        is on the blockchain, and replicate the zonefile to our
+        storage drivers (but not to blockstack atlas servers).
+        If name_rec is given, it is the name's current blockchain record
+        (otherwise, we fetch it).
         Return {'status': True} on success
         Return {'error': ...} on error
         """
@@ -381,7 +497,9 @@ class RegistrarWorker(threading.Thread):
         if zonefile_hash is None:
             zonefile_hash = get_zonefile_data_hash( zonefile_data )
 
-        name_rec = get_name_blockchain_record( name_data['fqu'], proxy=proxy )
+        if name_rec is None:
+            name_rec = get_name_blockchain_record( name_data['fqu'], proxy=proxy )
+
         if 'error' in name_rec:
             return name_rec
 
@@ -392,12 +510,24 @@ class RegistrarWorker(threading.Thread):
             log.error("Zonefile %s has not been confirmed yet (still on %s)" % (zonefile_hash, name_rec['value_hash']))
             return {'error': 'Zonefile hash not yet replicated'}
 
-        res = zonefile_data_replicate( name_data['fqu'], zonefile_data, name_data['tx_hash'], atlas_servers, config_path=config_path, storage_drivers=storage_drivers )
+        res = zonefile_data_replicate( name_data['fqu'], zonefile_data, name_data['tx_hash'], None, config_path=config_path, storage_drivers=storage_drivers )
         if 'error' in res:
             log.error("Failed to replicate zonefile %s for %s: %s" % (zonefile_hash, name_data['fqu'], res['error']))
             return res
 
-        log.info("Replicated zonefile data for %s to %s server(s)" % (name_data['fqu'], len(res['servers'])))
+        return {'status': True}
+
+
+    @classmethod
+    def replicate_profile( cls, name_data, wallet_data, storage_drivers, config_path ):
+        """
+        Given an update queue entry whose zonefile has been replicated,
+        replicate its profile (if given) to our storage drivers.
+        Return {'status': True} on success
+        Return {'error': ...} on error
+        """
+        if name_data['zonefile'] is None:
+            return {'status': True}
 
         # replicate profile to storage, if given
         # use the data keypair
@@ -406,7 +536,7 @@ class RegistrarWorker(threading.Thread):
             # the zonefile to find the appropriate data private key.
             zonefile = None
             try:
-                zonefile = blockstack_zones.parse_zone_file( zonefile_data )
+                zonefile = blockstack_zones.parse_zone_file( name_data['zonefile'] )
                 assert is_user_zonefile( zonefile )
             except Exception, e:
                 if os.environ.get("BLOCKSTACK_TEST", None) == 1:
@@ -437,26 +567,63 @@ class RegistrarWorker(threading.Thread):
 
 
     @classmethod
-    def replicate_profiles( cls, queue_path, atlas_servers, wallet_data, storage_drivers, config_path=CONFIG_PATH, proxy=None ):
+    def replicate_profiles( cls, queue_path, atlas_servers, wallet_data, storage_drivers, config_path=CONFIG_PATH, proxy=None, max_workers=1 ):
         """
         Replicate all zonefiles for each confirmed update.
         Remove successfully-replicated updates
+        Work on up to max_workers names at once, and send the
+        zonefiles to each atlas server in batches.
+        Updates that fail are left in the queue, to be retried on their own.
         @atlas_servers should be a list of (host, port)
         """
-        ret = {'status': True} 
-        updates = cls.get_confirmed_updates( config_path, queue_path )
-        for update in updates:
+        def replicate_zonefile( update ):
             log.debug("Zonefile update on '%s' (%s) is confirmed!  New hash is %s" % (update['fqu'], update['tx_hash'], update['zonefile_hash']))
-            res = cls.replicate_profile_data( update, atlas_servers, wallet_data, storage_drivers, config_path, proxy=proxy )
+            res = cls.replicate_zonefile_data( update, storage_drivers, config_path, proxy=proxy, name_rec=name_recs.get(update['fqu'], None) )
             if 'error' in res:
                 log.error("Failed to update %s: %s" % (update['fqu'], res['error']))
-                ret = {'error': 'Failed to finish an update'}
+                return False
 
-            else:
-                # clear 
-                queue_removeall( [update], path=queue_path )
+            return True
 
-        return ret
+        def replicate_profile( update ):
+            res = cls.replicate_profile( update, wallet_data, storage_drivers, config_path )
+            if 'error' in res:
+                log.error("Failed to update %s: %s" % (update['fqu'], res['error']))
+                return False
+
+            # clear 
+            queue_removeall( [update], path=queue_path )
+            return True
+
+        updates = cls.get_confirmed_updates( config_path, queue_path )
+
+        # look up all the names at once
+        name_recs = {}
+        if len(updates) > 0:
+            name_recs = get_name_blockchain_records( [update['fqu'] for update in updates if update['zonefile'] is not None], proxy=proxy )
+
+        results = parallel_map( timed_stage_item("replicate_zonefiles", replicate_zonefile), updates, max_workers=max_workers )
+        failed = (False in results)
+
+        # send all the zonefiles we have to each atlas server at once
+        publish = [update for (update, rc) in zip(updates, results) if rc and update['zonefile'] is not None]
+        publish_results = zonefile_data_publish_many( [update['zonefile'] for update in publish], atlas_servers )
+
+        ready = [update for (update, rc) in zip(updates, results) if rc and update['zonefile'] is None]
+        for (update, res) in zip(publish, publish_results):
+            if 'error' in res:
+                log.error("Failed to replicate zonefile for %s: %s" % (update['fqu'], res['error']))
+                failed = True
+                continue
+
+            log.info("Replicated zonefile data for %s to %s server(s)" % (update['fqu'], len(res['servers'])))
+            ready.append(update)
+
+        results = parallel_map( timed_stage_item("replicate_profiles", replicate_profile), ready, max_workers=max_workers )
+        if failed or False in results:
+            return {'error': 'Failed to finish an update'}
+
+        return {'status': True}
         
 
     @classmethod 
@@ -587,10 +754,8 @@ class RegistrarWorker(threading.Thread):
         Watch the various queues:
         * if we find an accepted preorder, send the accompanying register
         * if we find an accepted update, replicate the accompanying zonefile
+        Each stage runs in its own thread; this thread holds the lockfile until they all stop.
         """
-        failed = False
-        poll_interval = self.poll_interval
-
         log.info("Registrar worker entered")
 
         # set up a lockfile
@@ -632,84 +797,79 @@ class RegistrarWorker(threading.Thread):
 
         log.debug("Registrar worker starting up")
 
-        while self.running:
+        # each stage polls its own queue, so a slow stage doesn't hold up the others
+        stages = [
+            ("register_preorders", self.run_register_preorders),
+            ("init_profiles", self.run_init_profiles),
+            ("replicate_profiles", self.run_replicate_profiles),
+            ("clear_confirmed", self.run_clear_confirmed),
+            ("queue_cleanall", self.run_queue_cleanall),
+        ]
 
-            failed = False
-            wallet_data = None
-            proxy = get_default_proxy( config_path=self.config_path )
+        stage_threads = []
+        for (stage_name, stage_func) in stages:
+            t = threading.Thread( target=self.stage_loop, args=(stage_name, stage_func), name="registrar-%s" % stage_name )
+            t.start()
+            stage_threads.append(t)
 
-            try:
-                wallet_data = get_wallet( self.rpc_token, config_path=self.config_path, proxy=proxy )
-
-                # wait until the owner address is set 
-                while ('error' in wallet_data or wallet_data['owner_address'] is None) and self.running:
-                    log.debug("Owner address not set... (%s)" % wallet_data.get("error", ""))
-                    wallet_data = get_wallet( self.rpc_token, config_path=self.config_path, proxy=proxy )
-                    time.sleep(1.0)
-                
-                # preemption point
-                if not self.running:
-                    break
+        for t in stage_threads:
+            t.join()
 
-            except Exception, e:
-                log.exception(e)
-                break
+        log.info("Registrar worker exited")
+        self.cleanup_lockfile( self.lockfile_path )
 
-            try:
-                # see if we can complete any registrations
-                # clear out any confirmed preorders
-                log.debug("register all pending preorders in %s" % (self.queue_path))
-                res = RegistrarWorker.register_preorders( self.queue_path, wallet_data, config_path=self.config_path, proxy=proxy )
-                if 'error' in res:
-                    log.warn("Registration failed: %s" % res['error'])
 
-                    # try exponential backoff
-                    failed = True
-                    poll_interval = 1.0
+    def get_wallet_data(self, proxy):
+        """
+        Get the wallet, waiting until the owner address is set.
+        Return the wallet data on success
+        Return None if we were asked to stop while waiting
+        Raise on error
+        """
+        wallet_data = get_wallet( self.rpc_token, config_path=self.config_path, proxy=proxy )
 
-            except Exception, e:
-                log.exception(e)
-                failed = True
+        # wait until the owner address is set 
+        while ('error' in wallet_data or wallet_data['owner_address'] is None) and self.running:
+            log.debug("Owner address not set... (%s)" % wallet_data.get("error", ""))
+            wallet_data = get_wallet( self.rpc_token, config_path=self.config_path, proxy=proxy )
+            time.sleep(1.0)
+        
+        # preemption point
+        if not self.running:
+            return None
 
-            try:
-                # see if we can put any zonefiles
-                # clear out any confirmed registers
-                log.debug("put zonefile hashes for registered names in %s" % (self.queue_path))
-                res = RegistrarWorker.init_profiles( self.queue_path, config_path=self.config_path, proxy=proxy )
-                if 'error' in res:
-                    log.warn('zonefile hash broadcast failed: %s' % res['error'])
+        return wallet_data
 
-                    # try exponential backoff 
-                    failed = True
-                    poll_interval = 1.0
 
-            except Exception, e:
-                log.exception(e)
-                failed = True
+    def stage_loop(self, stage_name, stage_func):
+        """
+        Run one stage of the registrar until we're asked to stop:
+        call stage_func(wallet_data, proxy, max_workers) every poll interval,
+        and back off exponentially while it fails.
+        """
+        poll_interval = self.poll_interval
 
-            try:
-                # see if we can replicate any zonefiles and profiles
-                # clear out any confirmed updates
-                log.debug("replicate all pending zonefiles and profiles in %s" % (self.queue_path))
-                servers = RegistrarWorker.get_atlas_server_list( self.config_path )
-                res = RegistrarWorker.replicate_profiles( self.queue_path, servers, wallet_data, self.required_storage_drivers, config_path=self.config_path, proxy=proxy )
-                if 'error' in res:
-                    log.warn("Zonefile/profile replication failed: %s" % res['error'])
+        while self.running:
 
-                    # try exponential backoff
-                    failed = True
-                    poll_interval = 1.0
+            failed = False
+            proxy = get_default_proxy( config_path=self.config_path )
+
+            try:
+                wallet_data = self.get_wallet_data( proxy )
+                if wallet_data is None:
+                    break
 
             except Exception, e:
                 log.exception(e)
-                failed = True
+                break
 
+            start = time.time()
             try:
-                # see if we can remove any other confirmed operations, besides preorders, registers, and updates
-                log.debug("clean out other confirmed operations")
-                res = RegistrarWorker.clear_confirmed( self.config_path, self.queue_path, proxy=proxy )
+                # only pooled proxies can be shared by the stage's workers
+                max_workers = get_proxy_concurrency( proxy, max_workers=REGISTRAR_STAGE_MAX_WORKERS )
+                res = stage_func( wallet_data, proxy, max_workers )
                 if 'error' in res:
-                    log.warn("Failed to clear out some operations: %s" % res['error'])
+                    log.warn("%s failed: %s" % (stage_name, res['error']))
 
                     # try exponential backoff
                     failed = True
@@ -719,7 +879,9 @@ class RegistrarWorker(threading.Thread):
                 log.exception(e)
                 failed = True
 
-            # if we failed a step, then try again quickly with exponential backoff
+            registrar_stage_stats.record_run( stage_name, time.time() - start, failed )
+
+            # if we failed, then try again quickly with exponential backoff
             if failed:
                 poll_interval = 2 * poll_interval + random.random() * poll_interval
 
@@ -728,7 +890,7 @@ class RegistrarWorker(threading.Thread):
                 poll_interval = self.poll_interval
            
             try:
-                log.debug("Sleep for %s" % poll_interval)
+                log.debug("%s: sleep for %s" % (stage_name, poll_interval))
                 for i in xrange(0, int(poll_interval)):
                     time.sleep(1)
 
@@ -741,12 +903,59 @@ class RegistrarWorker(threading.Thread):
                 log.debug("Sleep interrupted")
                 break
 
-            # remove expired 
-            log.debug("Cleaning all queues in %s" % self.queue_path)
-            queue_cleanall( path=self.queue_path, config_path=self.config_path )
 
-        log.info("Registrar worker exited")
-        self.cleanup_lockfile( self.lockfile_path )
+    def run_register_preorders(self, wallet_data, proxy, max_workers):
+        """
+        Stage:  see if we can complete any registrations,
+        and clear out any confirmed preorders
+        """
+        log.debug("register all pending preorders in %s" % (self.queue_path))
+        return RegistrarWorker.register_preorders( self.queue_path, wallet_data, config_path=self.config_path, proxy=proxy, max_workers=max_workers )
+
+
+    def run_init_profiles(self, wallet_data, proxy, max_workers):
+        """
+        Stage:  see if we can put any zonefiles,
+        and clear out any confirmed registers
+        """
+        log.debug("put zonefile hashes for registered names in %s" % (self.queue_path))
+        return RegistrarWorker.init_profiles( self.queue_path, config_path=self.config_path, proxy=proxy, max_workers=max_workers )
+
+
+    def run_replicate_profiles(self, wallet_data, proxy, max_workers):
+        """
+        Stage:  see if we can replicate any zonefiles and profiles,
+        and clear out any confirmed updates
+        """
+        log.debug("replicate all pending zonefiles and profiles in %s" % (self.queue_path))
+        servers = RegistrarWorker.get_atlas_server_list( self.config_path )
+        return RegistrarWorker.replicate_profiles( self.queue_path, servers, wallet_data, self.required_storage_drivers, config_path=self.config_path, proxy=proxy, max_workers=max_workers )
+
+
+    def run_clear_confirmed(self, wallet_data, proxy, max_workers):
+        """
+        Stage:  see if we can remove any other confirmed operations, besides preorders, registers, and updates
+        """
+        log.debug("clean out other confirmed operations")
+        return RegistrarWorker.clear_confirmed( self.config_path, self.queue_path, proxy=proxy )
+
+
+    def run_queue_cleanall(self, wallet_data, proxy, max_workers):
+        """
+        Stage:  remove expired entries from all queues
+        """
+        log.debug("Cleaning all queues in %s" % self.queue_path)
+        queue_cleanall( path=self.queue_path, config_path=self.config_path )
+
+        return {'status': True}
+
+
+    @classmethod
+    def get_stage_stats( cls ):
+        """
+        Get the throughput and latency of each stage
+        """
+        return registrar_stage_stats.get_stats()
 
 
 class RegistrarState(object):
@@ -797,6 +1006,13 @@ def ping():
     return data
 
 
+def stage_stats():
+    """
+    Return the throughput and latency of each stage of the registrar
+    """
+    return RegistrarWorker.get_stage_stats()
+
+
 def state():
     """
     Return status on current registrations
@@ -1316,6 +1532,7 @@ RPC_PREFIX = "backend"
 RPC_METHODS = [
     ping,
     state,
+    stage_stats,
     get_wallet,
     set_wallet,
     get_start_block,
@@ -1327,5 +1544,15 @@ RPC_METHODS = [
     revoke
 ]
 
+# read-only methods, which the RPC endpoint can run
+# alongside other requests (the rest run one at a time)
+RPC_PARALLEL_METHODS = [
+    ping,
+    state,
+    stage_stats,
+    get_wallet,
+    get_start_block
+]
+
 RPC_INIT = set_plugin_state 
 RPC_SHUTDOWN = plugin_shutdown
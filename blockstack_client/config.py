@@ -66,6 +66,8 @@ DEFAULT_BLOCKSTACKD_PORT = 6264     # blockstackd port
 DEFAULT_BLOCKSTACKD_SERVER = "node.blockstack.org"
 
 DEFAULT_API_PORT = 6270     # RPC endpoint port
+API_ENDPOINT_MAX_WORKERS = 8    # requests the RPC endpoint handles at once (1 = one at a time); see 'api_endpoint_max_workers'
+API_ENDPOINT_MAX_QUEUED = 64    # accepted requests that can wait for a worker before we stop accepting more
 
 # initialize to default settings
 BLOCKSTACKD_SERVER = DEFAULT_BLOCKSTACKD_SERVER
@@ -80,8 +82,48 @@ BLOCKSTACK_DEFAULT_STORAGE_DRIVERS = "disk,blockstack_resolver,blockstack_server
 # storage drivers that must successfully acknowledge each write
 BLOCKSTACK_REQUIRED_STORAGE_DRIVERS_WRITE = "disk,blockstack_server,dht"
 
+# storage driver reads
+STORAGE_PARALLEL_READS = False              # if True, ask all drivers at once, and take the first valid reply
+STORAGE_READ_MAX_WORKERS = 8                # threads shared by all parallel storage reads
+STORAGE_DRIVER_FAILURE_PENALTY = 30.0       # when ranking drivers, count a failed read as taking this long (in secs)
+STORAGE_LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]     # histogram bucket upper bounds (in secs)
+STORAGE_VERIFY_WORKERS = 2                  # threads verifying mutable data signatures as it arrives
+STORAGE_NEWEST_WINS_WAIT = 2.0              # in "newest version wins" mode, wait this long after the first valid reply (in secs)
+
+if os.environ.get("BLOCKSTACK_CLIENT_STORAGE_PARALLEL_READS", None) == "1":
+    STORAGE_PARALLEL_READS = True
+
 DEFAULT_TIMEOUT = 30  # in secs
 
+# persistent (keep-alive) connections to blockstackd
+RPC_POOL_MAX_CONNECTIONS = 8    # max idle connections kept per (host, port)
+RPC_POOL_MAX_IDLE = 30          # close connections that have been idle this long (in secs)
+RPC_MAX_CONCURRENCY = 8         # max in-flight RPCs to blockstackd for paged or batched queries
+
+# paged history queries (get_op_history_rows, get_nameops_affected_at)
+RPC_PAGE_SIZE_DEFAULT = 10              # first page size to ask for; known to be accepted by all servers
+RPC_PAGE_SIZE_MAX = 100                 # largest page to grow to; shrinks to what the server will return
+RPC_PAGE_MAX_BYTES = 1024 * 1024        # keep each page's reply under this many bytes
+RPC_PAGE_LIMIT_TTL = 3600               # forget a server's learned page limit after this many seconds
+
+# how a server says that it won't send that many rows at once
+RPC_PAGE_REJECTED_PATTERN = r'invalid count|count .*(too (large|big|high)|exceed)|too many (rows|items)|page too (large|big)'
+
+# consensus hash ranges (get_consensus_range)
+CONSENSUS_RANGE_CHUNK_SIZE = 32         # blocks to ask for in one get_consensus_hashes request
+
+# in-process cache of name and namespace records, valid until the next block
+BLOCKCHAIN_RECORD_CACHE_ENABLED = True
+BLOCKCHAIN_RECORD_CACHE_SIZE = 1024         # max records to keep
+BLOCKCHAIN_RECORD_CACHE_HEIGHT_CHECK = 5    # ask blockstackd for its block height at most this often (in secs)
+
+if os.environ.get("BLOCKSTACK_CLIENT_NO_RECORD_CACHE", None) == "1":
+    BLOCKCHAIN_RECORD_CACHE_ENABLED = False
+
+if os.environ.get("BLOCKSTACK_TEST", None) == "1":
+    # test environment: blocks come fast, so always re-check the height
+    BLOCKCHAIN_RECORD_CACHE_HEIGHT_CHECK = 0
+
 """ transaction fee configs
 """
 
@@ -288,6 +330,20 @@ MAX_RPC_LEN = 1024 * 1024 * 1024
 RPC_MAX_ZONEFILE_LEN = 4096     # 4KB
 RPC_MAX_PROFILE_LEN = 1024000   # 1MB
 
+# publishing zonefiles to atlas servers
+ZONEFILE_PUBLISH_QUORUM = 1             # succeed once this many servers have the zonefile (the rest finish in the background)
+ZONEFILE_PUBLISH_MAX_WORKERS = 8        # servers to push to at once
+ZONEFILE_PUBLISH_MAX_FAILURES = 3       # consecutive failures before we stop pushing to a server...
+ZONEFILE_PUBLISH_RETRY_INTERVAL = 600   # ...for this many seconds
+ZONEFILE_BATCH_MAX_COUNT = 5             # zonefiles per put_zonefiles call
+ZONEFILE_BATCH_MAX_LEN = ZONEFILE_BATCH_MAX_COUNT * RPC_MAX_ZONEFILE_LEN    # zonefile bytes per put_zonefiles call
+ZONEFILE_FETCH_BATCH_SIZE = 100         # zonefile hashes per get_zonefiles call
+
+# bulk profile resolver (profile.iter_name_profiles, `export_profiles`)
+PROFILE_RESOLVER_BATCH_SIZE = 100       # names per record/zonefile lookup
+PROFILE_RESOLVER_MAX_WORKERS = 8        # profiles fetched from storage at once
+PROFILE_EXPORT_REPORT_INTERVAL = 10     # seconds between progress reports
+
 CONFIG_FILENAME = "client.ini"
 WALLET_FILENAME = "wallet.json"
 
@@ -311,6 +367,48 @@ else:
 WALLET_PATH = os.path.join(CONFIG_DIR, "wallet.json")
 SPV_HEADERS_PATH = os.path.join(CONFIG_DIR, "blockchain-headers.dat")
 DEFAULT_QUEUE_PATH = os.path.join(CONFIG_DIR, "queues.db")
+QUEUE_DB_BUSY_TIMEOUT = 30          # seconds to wait on a locked queue database before giving up on a query
+QUEUE_DB_CACHED_STATEMENTS = 64     # prepared statements to keep per queue database connection
+
+# name/namespace history rows, shared across get_nameops_at() calls
+HISTORY_CACHE_MAX_ROWS = 50000      # max history rows to keep in RAM
+HISTORY_CACHE_PATH = os.path.join(CONFIG_DIR, "history_cache.db")
+HISTORY_CACHE_SPILL = False         # if True, write evicted histories to HISTORY_CACHE_PATH
+HISTORY_REPLAY_CACHE_SIZE = 1024    # max history replays (NameHistoryReplay) to keep in RAM
+
+if os.environ.get("BLOCKSTACK_CLIENT_HISTORY_CACHE_SPILL", None) == "1":
+    HISTORY_CACHE_SPILL = True
+
+# zonefiles and immutable data, cached on disk by hash
+IMMUTABLE_CACHE_ENABLED = True
+IMMUTABLE_CACHE_DIR = os.path.join(CONFIG_DIR, "immutable_cache")
+IMMUTABLE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+if os.environ.get("BLOCKSTACK_CLIENT_NO_IMMUTABLE_CACHE", None) == "1":
+    IMMUTABLE_CACHE_ENABLED = False
+
+# SNV: consensus hashes and ops hashes already verified from each trust root
+SNV_TRUST_STORE_ENABLED = True
+SNV_TRUST_STORE_PATH = os.path.join(CONFIG_DIR, "snv_trusted.db")
+
+if os.environ.get("BLOCKSTACK_CLIENT_NO_SNV_TRUST_STORE", None) == "1":
+    SNV_TRUST_STORE_ENABLED = False
+
+# consensus hashes reported by blockstackd, cached on disk by block
+CONSENSUS_HASH_CACHE_ENABLED = True
+CONSENSUS_HASH_CACHE_PATH = os.path.join(CONFIG_DIR, "consensus_hashes.db")
+
+if os.environ.get("BLOCKSTACK_CLIENT_NO_CONSENSUS_HASH_CACHE", None) == "1":
+    CONSENSUS_HASH_CACHE_ENABLED = False
+
+# SNV: txids and Merkle roots of blocks already checked against the SPV headers
+SPV_BLOCK_CACHE_ENABLED = True
+SPV_BLOCK_CACHE_PATH = os.path.join(CONFIG_DIR, "spv_blocks.db")
+SPV_BLOCK_CACHE_MAX_BLOCKS = 1024
+SPV_HEADER_SYNC_INTERVAL = 60   # seconds between background SPV header syncs
+
+if os.environ.get("BLOCKSTACK_CLIENT_NO_SPV_BLOCK_CACHE", None) == "1":
+    SPV_BLOCK_CACHE_ENABLED = False
 
 APP_WALLET_DIRNAME = "app_wallets"
 
@@ -320,6 +418,14 @@ USER_ZONEFILE_TTL = 3600    # cache lifetime for a user's zonefile
 
 SLEEP_INTERVAL = 20  # in seconds
 TX_EXPIRED_INTERVAL = 10  # if a tx is not picked up by x blocks
+BITCOIND_CLIENT_IDLE_TIMEOUT = 60  # reconnect to bitcoind if the connection has been idle this long (in seconds)
+BLOCK_HEIGHT_CACHE_TTL = 10  # seconds to reuse bitcoind's block height for
+
+if os.environ.get("BLOCKSTACK_TEST", None) == "1":
+    # blocks get mined quickly in the test framework
+    BLOCK_HEIGHT_CACHE_TTL = 0
+    SPV_HEADER_SYNC_INTERVAL = 1
+
 PREORDER_CONFIRMATIONS = 6
 PREORDER_MAX_CONFIRMATIONS = 130  # no. of blocks after which preorder should be removed
 TX_CONFIRMATIONS_NEEDED = 10
@@ -327,6 +433,7 @@ MAX_TX_CONFIRMATIONS = 130
 QUEUE_LENGTH_TO_MONITOR = 50
 MINIMUM_BALANCE = 0.002
 DEFAULT_POLL_INTERVAL = 300
+REGISTRAR_STAGE_MAX_WORKERS = 4  # names each registrar stage works on at once
 
 # approximate transaction sizes, for when the user has no balance.
 # over-estimations, to avoid stalled registrations.
@@ -0,0 +1,168 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sqlite3
+import threading
+
+from config import get_logger, CONSENSUS_HASH_CACHE_ENABLED, CONSENSUS_HASH_CACHE_PATH
+
+log = get_logger()
+
+CONSENSUS_HASH_CACHE_SQL = [
+"""
+CREATE TABLE IF NOT EXISTS server_consensus_hashes( server TEXT NOT NULL,
+                                                    port INTEGER NOT NULL,
+                                                    block_id INTEGER NOT NULL,
+                                                    consensus_hash TEXT NOT NULL,
+                                                    PRIMARY KEY(server, port, block_id) );
+"""
+]
+
+
+class ConsensusHashCache(object):
+    """
+    Persistent cache of the consensus hashes each blockstackd server
+    reported for each block, so ranges of them only have to be fetched
+    from that server once.
+
+    blockstackd only processes a block once it is confirmed, so the
+    consensus hash it reports for a block does not change.  These
+    hashes are not verified, and are kept per (server, port) so that
+    one server's answers are never passed off as another's.  SNV does
+    not read them from here.
+    """
+    def __init__(self, path=CONSENSUS_HASH_CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.initialized = False
+
+
+    def open(self):
+        """
+        Open a connection to the cache, creating it if need be
+        """
+        if not self.initialized:
+            dirpath = os.path.dirname(self.path)
+            if not os.path.exists(dirpath):
+                os.makedirs(dirpath, 0700)
+
+        con = sqlite3.connect( self.path, isolation_level=None, timeout=10 )
+
+        if not self.initialized:
+            for sql in CONSENSUS_HASH_CACHE_SQL:
+                con.execute( sql )
+
+            self.initialized = True
+
+        return con
+
+
+    def get_range(self, server, port, block_id_start, block_id_end):
+        """
+        Get the consensus hashes in [block_id_start, block_id_end] that server:port reported.
+        Return {block_id: consensus hash} (only for the blocks we have)
+        """
+        try:
+            con = self.open()
+            rows = con.execute( "SELECT block_id, consensus_hash FROM server_consensus_hashes WHERE server = ? AND port = ? AND block_id >= ? AND block_id <= ?;", \
+                                (str(server), int(port), block_id_start, block_id_end) ).fetchall()
+            con.close()
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to query consensus hash cache")
+            return {}
+
+        ret = dict( (row[0], str(row[1])) for row in rows )
+
+        with self.lock:
+            self.hits += len(ret)
+            self.misses += max(0, block_id_end - block_id_start + 1 - len(ret))
+
+        return ret
+
+
+    def put_many(self, server, port, consensus_hashes):
+        """
+        Remember consensus hashes ({block_id: consensus hash}) that server:port reported.
+        Return True on success
+        Return False on error
+        """
+        rows = [(str(server), int(port), block_id, str(ch)) for (block_id, ch) in consensus_hashes.items() if ch is not None]
+
+        try:
+            con = self.open()
+            con.execute( "BEGIN;" )
+            con.executemany( "INSERT OR REPLACE INTO server_consensus_hashes (server, port, block_id, consensus_hash) VALUES (?,?,?,?);", rows )
+            con.execute( "COMMIT;" )
+            con.close()
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to write to consensus hash cache")
+            return False
+
+        with self.lock:
+            self.writes += len(rows)
+
+        return True
+
+
+    def get_stats(self):
+        """
+        Get cache statistics
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (float(self.hits) / lookups) if lookups > 0 else 0.0,
+                'writes': self.writes,
+                'path': self.path,
+            }
+
+
+consensus_hash_cache = None
+if CONSENSUS_HASH_CACHE_ENABLED:
+    consensus_hash_cache = ConsensusHashCache()
+
+
+def get_consensus_hash_cache():
+    """
+    Get the consensus hash cache, if it is enabled.
+    Return None if not.
+    """
+    return consensus_hash_cache
+
+
+def get_consensus_hash_cache_stats():
+    """
+    Get hit-rate statistics for the consensus hash cache
+    """
+    if consensus_hash_cache is None:
+        return {}
+
+    return consensus_hash_cache.get_stats()
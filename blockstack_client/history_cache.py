@@ -0,0 +1,310 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import collections
+
+from config import get_logger, HISTORY_CACHE_MAX_ROWS, HISTORY_CACHE_SPILL, HISTORY_CACHE_PATH, HISTORY_REPLAY_CACHE_SIZE
+
+log = get_logger()
+
+HISTORY_CACHE_SQL = [
+"""
+CREATE TABLE IF NOT EXISTS server_history( server TEXT NOT NULL,
+                                           port INTEGER NOT NULL,
+                                           name TEXT NOT NULL,
+                                           num_rows INTEGER NOT NULL,
+                                           rows TEXT NOT NULL,
+                                           PRIMARY KEY(server, port, name) );
+"""
+]
+
+
+class OpHistoryCache(object):
+    """
+    Process-wide cache of the history rows of names and namespaces,
+    as reported by each blockstackd server (keyed by (server, port, name),
+    so one server's rows are never handed out for another's).
+
+    A name's history only ever grows, so its cached rows are valid
+    for as long as the server reports the same number of rows.  If
+    the history has grown, the caller only needs to fetch the rows
+    after the ones we have.
+
+    The cache holds at most max_rows rows in RAM.  Least-recently-used
+    histories are dropped when it is full, or written to a SQLite
+    database at spill_path if one is given (so they can be read back
+    later instead of being fetched again).
+    """
+    def __init__(self, max_rows=HISTORY_CACHE_MAX_ROWS, spill_path=None):
+        self.max_rows = max_rows
+        self.spill_path = spill_path
+        self.lock = threading.Lock()
+        self.histories = collections.OrderedDict()     # (server, port, name) => list of history rows
+        self.num_rows = 0
+        self.hits = 0
+        self.misses = 0
+
+        if spill_path is not None:
+            self.spill_setup()
+
+
+    def spill_open(self):
+        """
+        Open a connection to the spill database
+        """
+        con = sqlite3.connect( self.spill_path, isolation_level=None, timeout=10 )
+        return con
+
+
+    def spill_setup(self):
+        """
+        Create the spill database, if need be
+        """
+        try:
+            con = self.spill_open()
+            for sql in HISTORY_CACHE_SQL:
+                con.execute( sql )
+
+            con.close()
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to set up history spill database %s; not spilling" % self.spill_path)
+            self.spill_path = None
+
+
+    def spill_put(self, key, rows):
+        """
+        Write a history to the spill database
+        """
+        server, port, name = key
+        try:
+            con = self.spill_open()
+            con.execute( "INSERT OR REPLACE INTO server_history (server, port, name, num_rows, rows) VALUES (?,?,?,?,?);", \
+                         (str(server), int(port), name, len(rows), json.dumps(rows)) )
+            con.close()
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to spill history for %s (from %s:%s)" % (name, server, port))
+
+
+    def spill_get(self, key):
+        """
+        Read a history back from the spill database.
+        Return the list of rows on success
+        Return None if not present
+        """
+        server, port, name = key
+        try:
+            con = self.spill_open()
+            res = con.execute( "SELECT rows FROM server_history WHERE server = ? AND port = ? AND name = ?;", (str(server), int(port), name) ).fetchone()
+            con.close()
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to read spilled history for %s (from %s:%s)" % (name, server, port))
+            return None
+
+        if res is None:
+            return None
+
+        return json.loads(res[0])
+
+
+    def insert(self, key, rows):
+        """
+        Put a history into RAM, evicting (and maybe spilling) others to make room.
+        Must be called with the lock held.
+        Return the list of (key, rows) evicted.
+        """
+        if self.histories.has_key(key):
+            self.num_rows -= len(self.histories.pop(key))
+
+        self.histories[key] = rows
+        self.num_rows += len(rows)
+
+        evicted = []
+        while self.num_rows > self.max_rows and len(self.histories) > 1:
+            evicted_key, evicted_rows = self.histories.popitem(last=False)
+            self.num_rows -= len(evicted_rows)
+            evicted.append( (evicted_key, evicted_rows) )
+
+        return evicted
+
+
+    def get(self, server, port, name):
+        """
+        Get the history rows server:port reported for a name.
+        Return the list of rows (do not modify it) on success
+        Return None if not cached
+        """
+        key = (server, port, name)
+        with self.lock:
+            if self.histories.has_key(key):
+                # mark most-recently used
+                rows = self.histories.pop(key)
+                self.histories[key] = rows
+                self.hits += 1
+                return rows
+
+        rows = None
+        if self.spill_path is not None:
+            rows = self.spill_get(key)
+
+        with self.lock:
+            if rows is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            evicted = self.insert(key, rows)
+
+        for (evicted_key, evicted_rows) in evicted:
+            self.spill_put(evicted_key, evicted_rows)
+
+        return rows
+
+
+    def put(self, server, port, name, rows):
+        """
+        Cache the history rows server:port reported for a name.
+        """
+        rows = list(rows)
+        with self.lock:
+            evicted = self.insert((server, port, name), rows)
+
+        if self.spill_path is not None:
+            for (evicted_key, evicted_rows) in evicted:
+                self.spill_put(evicted_key, evicted_rows)
+
+
+    def clear(self):
+        """
+        Drop all histories from RAM (spilled histories are kept)
+        """
+        with self.lock:
+            self.histories.clear()
+            self.num_rows = 0
+
+
+    def get_stats(self):
+        """
+        Get cache statistics
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'names': len(self.histories),
+                'rows': self.num_rows,
+                'spill_path': self.spill_path,
+            }
+
+
+class OpHistoryReplayCache(object):
+    """
+    Process-wide cache of history replays (operations.NameHistoryReplay),
+    so that restoring a name at many blocks (i.e. SNV over a range of
+    blocks) only replays each of its history blocks once.
+
+    A replay is only good for the history it was built from, so replays
+    are keyed by (server, port, name, number of history rows).  At most
+    max_size replays are kept; least-recently-used ones are dropped.
+    """
+    def __init__(self, max_size=HISTORY_REPLAY_CACHE_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.replays = collections.OrderedDict()    # (server, port, name, num_rows) => replay
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, server, port, name, num_rows):
+        """
+        Get the replay of a name's history of num_rows rows from server:port.
+        Return None if not cached
+        """
+        key = (server, port, name, num_rows)
+        with self.lock:
+            if not self.replays.has_key(key):
+                self.misses += 1
+                return None
+
+            # mark most-recently used
+            replay = self.replays.pop(key)
+            self.replays[key] = replay
+            self.hits += 1
+            return replay
+
+
+    def put(self, server, port, name, num_rows, replay):
+        """
+        Cache the replay of a name's history of num_rows rows from server:port.
+        """
+        with self.lock:
+            self.replays.pop((server, port, name, num_rows), None)
+            self.replays[(server, port, name, num_rows)] = replay
+            while len(self.replays) > self.max_size:
+                self.replays.popitem(last=False)
+
+
+    def get_stats(self):
+        """
+        Get cache statistics
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'replays': len(self.replays),
+            }
+
+
+op_history_cache = OpHistoryCache( spill_path=(HISTORY_CACHE_PATH if HISTORY_CACHE_SPILL else None) )
+op_history_replay_cache = OpHistoryReplayCache()
+
+
+def set_history_cache_spill( spill_path ):
+    """
+    Spill evicted histories to the SQLite database at spill_path
+    (or stop spilling, if spill_path is None).
+    """
+    op_history_cache.spill_path = spill_path
+    if spill_path is not None:
+        op_history_cache.spill_setup()
+
+
+def get_history_cache_stats():
+    """
+    Get hit/miss statistics for the history cache
+    """
+    return op_history_cache.get_stats()
+
+
+def get_history_replay_cache_stats():
+    """
+    Get hit/miss statistics for the history replay cache
+    """
+    return op_history_replay_cache.get_stats()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import uuid
+import threading
+
+from config import get_logger, IMMUTABLE_CACHE_DIR, IMMUTABLE_CACHE_MAX_BYTES, IMMUTABLE_CACHE_ENABLED
+
+log = get_logger()
+
+
+class ImmutableDataCache(object):
+    """
+    On-disk cache of zonefiles and immutable data, addressed by their hashes.
+
+    Since the data is named by its hash, it never goes stale.  Even so,
+    we re-check the hash whenever we read something back, and drop it if
+    it does not match (i.e. the file got corrupted).
+
+    Each item is stored in its own file, written atomically (to a temporary
+    file that is then renamed).  The cache holds at most max_bytes bytes;
+    when it gets full, the least-recently-used items (by mtime, which we
+    bump on each hit) are deleted.
+    """
+    def __init__(self, cache_dir=IMMUTABLE_CACHE_DIR, max_bytes=IMMUTABLE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.num_bytes = None       # unknown until we scan the cache directory
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.corrupt = 0
+
+
+    def get_path(self, data_hash):
+        """
+        Get the path to a cached item.
+        Return None if the hash is not a hex string (so we don't get tricked into reading other files)
+        """
+        data_hash = str(data_hash)
+        if re.match('^[0-9a-fA-F]{16,128}$', data_hash) is None:
+            return None
+
+        data_hash = data_hash.lower()
+        return os.path.join(self.cache_dir, data_hash[0:2], data_hash)
+
+
+    def scan(self):
+        """
+        Find out how many bytes are in the cache, if we don't know yet.
+        Must be called with the lock held.
+        """
+        if self.num_bytes is not None:
+            return
+
+        num_bytes = 0
+        if os.path.exists(self.cache_dir):
+            for (dirpath, dirnames, filenames) in os.walk(self.cache_dir):
+                for filename in filenames:
+                    try:
+                        num_bytes += os.stat(os.path.join(dirpath, filename)).st_size
+                    except OSError:
+                        pass
+
+        self.num_bytes = num_bytes
+
+
+    def evict(self):
+        """
+        Delete least-recently-used items until the cache is at most 90% full.
+        Must be called with the lock held.
+        """
+        if self.num_bytes <= self.max_bytes:
+            return
+
+        entries = []
+        for (dirpath, dirnames, filenames) in os.walk(self.cache_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    sb = os.stat(path)
+                    entries.append( (sb.st_mtime, sb.st_size, path) )
+                except OSError:
+                    pass
+
+        entries.sort()
+        target = int(self.max_bytes * 0.9)
+        for (mtime, size, path) in entries:
+            if self.num_bytes <= target:
+                break
+
+            try:
+                os.unlink(path)
+                self.num_bytes -= size
+                self.evictions += 1
+            except OSError, oe:
+                log.debug("Failed to evict %s: %s" % (path, oe))
+
+
+    def get(self, data_hash, hash_func):
+        """
+        Get an item from the cache, and verify that hash_func(data) == data_hash.
+        Return the data on success
+        Return None if not cached (or if the cached copy is bad)
+        """
+        path = self.get_path(data_hash)
+        if path is None:
+            return None
+
+        data = None
+        try:
+            with open(path, "r") as f:
+                data = f.read()
+
+        except IOError:
+            with self.lock:
+                self.misses += 1
+
+            return None
+
+        if hash_func(data) != data_hash:
+            log.warning("Cached data for %s is corrupt; removing it" % data_hash)
+            with self.lock:
+                self.corrupt += 1
+                self.misses += 1
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+                # recount, since we don't know how big it was supposed to be
+                self.num_bytes = None
+
+            return None
+
+        try:
+            # mark most-recently used
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        with self.lock:
+            self.hits += 1
+
+        return data
+
+
+    def put(self, data_hash, data, hash_func):
+        """
+        Put an item into the cache, if hash_func(data) == data_hash.
+        Return True if stored
+        Return False if not
+        """
+        path = self.get_path(data_hash)
+        if path is None:
+            return False
+
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+
+        if hash_func(data) != data_hash:
+            log.error("Not caching %s: data does not match hash" % data_hash)
+            return False
+
+        if len(data) > self.max_bytes:
+            return False
+
+        if os.path.exists(path):
+            return True
+
+        with self.lock:
+            # count what's there before we add to it
+            self.scan()
+
+        tmp_path = "%s.tmp.%s" % (path, uuid.uuid4().hex)
+        try:
+            dirpath = os.path.dirname(path)
+            if not os.path.exists(dirpath):
+                try:
+                    os.makedirs(dirpath, 0700)
+                except OSError:
+                    # someone else made it
+                    if not os.path.exists(dirpath):
+                        raise
+
+            with open(tmp_path, "w") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.rename(tmp_path, path)
+
+        except (OSError, IOError), e:
+            log.exception(e)
+            log.error("Failed to cache %s" % data_hash)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+            return False
+
+        with self.lock:
+            self.num_bytes += len(data)
+            self.writes += 1
+            self.evict()
+
+        return True
+
+
+    def get_stats(self):
+        """
+        Get cache statistics
+        """
+        with self.lock:
+            self.scan()
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (float(self.hits) / lookups) if lookups > 0 else 0.0,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'corrupt': self.corrupt,
+                'bytes': self.num_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+immutable_data_cache = ImmutableDataCache()
+
+
+def immutable_cache_get( data_hash, hash_func ):
+    """
+    Get verified data from the cache, if it is enabled.
+    Return the data on success
+    Return None if not found
+    """
+    if not IMMUTABLE_CACHE_ENABLED:
+        return None
+
+    return immutable_data_cache.get( data_hash, hash_func )
+
+
+def immutable_cache_put( data_hash, data, hash_func ):
+    """
+    Store data in the cache, if it is enabled and matches its hash.
+    Return True if stored
+    """
+    if not IMMUTABLE_CACHE_ENABLED:
+        return False
+
+    return immutable_data_cache.put( data_hash, data, hash_func )
+
+
+def get_immutable_cache_stats():
+    """
+    Get hit-rate statistics for the immutable data cache
+    """
+    return immutable_data_cache.get_stats()
@@ -32,9 +32,11 @@ def parse_methods( method_list ):
     Given a list of methods, parse their docstring metadata for linking information.
     The __doc__ string for each method must be properly formatted:
 
-    command: <command name> [norpc]
+    command: <command name> [norpc] [parallel]
         This is the name of the CLI command
         If norpc is present, the command cannot be accessed by RPC.
+        If parallel is present, the command is read-only, and the RPC endpoint
+        may run it alongside other requests (otherwise, it runs one at a time).
 
     help: <help string>
         This is the help string for the command 
@@ -84,7 +86,7 @@ def parse_methods( method_list ):
         try:
             command_parts = re.findall( "^command:[ \t]+([^ \t]+)[ ]*(.*)[ ]*$", command_line )[0]
             command = command_parts[0]
-            command_pragmas = command_parts[1].split(" \t")
+            command_pragmas = command_parts[1].split()
 
             command_help = re.findall( "^help:[ \t]+(.+)$", help_line )[0]
 
@@ -23,6 +23,8 @@
 
 from ..config import *
 import copy
+import bisect
+import threading
 
 import preorder
 import register
@@ -159,6 +161,129 @@ def nameop_history_extract( history_rows ):
     return history
 
 
+class NameHistoryReplay(object):
+    """
+    Replays a name or namespace record's history diffs "back in time",
+    so we can ask what the record looked like at many different blocks.
+
+    The history's block IDs are sorted once, and the state before each
+    block is computed at most once (walking back from the current record)
+    and remembered, so successive queries cost only the blocks that have
+    not been replayed yet.  States are copied-on-write:  each replayed
+    block produces a new (shallow) dict, and nothing given to us is
+    modified.
+
+    The states returned by restore() are deep copies, so callers may
+    change them (including nested fields) without affecting the
+    remembered states.  They do not have a 'history' key.
+
+    A replay can be shared between threads (e.g. kept in a cache).
+    """
+    def __init__(self, name_rec, name_history):
+        self.name_rec = name_rec
+        self.name_history = name_history
+        self.block_ids = sorted(name_history.keys())
+
+        current_rec = copy.deepcopy( dict( (k, v) for (k, v) in name_rec.items() if k != 'history' ) )
+
+        # self.states[k] is the record before the last k history blocks
+        self.states = [current_rec]
+        self.lock = threading.Lock()
+
+
+    @classmethod
+    def diff_apply( cls, state, diff, fresh, keep_snapshot_block_number=True ):
+        """
+        Apply a single history diff to a state.
+        If fresh is False, then state is shared and must be copied before it is changed.
+        Return the new state, which is never shared.
+        """
+        if diff.has_key('history_snapshot'):
+            # wholly new state
+            state = copy.deepcopy( dict( (k, v) for (k, v) in diff.items() if k != 'history_snapshot' ) )
+            if not keep_snapshot_block_number and state.has_key('block_number'):
+                del state['block_number']
+
+            return state
+
+        if not fresh:
+            state = dict(state)
+
+        # delta in current state
+        # no matter what, 'block_number' cannot be altered (unless it's a history snapshot)
+        for (k, v) in diff.items():
+            if k != 'block_number':
+                state[k] = v
+
+        return state
+
+
+    def state_before_last_blocks( self, num_blocks ):
+        """
+        Get the state of the record before the last num_blocks history
+        blocks were processed, replaying any blocks we have not seen yet.
+        The returned state is shared; do not modify it.
+        """
+        with self.lock:
+            while len(self.states) <= num_blocks:
+                block_id = self.block_ids[ len(self.block_ids) - len(self.states) ]
+                state = self.states[-1]
+                fresh = False
+
+                for diff in reversed( self.name_history[block_id] ):
+                    state = self.diff_apply( state, diff, fresh )
+                    fresh = True
+
+                self.states.append( state )
+
+            return self.states[num_blocks]
+
+
+    def restore( self, block_id ):
+        """
+        Get the sequence of states the record went through at block_id,
+        starting from the beginning of the block.
+        Same semantics as nameop_restore_from_history().
+        """
+        if len(self.block_ids) == 0:
+            # there is no history here...
+            historical_rec = copy.deepcopy(self.states[0])
+            try:
+                assert nameop_is_history_snapshot( historical_rec ), "No history for incomplete name"
+                return [historical_rec]
+            except Exception, e:
+                log.exception(e)
+                log.debug("\n%s" % (json.dumps(historical_rec, indent=4, sort_keys=True)))
+                log.error("FATAL: tried to restore history for incomplete record")
+                os.abort()
+
+        if block_id > self.block_ids[-1]:
+            # current record is valid
+            return [copy.deepcopy(self.states[0])]
+
+        if block_id < self.name_rec['block_number']:
+            # doesn't yet exist
+            return None
+
+        # replay every block after block_id
+        num_prior = bisect.bisect_right( self.block_ids, block_id )
+        historical_rec = self.state_before_last_blocks( len(self.block_ids) - num_prior )
+        updates = [ copy.deepcopy(historical_rec) ]
+
+        # if this isn't the earliest history element, and the next-earliest
+        # one (at last block) has multiple entries, then generate the sequence
+        # of updates for all but the first one.  This is because all but the
+        # first one were generated in the same block (i.e. the block requested).
+        if num_prior > 0:
+            diff_list = list( reversed( self.name_history[ self.block_ids[num_prior - 1] ] ) )
+            for diff in diff_list[:-1]:
+                # no matter what, 'block_number' cannot be altered
+                historical_rec = self.diff_apply( historical_rec, diff, False, keep_snapshot_block_number=False )
+                updates.append( copy.deepcopy(historical_rec) )
+
+        return list( reversed( updates ) )
+
+
 def nameop_restore_from_history( name_rec, name_history, block_id ):
     """
     Given a name or a namespace record (`name_rec`), replay its
@@ -172,100 +297,11 @@ def nameop_restore_from_history( name_rec, name_history, block_id ):
     Return None if the record does not exist at that point in time
 
     The returned records will *not* have a 'history' key.
-    """
-
-    block_history = list( reversed( sorted( name_history.keys() ) ) )
-
-    historical_rec = copy.deepcopy( name_rec )
-    if 'history' in historical_rec:
-        del historical_rec['history']
-
-    if len(block_history) == 0:
-        # there is no history here...
-        try:
-            assert nameop_is_history_snapshot( historical_rec ), "No history for incomplete name"
-            return [historical_rec]
-        except Exception, e:
-            log.exception(e)
-            log.debug("\n%s" % (json.dumps(historical_rec, indent=4, sort_keys=True)))
-            log.error("FATAL: tried to restore history for incomplete record")
-            os.abort()
-
-    if block_id > block_history[0]:
-        # current record is valid
-        return [historical_rec]
-
-    if block_id < name_rec['block_number']:
-        # doesn't yet exist
-        return None
-
-    # find the latest block prior to block_number
-    last_block = len(block_history)
-    for i in xrange( 0, len(block_history) ):
-        if block_id >= block_history[i]:
-            last_block = i
-            break
-
-    i = 0
-    while i < last_block:
-
-        try:
-            diff_list = list( reversed( name_history[ block_history[i] ] ) )
-        except:
-            print json.dumps( name_history[block_history[i]], indent=4, sort_keys=True )
-            raise
-
-        for di in xrange(0, len(diff_list)):
-            diff = diff_list[di]
-
-            if diff.has_key('history_snapshot'):
-                # wholly new state
-                historical_rec = copy.deepcopy( diff )
-                del historical_rec['history_snapshot']
-
-            else:
-                # delta in current state
-                # no matter what, 'block_number' cannot be altered (unless it's a history snapshot)
-                if diff.has_key('block_number'):
-                    del diff['block_number']
-
-                historical_rec.update( diff )
-
-        i += 1
-
-    # if this isn't the earliest history element, and the next-earliest
-    # one (at last block) has multiple entries, then generate the sequence
-    # of updates for all but the first one.  This is because all but the
-    # first one were generated in the same block (i.e. the block requested).
-    updates = [ copy.deepcopy( historical_rec ) ]
-
-    if i < len(block_history):
-
-        try:
-            diff_list = list( reversed( name_history[ block_history[i] ] ) )
-        except:
-            print json.dumps( name_history[block_history[i]] )
-            raise
-
-        if len(diff_list) > 1:
-            for diff in diff_list[:-1]:
-
-                # no matter what, 'block_number' cannot be altered
-                if diff.has_key('block_number'):
-                    del diff['block_number']
 
-                if diff.has_key('history_snapshot'):
-                    # wholly new state
-                    historical_rec = copy.deepcopy( diff )
-                    del historical_rec['history_snapshot']
-
-                else:
-                    # delta in current state
-                    historical_rec.update( diff )
-
-                updates.append( copy.deepcopy(historical_rec) )
-
-    return list( reversed( updates ) )
+    To restore the same record at several blocks, use a
+    NameHistoryReplay instead; it only replays each block once.
+    """
+    return NameHistoryReplay( name_rec, name_history ).restore( block_id )
 
 
 def nameop_snv_consensus_extra_quirks( extras, namerec, block_id ):
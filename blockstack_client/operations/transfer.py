@@ -183,15 +183,17 @@ def find_last_transfer_consensus_hash( name_rec, block_id, vtxindex ):
     Return None if not found.
     """
 
-    from ..proxy import nameop_restore_from_history
+    from . import NameHistoryReplay
 
     history_keys = name_rec['history'].keys()
     history_keys.sort()
     history_keys.reverse()
 
+    # replays each history block once, no matter how many keys we visit
+    replay = NameHistoryReplay( name_rec, name_rec['history'] )
+
     for hk in history_keys:
-        name_history = name_rec['history']
-        history_states = nameop_restore_from_history( name_rec, name_history, hk )
+        history_states = replay.restore( hk )
 
         for history_state in reversed(history_states):
             if history_state['block_number'] > block_id or (history_state['block_number'] == block_id and history_state['vtxindex'] > vtxindex):
@@ -34,6 +34,8 @@ import pprint
 import random
 import time
 import copy
+import threading
+import Queue
 import blockstack_profiles
 import blockstack_zones 
 import urllib
@@ -47,6 +49,7 @@ from blockstack_client import storage
 from blockstack_client import user as user_db
 
 from storage import hash_zonefile
+from immutable_cache import immutable_cache_get, immutable_cache_put
 import pybitcoin
 import bitcoin
 import binascii
@@ -56,7 +59,11 @@ from config import get_logger, DEBUG, MAX_RPC_LEN, find_missing, BLOCKSTACKD_SER
     BLOCKSTACKD_PORT, BLOCKSTACK_METADATA_DIR, BLOCKSTACK_DEFAULT_STORAGE_DRIVERS, \
     FIRST_BLOCK_MAINNET, NAME_OPCODES, OPFIELDS, CONFIG_DIR, SPV_HEADERS_PATH, BLOCKCHAIN_ID_MAGIC, \
     NAME_PREORDER, NAME_REGISTRATION, NAME_UPDATE, NAME_TRANSFER, NAMESPACE_PREORDER, NAME_IMPORT, \
-    USER_ZONEFILE_TTL, CONFIG_PATH, get_config
+    USER_ZONEFILE_TTL, CONFIG_PATH, get_config, ZONEFILE_PUBLISH_QUORUM, ZONEFILE_PUBLISH_MAX_WORKERS, \
+    ZONEFILE_PUBLISH_MAX_FAILURES, ZONEFILE_PUBLISH_RETRY_INTERVAL, ZONEFILE_BATCH_MAX_COUNT, ZONEFILE_BATCH_MAX_LEN, \
+    ZONEFILE_FETCH_BATCH_SIZE, RPC_MAX_CONCURRENCY, PROFILE_RESOLVER_BATCH_SIZE, PROFILE_RESOLVER_MAX_WORKERS
+
+from utils import parallel_imap
 
 log = get_logger()
 
@@ -141,19 +148,27 @@ def load_name_zonefile(name, expected_zonefile_hash, storage_drivers=None, raw_z
     zonefile_txt = None
     expected_zonefile_hash = str(expected_zonefile_hash)
 
-    # try atlas node first 
-    res = get_zonefiles( hostport, [expected_zonefile_hash], proxy=proxy )
-    if 'error' in res or expected_zonefile_hash not in res['zonefiles']:
-        # fall back to storage drivers if atlas node didn't have it
-        zonefile_txt = storage.get_immutable_data(expected_zonefile_hash, hash_func=storage.get_zonefile_data_hash, fqu=name, zonefile=True, deserialize=False, drivers=storage_drivers)
-        if zonefile_txt is None:
-            log.error("Failed to load user zonefile '%s'" % expected_zonefile_hash)
-            return None
+    # zonefiles never change, so try our local copy first
+    zonefile_txt = immutable_cache_get( expected_zonefile_hash, storage.get_zonefile_data_hash )
+    if zonefile_txt is not None:
+        log.debug('Loaded {} from cache'.format(expected_zonefile_hash))
 
     else:
-        # extract 
-        log.debug('Fetched {} from Atlas peer {}'.format(expected_zonefile_hash, hostport))
-        zonefile_txt = res['zonefiles'][expected_zonefile_hash]
+        # try atlas node next
+        res = get_zonefiles( hostport, [expected_zonefile_hash], proxy=proxy )
+        if 'error' in res or expected_zonefile_hash not in res['zonefiles']:
+            # fall back to storage drivers if atlas node didn't have it
+            # (this caches the zonefile for us)
+            zonefile_txt = storage.get_immutable_data(expected_zonefile_hash, hash_func=storage.get_zonefile_data_hash, fqu=name, zonefile=True, deserialize=False, drivers=storage_drivers)
+            if zonefile_txt is None:
+                log.error("Failed to load user zonefile '%s'" % expected_zonefile_hash)
+                return None
+
+        else:
+            # extract 
+            log.debug('Fetched {} from Atlas peer {}'.format(expected_zonefile_hash, hostport))
+            zonefile_txt = res['zonefiles'][expected_zonefile_hash]
+            immutable_cache_put( expected_zonefile_hash, zonefile_txt, storage.get_zonefile_data_hash )
 
     if raw_zonefile:
         try:
@@ -170,6 +185,119 @@ def load_name_zonefile(name, expected_zonefile_hash, storage_drivers=None, raw_z
     return decode_name_zonefile( zonefile_txt )
 
 
+def load_name_zonefiles( names_or_hashes, storage_drivers=None, raw_zonefile=False, proxy=None, batch_size=ZONEFILE_FETCH_BATCH_SIZE, max_workers=RPC_MAX_CONCURRENCY ):
+    """
+    Fetch and load many zonefiles at once.
+    @names_or_hashes is a list of names and/or zonefile hashes.
+    Names are resolved to their zonefile hashes through the blockchain.
+
+    Zonefiles are taken from the local cache if possible.  The rest are
+    requested from our atlas node batch_size hashes at a time (each one is
+    verified against its hash), and only the ones it doesn't have are
+    looked up in the storage drivers, one hash at a time.
+
+    If raw_zonefile is True, then return the raw zonefile data.  Don't parse it.
+
+    Return {name_or_hash: zonefile} on success.  A name or hash whose zonefile
+    could not be loaded (or a name without a zonefile) maps to None.
+    """
+    if proxy is None:
+        proxy = get_default_proxy()
+
+    conf = proxy.conf 
+    hostport = '{}:{}'.format( conf['server'], conf['port'] )
+    max_workers = get_proxy_concurrency( proxy, max_workers=max_workers )
+
+    # find the hash for each name
+    names = [n for n in names_or_hashes if not (len(n) == 40 and is_hex(n))]
+    name_records = {}
+    if len(names) > 0:
+        name_records = get_name_blockchain_records( names, proxy=proxy )
+
+    zonefile_hashes = {}        # name or hash => zonefile hash
+    zonefile_names = {}         # zonefile hash => name, for the storage drivers
+    for name_or_hash in names_or_hashes:
+        if name_records.has_key(name_or_hash):
+            name_rec = name_records[name_or_hash]
+            if 'error' in name_rec:
+                log.error("Failed to look up name record for '%s': %s" % (name_or_hash, name_rec['error']))
+                continue
+
+            if name_rec.get('value_hash', None) in [None, "null", ""]:
+                continue
+
+            zonefile_hash = str(name_rec['value_hash'])
+            zonefile_names[zonefile_hash] = name_or_hash
+
+        else:
+            zonefile_hash = str(name_or_hash)
+
+        zonefile_hashes[name_or_hash] = zonefile_hash
+
+    # zonefiles never change, so try our local copies first
+    zonefiles = {}              # zonefile hash => zonefile text
+    missing = []
+    for zonefile_hash in set(zonefile_hashes.values()):
+        zonefile_txt = immutable_cache_get( zonefile_hash, storage.get_zonefile_data_hash )
+        if zonefile_txt is not None:
+            zonefiles[zonefile_hash] = zonefile_txt
+        else:
+            missing.append( zonefile_hash )
+
+    # try atlas node next
+    def fetch_batch( batch ):
+        res = get_zonefiles( hostport, batch, proxy=proxy )
+        if 'error' in res:
+            log.error("Failed to fetch %s zonefiles from %s: %s" % (len(batch), hostport, res['error']))
+            return {}
+
+        return res['zonefiles']
+
+    requested = set(missing)
+    batches = [missing[i:i+batch_size] for i in xrange(0, len(missing), batch_size)]
+    for fetched in parallel_imap( fetch_batch, batches, max_workers=max_workers ):
+        for (zonefile_hash, zonefile_txt) in fetched.items():
+            if zonefile_hash not in requested or not storage.verify_zonefile( zonefile_txt, zonefile_hash ):
+                continue
+
+            zonefiles[zonefile_hash] = zonefile_txt
+            immutable_cache_put( zonefile_hash, zonefile_txt, storage.get_zonefile_data_hash )
+
+    if len(missing) > 0:
+        log.debug('Fetched {} of {} zonefiles from Atlas peer {}'.format(len([h for h in missing if zonefiles.has_key(h)]), len(missing), hostport))
+
+    # fall back to storage drivers for the ones the atlas node didn't have
+    # (this caches the zonefiles for us)
+    def fetch_from_storage( zonefile_hash ):
+        return storage.get_immutable_data(zonefile_hash, hash_func=storage.get_zonefile_data_hash, fqu=zonefile_names.get(zonefile_hash, None), zonefile=True, deserialize=False, drivers=storage_drivers)
+
+    missing = [h for h in missing if not zonefiles.has_key(h)]
+    for (zonefile_hash, zonefile_txt) in zip(missing, parallel_imap( fetch_from_storage, missing, max_workers=max_workers )):
+        if zonefile_txt is None:
+            log.error("Failed to load user zonefile '%s'" % zonefile_hash)
+            continue
+
+        zonefiles[zonefile_hash] = zonefile_txt
+
+    ret = {}
+    for name_or_hash in names_or_hashes:
+        zonefile_txt = zonefiles.get( zonefile_hashes.get(name_or_hash, None), None )
+        if zonefile_txt is None:
+            ret[name_or_hash] = None
+
+        elif raw_zonefile:
+            if type(zonefile_txt) not in [str, unicode]:
+                log.error("Driver did not return a serialized zonefile")
+                ret[name_or_hash] = None
+            else:
+                ret[name_or_hash] = zonefile_txt
+
+        else:
+            ret[name_or_hash] = decode_name_zonefile( zonefile_txt )
+
+    return ret
+
+
 def load_legacy_user_profile( name, expected_hash ):
     """
     Load a legacy user profile, and convert it into
@@ -685,49 +813,411 @@ def get_and_migrate_profile( name, zonefile_storage_drivers=None, profile_storag
     return (ret_user_profile, ret_user_zonefile, created_new_zonefile)
 
 
-def zonefile_data_publish(fqu, zonefile_txt, server_list, wallet_keys=None):
+class NameResolverStats(object):
     """
-    Replicate a zonefile to as many blockstack servers as possible.
-    @server_list is a list of (host, port) tuple
-    Return {'status': True, 'servers': ...} on success, if we succeeded to replicate at least once.
-        'servers' will be a list of (host, port) tuples
-    Return {'error': ...} if we failed on all accounts.
+    Throughput of each stage of the bulk profile resolver:
+    how many names went through it, how many failed, and
+    how long its workers spent on them.
     """
-    successful_servers = []
-    for server_host, server_port in server_list:
-        try:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.stages = {}
+
+
+    def record(self, stage_name, num_items, duration, num_failed=0):
+        """
+        Record a batch of names going through a stage
+        """
+        with self.lock:
+            if not self.stages.has_key(stage_name):
+                self.stages[stage_name] = {
+                    'items': 0,
+                    'failed_items': 0,
+                    'busy_time': 0.0,
+                }
+
+            stage = self.stages[stage_name]
+            stage['items'] += num_items
+            stage['failed_items'] += num_failed
+            stage['busy_time'] += duration
+
+
+    def get_stats(self):
+        """
+        Get a summary of each stage's throughput
+        """
+        with self.lock:
+            elapsed = time.time() - self.start_time
+            ret = {
+                'elapsed': elapsed,
+                'stages': {},
+            }
+
+            for (stage_name, stage) in self.stages.items():
+                ret['stages'][stage_name] = {
+                    'items': stage['items'],
+                    'failed_items': stage['failed_items'],
+                    'items_per_second': (stage['items'] / elapsed) if elapsed > 0 else None,
+                    'mean_item_time': (stage['busy_time'] / stage['items']) if stage['items'] > 0 else None,
+                }
+
+            return ret
+
+
+def iter_name_profiles( names, proxy=None, zonefile_storage_drivers=None, profile_storage_drivers=None,
+                        batch_size=PROFILE_RESOLVER_BATCH_SIZE, max_workers=PROFILE_RESOLVER_MAX_WORKERS, stats=None ):
+    """
+    Resolve the zonefiles and profiles of many names.
+    @names can be any iterable (i.e. iter_names_in_namespace()); it is consumed lazily.
 
-            log.debug("Replicate zonefile to %s:%s" % (server_host, server_port))
-            hostport = '{}:{}'.format(server_host, server_port)
+    Names go through three stages, each of which runs concurrently
+    with the others and keeps a bounded amount of work in flight:
+    * their blockchain records are fetched, batch_size names at a time;
+    * their zonefiles are fetched, batch_size hashes at a time (see load_name_zonefiles);
+    * their profiles are fetched and verified, max_workers names at a time.
 
-            res = put_zonefiles( hostport, [base64.b64encode(zonefile_txt)] )
-            if 'error' in res or res['saved'][0] != 1:
-                if 'error' in res:
-                    log.error("Failed to publish zonefile to %s:%s: %s" % (server_host, server_port, res['error']))
-                else:
-                    log.error("Failed to publish zonefile to %s:%s: %s" % (server_host, server_port, json.dumps(res)))
+    If stats (a NameResolverStats) is given, each stage's throughput is recorded in it.
 
-                continue
+    Yields one dict per name, in the same order as @names:
+    {'name': ..., 'zonefile_hash': ..., 'zonefile': raw zonefile, 'profile': ...} on success
+    {'name': ..., 'error': ...} on failure
+    """
+    if proxy is None:
+        proxy = get_default_proxy()
+
+    if stats is None:
+        stats = NameResolverStats()
+
+    rpc_workers = get_proxy_concurrency( proxy, max_workers=max_workers )
+
+    def name_batches():
+        batch = []
+        for name in names:
+            batch.append(name)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if len(batch) > 0:
+            yield batch
+
+    def fetch_records( batch ):
+        start = time.time()
+        name_records = get_name_blockchain_records( batch, proxy=proxy )
+        ret = [(name, name_records.get(name, {'error': 'No name record'})) for name in batch]
+        stats.record( 'records', len(batch), time.time() - start, len([rec for (name, rec) in ret if 'error' in rec]) )
+        return ret
+
+    def fetch_zonefiles( batch ):
+        start = time.time()
+        zonefile_hashes = [str(rec['value_hash']) for (name, rec) in batch if 'error' not in rec and rec.get('value_hash', None) not in [None, "null", ""]]
+        zonefiles = {}
+        if len(zonefile_hashes) > 0:
+            zonefiles = load_name_zonefiles( zonefile_hashes, storage_drivers=zonefile_storage_drivers, raw_zonefile=True, proxy=proxy, max_workers=rpc_workers )
+
+        ret = [(name, rec, zonefiles.get(str(rec.get('value_hash', None)), None)) for (name, rec) in batch]
+        stats.record( 'zonefiles', len(zonefile_hashes), time.time() - start, len([h for h in zonefile_hashes if zonefiles.get(h, None) is None]) )
+        return ret
+
+    def fetch_profile( item ):
+        name, name_rec, zonefile_txt = item
+        if 'error' in name_rec:
+            return {'name': name, 'error': name_rec['error']}
+
+        if name_rec.get('revoked', False):
+            return {'name': name, 'error': 'Name is revoked'}
+
+        if name_rec.get('value_hash', None) in [None, "null", ""]:
+            return {'name': name, 'error': 'Name has no zonefile'}
+
+        if zonefile_txt is None:
+            return {'name': name, 'error': 'Failed to load zonefile'}
+
+        ret = {
+            'name': name,
+            'zonefile_hash': str(name_rec['value_hash']),
+            'zonefile': zonefile_txt,
+        }
+
+        start = time.time()
+        user_profile = None
+        try:
+            user_zonefile = decode_name_zonefile( zonefile_txt )
+            if user_zonefile is None:
+                ret['error'] = 'Non-standard zonefile'
 
-            log.debug("Replicated zonefile to %s:%s" % (server_host, server_port))
-            successful_servers.append( (server_host, server_port) )
+            else:
+                user_profile, user_zonefile = get_name_profile( name, profile_storage_drivers=profile_storage_drivers, proxy=proxy, user_zonefile=user_zonefile, name_record=name_rec )
+                if user_profile is None:
+                    ret['error'] = user_zonefile['error']
+                else:
+                    ret['profile'] = user_profile
 
         except Exception, e:
             log.exception(e)
-            log.error("Failed to publish zonefile to %s:%s" % (server_host, server_port))
+            ret['error'] = 'Failed to load profile'
+
+        stats.record( 'profiles', 1, time.time() - start, 1 if user_profile is None else 0 )
+        return ret
+
+    def flatten( batches ):
+        for batch in batches:
+            for item in batch:
+                yield item
+
+    records = parallel_imap( fetch_records, name_batches(), max_workers=rpc_workers )
+    zonefiles = parallel_imap( fetch_zonefiles, records, max_workers=rpc_workers )
+    for res in parallel_imap( fetch_profile, flatten(zonefiles), max_workers=max_workers ):
+        yield res
+
+
+class AtlasServerBreaker(object):
+    """
+    Per-server circuit breaker for publishing zonefiles.
+
+    Once a server fails max_failures times in a row, we stop
+    pushing zonefiles to it for retry_interval seconds.  After
+    that, we try it again; one success resets it, and one
+    failure trips it for another retry_interval seconds.
+    """
+    def __init__(self, max_failures=ZONEFILE_PUBLISH_MAX_FAILURES, retry_interval=ZONEFILE_PUBLISH_RETRY_INTERVAL):
+        self.max_failures = max_failures
+        self.retry_interval = retry_interval
+        self.lock = threading.Lock()
+        self.failures = {}      # hostport => consecutive failures
+        self.tripped_at = {}    # hostport => time of the last failure that tripped the breaker
+
+
+    def is_available(self, hostport):
+        """
+        Should we push to this server?
+        """
+        with self.lock:
+            tripped_at = self.tripped_at.get(hostport, None)
+            return tripped_at is None or time.time() - tripped_at >= self.retry_interval
+
+
+    def record_success(self, hostport):
+        """
+        The server took a zonefile
+        """
+        with self.lock:
+            self.failures.pop(hostport, None)
+            self.tripped_at.pop(hostport, None)
+
+
+    def record_failure(self, hostport):
+        """
+        The server failed to take a zonefile
+        """
+        with self.lock:
+            self.failures[hostport] = self.failures.get(hostport, 0) + 1
+            if self.failures[hostport] >= self.max_failures:
+                if not self.tripped_at.has_key(hostport):
+                    log.warning("Not publishing zonefiles to %s for %s seconds (%s failures)" % (hostport, self.retry_interval, self.failures[hostport]))
+
+                self.tripped_at[hostport] = time.time()
+
+
+    def get_stats(self):
+        """
+        Get each server's consecutive failures, and whether or not we're skipping it
+        """
+        with self.lock:
+            now = time.time()
+            return dict( [(hostport, {'failures': failures, 'tripped': self.tripped_at.has_key(hostport) and now - self.tripped_at[hostport] < self.retry_interval}) \
+                          for (hostport, failures) in self.failures.items()] )
+
+
+atlas_server_breaker = AtlasServerBreaker()
+
+
+def get_atlas_server_breaker_stats():
+    """
+    Get the state of the zonefile publishing circuit breakers
+    """
+    return atlas_server_breaker.get_stats()
+
+
+def zonefile_batches( zonefile_list, max_count=ZONEFILE_BATCH_MAX_COUNT, max_len=ZONEFILE_BATCH_MAX_LEN ):
+    """
+    Split a list of zonefiles into batches to send with put_zonefiles,
+    each with at most max_count zonefiles and max_len bytes of zonefile data
+    (a zonefile longer than max_len goes in a batch by itself).
+    Return a list of lists of indexes into zonefile_list
+    """
+    batches = []
+    batch = []
+    batch_len = 0
+    for i in xrange(0, len(zonefile_list)):
+        zonefile_len = len(zonefile_list[i])
+        if len(batch) > 0 and (len(batch) >= max_count or batch_len + zonefile_len > max_len):
+            batches.append(batch)
+            batch = []
+            batch_len = 0
+
+        batch.append(i)
+        batch_len += zonefile_len
+
+    if len(batch) > 0:
+        batches.append(batch)
+
+    return batches
+
+
+def zonefile_data_publish_batch( server_host, server_port, zonefiles_b64 ):
+    """
+    Push a batch of base64-encoded zonefiles to one server.
+    Return a list of booleans: whether or not each zonefile was saved.
+    """
+    hostport = '{}:{}'.format(server_host, server_port)
+    try:
+        log.debug("Replicate %s zonefile(s) to %s:%s" % (len(zonefiles_b64), server_host, server_port))
+
+        res = put_zonefiles( hostport, zonefiles_b64 )
+        if 'error' in res or len(res['saved']) != len(zonefiles_b64):
+            if 'error' in res:
+                log.error("Failed to publish zonefiles to %s:%s: %s" % (server_host, server_port, res['error']))
+            else:
+                log.error("Failed to publish zonefiles to %s:%s: %s" % (server_host, server_port, json.dumps(res)))
+
+            atlas_server_breaker.record_failure( hostport )
+            return [False] * len(zonefiles_b64)
+
+    except Exception, e:
+        log.exception(e)
+        log.error("Failed to publish zonefiles to %s:%s" % (server_host, server_port))
+        atlas_server_breaker.record_failure( hostport )
+        return [False] * len(zonefiles_b64)
+
+    saved = [s == 1 for s in res['saved']]
+    if False in saved:
+        log.error("%s:%s did not save %s of %s zonefile(s)" % (server_host, server_port, saved.count(False), len(saved)))
+
+    log.debug("Replicated %s zonefile(s) to %s:%s" % (saved.count(True), server_host, server_port))
+    atlas_server_breaker.record_success( hostport )
+    return saved
+
+
+def zonefile_data_publish_many( zonefile_list, server_list, quorum=None, max_workers=ZONEFILE_PUBLISH_MAX_WORKERS, background=True ):
+    """
+    Replicate a list of zonefiles to as many blockstack servers as possible.
+    Each server gets the zonefiles in batches (see zonefile_batches).
+    Push to up to max_workers servers at once.  If background is True,
+    return as soon as each zonefile is on quorum of them (default
+    ZONEFILE_PUBLISH_QUORUM), and let the remaining pushes carry on in
+    (daemon) threads.  This is only useful in a long-lived process like
+    the registrar; a process that exits right away should pass
+    background=False, so we wait for every push to finish.
+    Servers that keep failing are skipped for a while (see AtlasServerBreaker).
+    @server_list is a list of (host, port) tuple
+    Return a list with one result per zonefile:
+        {'status': True, 'servers': ...} if at least quorum servers took the zonefile
+        (or all of them, if fewer than quorum are available).
+        'servers' will be a list of (host, port) tuples
+        {'error': ...} if not
+    """
+    if quorum is None:
+        quorum = ZONEFILE_PUBLISH_QUORUM
+
+    if len(zonefile_list) == 0:
+        return []
+
+    servers = [(server_host, server_port) for (server_host, server_port) in server_list if atlas_server_breaker.is_available('{}:{}'.format(server_host, server_port))]
+    if len(servers) == 0 and len(server_list) > 0:
+        # better to retry them early than to not publish at all
+        log.warning("All %s servers have failed recently; trying them anyway" % len(server_list))
+        servers = list(server_list)
+
+    if len(servers) == 0:
+        return [{'error': 'Failed to publish zonefile to all backend providers'} for zonefile_txt in zonefile_list]
+
+    quorum = max(1, min(quorum, len(servers)))
+    zonefiles_b64 = [base64.b64encode(zonefile_txt) for zonefile_txt in zonefile_list]
+    batches = zonefile_batches( zonefile_list )
+
+    pending = Queue.Queue()
+    results = Queue.Queue()
+    for server in servers:
+        pending.put(server)
+
+    def publish_worker():
+        while True:
+            try:
+                server_host, server_port = pending.get_nowait()
+            except Queue.Empty:
+                return
+
+            for batch in batches:
+                saved = zonefile_data_publish_batch( server_host, server_port, [zonefiles_b64[i] for i in batch] )
+                results.put( ((server_host, server_port), [i for (i, rc) in zip(batch, saved) if rc], False) )
+
+            results.put( ((server_host, server_port), [], True) )
+
+    for i in xrange(0, max(1, min(max_workers, len(servers)))):
+        t = threading.Thread( target=publish_worker )
+        t.daemon = True
+        t.start()
+
+    successful_servers = [[] for zonefile_txt in zonefile_list]
+    num_below_quorum = len(zonefile_list)
+    num_done = 0
+    while num_done < len(servers) and (num_below_quorum > 0 or not background):
+        server, saved_indexes, done = results.get()
+        if done:
+            num_done += 1
             continue
 
-    if len(successful_servers) > 0:
-        return {'status': True, 'servers': successful_servers}
+        for i in saved_indexes:
+            successful_servers[i].append( server )
+            if len(successful_servers[i]) == quorum:
+                num_below_quorum -= 1
 
-    else:
-        return {'error': 'Failed to publish zonefile to all backend providers'}
+    if num_done < len(servers):
+        log.debug("Replicated %s zonefile(s) to %s server(s); pushing to %s more in the background" % (len(zonefile_list), quorum, len(servers) - num_done))
 
+    ret = []
+    for i in xrange(0, len(zonefile_list)):
+        if len(successful_servers[i]) >= quorum:
+            ret.append( {'status': True, 'servers': successful_servers[i]} )
 
-def zonefile_data_replicate( fqu, zonefile_data, tx_hash, server_list, config_path=CONFIG_PATH, storage_drivers=None ):
+        elif len(successful_servers[i]) > 0:
+            ret.append( {'error': 'Failed to publish zonefile to %s servers (only %s succeeded)' % (quorum, len(successful_servers[i]))} )
+
+        else:
+            ret.append( {'error': 'Failed to publish zonefile to all backend providers'} )
+
+    return ret
+
+
+def zonefile_data_publish(fqu, zonefile_txt, server_list, wallet_keys=None, quorum=None, max_workers=ZONEFILE_PUBLISH_MAX_WORKERS, background=True):
+    """
+    Replicate a zonefile to as many blockstack servers as possible.
+    Push to up to max_workers servers at once, and return once quorum
+    of them (default ZONEFILE_PUBLISH_QUORUM) have the zonefile
+    (see zonefile_data_publish_many() for background).
+    @server_list is a list of (host, port) tuple
+    Return {'status': True, 'servers': ...} on success, if at least quorum servers took the zonefile
+        (or all of them, if fewer than quorum are available).
+        'servers' will be a list of (host, port) tuples
+    Return {'error': ...} if we failed on all accounts.
+    """
+    res = zonefile_data_publish_many( [zonefile_txt], server_list, quorum=quorum, max_workers=max_workers, background=background )[0]
+    if 'error' in res:
+        log.error("Failed to publish zonefile for %s: %s" % (fqu, res['error']))
+
+    return res
+
+
+def zonefile_data_replicate( fqu, zonefile_data, tx_hash, server_list, config_path=CONFIG_PATH, storage_drivers=None, quorum=None, background=True ):
     """
     Replicate zonefile data both to a list of blockstack servers,
     as well as to the user's storage drivers.
+    Succeed once quorum servers have it (see zonefile_data_publish
+    for quorum and background).
+    If server_list is None, only replicate to the storage drivers
+    (i.e. the caller will publish it with zonefile_data_publish_many).
 
     Return {'status': True, 'servers': successful server list} on success
     Return {'error': ...}
@@ -755,8 +1245,11 @@ def zonefile_data_replicate( fqu, zonefile_data, tx_hash, server_list, config_pa
         log.info("Failed to replicate zonefile for %s to %s" % (fqu))
         return {'error': 'Failed to store user zonefile'}
 
+    if server_list is None:
+        return {'status': True, 'servers': []}
+
     # replicate to blockstack servers
-    res = zonefile_data_publish( fqu, zonefile_data, server_list ) 
+    res = zonefile_data_publish( fqu, zonefile_data, server_list, quorum=quorum, background=background )
     if 'error' in res:
         return res
 
@@ -34,10 +34,14 @@ import pprint
 import random
 import time
 import copy
+import errno
+import collections
+import threading
+import re
 import blockstack_profiles
 import blockstack_zones
 import urllib
-from xmlrpclib import ServerProxy, Transport
+from xmlrpclib import ServerProxy, Transport, Fault, ProtocolError, MultiCall
 from defusedxml import xmlrpc
 import httplib
 import base64
@@ -62,12 +66,19 @@ from config import get_logger, DEBUG, MAX_RPC_LEN, find_missing, BLOCKSTACKD_SER
     FIRST_BLOCK_MAINNET, NAME_OPCODES, OPFIELDS, CONFIG_DIR, SPV_HEADERS_PATH, BLOCKCHAIN_ID_MAGIC, \
     NAME_PREORDER, NAME_REGISTRATION, NAME_UPDATE, NAME_TRANSFER, NAMESPACE_PREORDER, NAME_IMPORT, \
     USER_ZONEFILE_TTL, CONFIG_PATH, url_to_host_port, LENGTH_CONSENSUS_HASH, LENGTH_VALUE_HASH, \
-    LENGTH_MAX_NAME, LENGTH_MAX_NAMESPACE_ID, TRANSFER_KEEP_DATA, TRANSFER_REMOVE_DATA, op_get_opcode_name
+    LENGTH_MAX_NAME, LENGTH_MAX_NAMESPACE_ID, TRANSFER_KEEP_DATA, TRANSFER_REMOVE_DATA, op_get_opcode_name, \
+    RPC_MAX_CONCURRENCY, BLOCKCHAIN_RECORD_CACHE_ENABLED, BLOCKCHAIN_RECORD_CACHE_SIZE, \
+    BLOCKCHAIN_RECORD_CACHE_HEIGHT_CHECK, RPC_PAGE_SIZE_DEFAULT, RPC_PAGE_SIZE_MAX, RPC_PAGE_MAX_BYTES, CONSENSUS_RANGE_CHUNK_SIZE, \
+    RPC_PAGE_LIMIT_TTL, RPC_PAGE_REJECTED_PATTERN
+
+from utils import parallel_imap
+from history_cache import op_history_cache, op_history_replay_cache
+from consensus_cache import get_consensus_hash_cache
 
 from .operations import SNV_CONSENSUS_EXTRA_METHODS, nameop_is_history_snapshot, \
                         nameop_history_extract, nameop_restore_from_history, \
                         nameop_snv_consensus_extra_quirks, nameop_snv_consensus_extra, \
-                        nameop_restore_snv_consensus_fields
+                        nameop_restore_snv_consensus_fields, NameHistoryReplay
 
 log = get_logger('blockstack-client')
 
@@ -424,17 +435,226 @@ class TimeoutServerProxy(ServerProxy):
         ServerProxy.__init__(self, uri, *l, **kw)
 
 
+class RPCConnectionPool(object):
+    """
+    Bounded pool of persistent HTTP/1.1 connections, keyed by host:port.
+    Connections are checked out for the duration of a single RPC
+    and returned afterwards, so the pool can be shared across
+    threads and across BlockstackRPCClient instances.
+    """
+    def __init__(self, max_connections=config.RPC_POOL_MAX_CONNECTIONS, max_idle=config.RPC_POOL_MAX_IDLE):
+        self.max_connections = max_connections
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.idle = {}      # host:port --> [(connection, last_used)]
+        self.stats = {
+            'hits': 0,          # RPCs that reused an open connection
+            'misses': 0,        # RPCs that had to open a new connection
+            'evictions': 0,     # idle connections closed due to age or pool size
+            'reconnects': 0,    # RPCs retried on a fresh connection after a broken one
+        }
+
+
+    def acquire(self, hostport, timeout, fresh=False):
+        """
+        Get a connection to @hostport, reusing an idle one if we can.
+        If @fresh is True, always open a new connection.
+        """
+        now = time.time()
+        with self.lock:
+            conns = self.idle.get(hostport, [])
+            while not fresh and len(conns) > 0:
+                conn, last_used = conns.pop()
+                if now - last_used > self.max_idle:
+                    # went stale
+                    self.stats['evictions'] += 1
+                    conn.close()
+                    continue
+
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+
+                self.stats['hits'] += 1
+                return conn
+
+            self.stats['misses'] += 1
+
+        return TimeoutHTTPConnection(hostport, timeout=timeout)
+
+
+    def release(self, hostport, conn):
+        """
+        Give back a connection after a complete request/response.
+        """
+        with self.lock:
+            conns = self.idle.setdefault(hostport, [])
+            if len(conns) >= self.max_connections:
+                self.stats['evictions'] += 1
+                conn.close()
+                return
+
+            conns.append( (conn, time.time()) )
+
+
+    def discard(self, conn):
+        """
+        Drop a connection that is in an unknown state.
+        """
+        try:
+            conn.close()
+        except:
+            pass
+
+
+    def note_reconnect(self):
+        with self.lock:
+            self.stats['reconnects'] += 1
+
+
+    def get_stats(self):
+        """
+        Get a copy of the hit/miss counters, plus the number of idle connections.
+        """
+        with self.lock:
+            ret = dict(self.stats)
+            ret['idle'] = sum([len(c) for c in self.idle.values()])
+
+        return ret
+
+
+    def close_all(self):
+        with self.lock:
+            for hostport, conns in self.idle.items():
+                for conn, _ in conns:
+                    conn.close()
+
+            self.idle = {}
+
+
+# shared by all pooled RPC clients in this process
+default_connection_pool = RPCConnectionPool()
+
+
+class PooledTransport(TimeoutTransport):
+    """
+    XML-RPC transport that keeps its HTTP connections open
+    between calls, using an RPCConnectionPool.
+    """
+    def __init__(self, *l, **kw):
+        self.pool = kw.get('pool', None)
+        if 'pool' in kw.keys():
+            del kw['pool']
+
+        if self.pool is None:
+            self.pool = default_connection_pool
+
+        TimeoutTransport.__init__(self, *l, **kw)
+
+
+    def request(self, host, handler, request_body, verbose=0):
+        # retry once on a brand-new connection if a pooled one went cold
+        try:
+            return self.single_request(host, handler, request_body, verbose)
+        except socket.error, e:
+            if e.errno not in (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE):
+                raise
+        except httplib.BadStatusLine:
+            pass
+
+        self.pool.note_reconnect()
+        return self.single_request(host, handler, request_body, verbose, fresh=True)
+
+
+    def single_request(self, host, handler, request_body, verbose=0, fresh=False):
+        chost, extra_headers, x509 = self.get_host_info(host)
+        h = self.pool.acquire(chost, self.timeout, fresh=fresh)
+        if verbose:
+            h.set_debuglevel(1)
+
+        response = None
+        try:
+            self.send_request(h, handler, request_body)
+            if extra_headers:
+                for key, value in extra_headers:
+                    h.putheader(key, value)
+
+            self.send_user_agent(h)
+            self.send_content(h, request_body)
+
+            response = h.getresponse(buffering=True)
+            if response.status == 200:
+                self.verbose = verbose
+                res = self.parse_response(response)
+                self._release(chost, h, response)
+                return res
+
+        except Fault:
+            # the response was fully read
+            self._release(chost, h, response)
+            raise
+
+        except Exception:
+            self.pool.discard(h)
+            raise
+
+        # discard any response data and raise exception
+        if response.getheader("content-length", 0):
+            response.read()
+
+        self.pool.discard(h)
+        raise ProtocolError(host + handler, response.status, response.reason, response.msg)
+
+
+    def _release(self, hostport, conn, response):
+        if response is not None and response.will_close:
+            # server does not do keep-alive
+            self.pool.discard(conn)
+        else:
+            self.pool.release(hostport, conn)
+
+
+    def close(self):
+        # connections belong to the pool
+        pass
+
+
+class PooledServerProxy(ServerProxy):
+    def __init__(self, uri, *l, **kw):
+        kw['transport'] = PooledTransport(timeout=kw.get('timeout',10), use_datetime=kw.get('use_datetime', 0), pool=kw.get('pool', None))
+        for k in ['timeout', 'pool']:
+            if k in kw.keys():
+                del kw[k]
+
+        ServerProxy.__init__(self, uri, *l, **kw)
+
+
+def get_connection_pool_stats():
+    """
+    Get the hit/miss counters for the shared RPC connection pool
+    """
+    return default_connection_pool.get_stats()
+
+
 # default API endpoint proxy to blockstackd
 default_proxy = None
 
 class BlockstackRPCClient(object):
     """
-    RPC client for the blockstack server
+    RPC client for the blockstack server.
+    By default, connections are kept alive and shared through
+    the process-wide connection pool; pass pooled=False to
+    open a new connection on each call.
     """
-    def __init__(self, server, port, max_rpc_len=MAX_RPC_LEN, timeout=config.DEFAULT_TIMEOUT, debug_timeline=False, **kw ):
-        self.srv = TimeoutServerProxy( 'http://%s:%s' % (server, port), timeout=timeout, allow_none=True )
+    def __init__(self, server, port, max_rpc_len=MAX_RPC_LEN, timeout=config.DEFAULT_TIMEOUT, debug_timeline=False, pooled=True, pool=None, **kw ):
+        if pooled:
+            self.srv = PooledServerProxy( 'http://%s:%s' % (server, port), timeout=timeout, allow_none=True, pool=pool )
+        else:
+            self.srv = TimeoutServerProxy( 'http://%s:%s' % (server, port), timeout=timeout, allow_none=True )
+
         self.server = server
         self.port = port
+        self.pooled = pooled
         self.debug_timeline = debug_timeline
 
     def __getattr__(self, key):
@@ -469,6 +689,149 @@ class BlockstackRPCClient(object):
             return inner
 
 
+class BlockchainRecordCache(object):
+    """
+    Read-through cache for name and namespace records.
+    A record is only valid at the block height it was fetched at,
+    so entries are tagged with the height that the server reported
+    (via getinfo) and are ignored once it reports a new block.
+    The server's height is re-checked at most once every
+    height_check_interval seconds.
+
+    Records are copied on the way in and out, so callers
+    can modify what they get back.
+    """
+    def __init__(self, max_size=BLOCKCHAIN_RECORD_CACHE_SIZE, height_check_interval=BLOCKCHAIN_RECORD_CACHE_HEIGHT_CHECK):
+        self.max_size = max_size
+        self.height_check_interval = height_check_interval
+        self.lock = threading.Lock()
+        self.records = collections.OrderedDict()   # (server, port, kind, key) => (block height, record)
+        self.block_heights = {}                     # (server, port) => (block height, time checked)
+        self.hits = 0
+        self.misses = 0
+
+
+    @classmethod
+    def proxy_hostport(cls, proxy):
+        """
+        Which server does this proxy talk to?
+        """
+        return (getattr(proxy, 'server', None), getattr(proxy, 'port', None))
+
+
+    def note_block_height(self, proxy, block_height):
+        """
+        Remember the block height that a server just reported.
+        """
+        with self.lock:
+            self.block_heights[self.proxy_hostport(proxy)] = (block_height, time.time())
+
+
+    def get_block_height(self, proxy):
+        """
+        Get the server's current block height, asking it if we
+        have not done so recently.
+        Return None if the server could not be reached.
+        """
+        hostport = self.proxy_hostport(proxy)
+        with self.lock:
+            if self.block_heights.has_key(hostport):
+                block_height, checked_at = self.block_heights[hostport]
+                if time.time() - checked_at < self.height_check_interval:
+                    return block_height
+
+        # NOTE: getinfo() calls note_block_height() for us
+        info = getinfo(proxy=proxy)
+        if json_is_error(info):
+            log.debug("Failed to get block height: %s" % info['error'])
+            return None
+
+        return info['last_block_processed']
+
+
+    def get(self, proxy, kind, key, block_height):
+        """
+        Get a cached record, if it was fetched at the given block height.
+        Return None if not cached.
+        """
+        cache_key = self.proxy_hostport(proxy) + (kind, key)
+        with self.lock:
+            if self.records.has_key(cache_key):
+                cached_height, rec = self.records.pop(cache_key)
+                if cached_height == block_height:
+                    # still fresh; mark most-recently used
+                    self.records[cache_key] = (cached_height, rec)
+                    self.hits += 1
+                    return copy.deepcopy(rec)
+
+            self.misses += 1
+
+        return None
+
+
+    def put(self, proxy, kind, key, block_height, rec):
+        """
+        Cache a record fetched at the given block height.
+        """
+        cache_key = self.proxy_hostport(proxy) + (kind, key)
+        with self.lock:
+            self.records[cache_key] = (block_height, copy.deepcopy(rec))
+            while len(self.records) > self.max_size:
+                self.records.popitem(last=False)
+
+
+    def lookup(self, proxy, kind, key, fetch):
+        """
+        Look up a record, calling fetch() to get it from
+        the server if it is not cached at the current block height.
+        Errors are never cached.
+        """
+        block_height = self.get_block_height(proxy)
+        if block_height is None:
+            return fetch()
+
+        rec = self.get(proxy, kind, key, block_height)
+        if rec is not None:
+            return rec
+
+        rec = fetch()
+        if not json_is_error(rec):
+            self.put(proxy, kind, key, block_height, rec)
+
+        return rec
+
+
+    def clear(self):
+        """
+        Drop all cached records
+        """
+        with self.lock:
+            self.records.clear()
+            self.block_heights.clear()
+
+
+    def get_stats(self):
+        """
+        Get cache statistics
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.records),
+            }
+
+
+blockchain_record_cache = BlockchainRecordCache()
+
+
+def get_blockchain_record_cache_stats():
+    """
+    Get hit/miss statistics for the name and namespace record cache
+    """
+    return blockchain_record_cache.get_stats()
+
+
 def get_default_proxy(config_path=CONFIG_PATH):
     """
     Get the default API proxy to blockstack.
@@ -669,6 +1032,8 @@ def getinfo(proxy=None):
         if json_is_error(resp):
             return resp
 
+        blockchain_record_cache.note_block_height(proxy, resp['last_block_processed'])
+
     except ValidationError as e:
         log.exception(e)
         resp = json_traceback(resp.get('error'))
@@ -878,11 +1243,72 @@ def get_num_names( proxy=None ):
     return resp['count']
 
 
-def get_all_names( offset=None, count=None, proxy=None ):
+def get_proxy_concurrency( proxy, max_workers=RPC_MAX_CONCURRENCY ):
     """
-    Get all names within the given range.
-    Return the list of names on success
-    Return {'error': ...} on failure
+    How many RPCs can we safely have in flight on this proxy at once?
+    Only pooled proxies can be shared across threads; anything else
+    holds a single connection, so we must talk to it serially.
+    """
+    if getattr(proxy, 'pooled', False):
+        return max(1, max_workers)
+
+    return 1
+
+
+def iter_name_pages( get_page, offset, count, page_size=100, max_workers=RPC_MAX_CONCURRENCY, proxy=None ):
+    """
+    Fetch the names in [offset, offset + count) using get_page(offset, count, proxy=proxy),
+    keeping up to max_workers page requests in flight ahead of the caller.
+    Yields each name in order.
+    On error, yields a single {'error': ...} dict and stops.
+    """
+    def fetch_page( page_range ):
+        # fetch names [page_offset, page_offset + request_size), following short pages
+        page_offset, request_size = page_range
+        names = []
+        while len(names) < request_size:
+            page = get_page( page_offset + len(names), request_size - len(names), proxy=proxy )
+            if json_is_error(page):
+                return page
+
+            if len(page) > request_size - len(names):
+                error_str = 'server replied too much data'
+                return {'error': error_str}
+
+            if len(page) == 0:
+                break
+
+            names += page
+
+        return names
+
+    page_ranges = ( (offset + i, min(page_size, count - i)) for i in xrange(0, count, page_size) )
+    pages = parallel_imap( fetch_page, page_ranges, max_workers=get_proxy_concurrency(proxy, max_workers) )
+
+    try:
+        for page in pages:
+            if json_is_error(page):
+                yield page
+                return
+
+            for name in page:
+                yield name
+
+            if len(page) == 0:
+                # no more names (the set shrank underneath us)
+                return
+
+    finally:
+        # stop prefetching if the caller went away
+        pages.close()
+
+
+def iter_all_names( offset=None, count=None, proxy=None, max_workers=RPC_MAX_CONCURRENCY ):
+    """
+    Iterate over all names within the given range,
+    fetching pages concurrently ahead of the caller.
+    Yields each name on success.
+    Yields a single {'error': ...} on failure, and stops.
     """
     offset = 0 if offset is None else offset
     proxy = get_default_proxy() if proxy is None else proxy
@@ -892,28 +1318,27 @@ def get_all_names( offset=None, count=None, proxy=None ):
         count = get_num_names( proxy=proxy )
         if json_is_error(count):
             # error
-            return count
+            yield count
+            return
 
         count -= offset
 
-    page_size = 100
-    all_names = []
-    while len(all_names) < count:
-        request_size = page_size
-        if count - len(all_names) < request_size:
-            request_size = count - len(all_names)
+    for name in iter_name_pages( get_all_names_page, offset, count, max_workers=max_workers, proxy=proxy ):
+        yield name
 
-        page = get_all_names_page( offset + len(all_names), request_size, proxy=proxy )
-        if json_is_error(page):
-            # error
-            return page
 
-        if len(page) > request_size:
-            # error
-            error_str = 'server replied too much data'
-            return {'error': error_str}
+def get_all_names( offset=None, count=None, proxy=None ):
+    """
+    Get all names within the given range.
+    Return the list of names on success
+    Return {'error': ...} on failure
+    """
+    all_names = []
+    for name in iter_all_names( offset=offset, count=count, proxy=proxy ):
+        if json_is_error(name):
+            return name
 
-        all_names += page
+        all_names.append(name)
 
     return all_names
 
@@ -1006,41 +1431,46 @@ def get_num_names_in_namespace( namespace_id, proxy=None ):
     return resp['count']
 
 
-def get_names_in_namespace( namespace_id, offset=None, count=None, proxy=None ):
+def iter_names_in_namespace( namespace_id, offset=None, count=None, proxy=None, max_workers=RPC_MAX_CONCURRENCY ):
     """
-    Get all names in a namespace
-    Returns the list of names on success
-    Returns {'error': ..} on error
+    Iterate over all names in a namespace,
+    fetching pages concurrently ahead of the caller.
+    Yields each name on success.
+    Yields a single {'error': ...} on failure, and stops.
     """
     offset = 0 if offset is None else offset
+    proxy = get_default_proxy() if proxy is None else proxy
+
     if count is None:
         # get all names in this namespace after this offset
         count = get_num_names_in_namespace(namespace_id, proxy=proxy)
         if json_is_error(count):
-            return count
+            yield count
+            return
 
         count -= offset
 
-    page_size = 100
-    all_names = []
-    while len(all_names) < count:
-        request_size = page_size
-        if count - len(all_names) < request_size:
-            request_size = count - len(all_names)
+    def get_page( page_offset, page_count, proxy=None ):
+        return get_names_in_namespace_page( namespace_id, page_offset, page_count, proxy=proxy )
 
-        page = get_names_in_namespace_page( namespace_id, offset + len(all_names), request_size, proxy=proxy )
-        if json_is_error(page):
-            # error
-            return page
+    for name in iter_name_pages( get_page, offset, count, max_workers=max_workers, proxy=proxy ):
+        yield name
 
-        if len(page) > request_size:
-            # error
-            error_str = 'server replied too much data'
-            return {'error': error_str}
 
-        all_names += page
+def get_names_in_namespace( namespace_id, offset=None, count=None, proxy=None ):
+    """
+    Get all names in a namespace
+    Returns the list of names on success
+    Returns {'error': ..} on error
+    """
+    all_names = []
+    for name in iter_names_in_namespace( namespace_id, offset=offset, count=count, proxy=proxy ):
+        if json_is_error(name):
+            return name
 
-    return all_names[:count]
+        all_names.append(name)
+
+    return all_names
 
 
 def get_names_owned_by_address(address, proxy=None):
@@ -1189,18 +1619,85 @@ def get_consensus_hashes(block_heights, proxy=None):
     return ret
 
 
-def get_consensus_range(block_id_start, block_id_end, proxy=None):
+def iter_consensus_range(block_id_start, block_id_end, proxy=None, chunk_size=CONSENSUS_RANGE_CHUNK_SIZE, max_workers=RPC_MAX_CONCURRENCY, use_cache=False):
+    """
+    Iterate over a range of consensus hashes.  The range is inclusive.
+    The range is fetched in chunks of chunk_size blocks, with up to max_workers
+    chunks in flight ahead of the caller.
+    If use_cache is True, consensus hashes this server already reported (and
+    that are in the consensus hash cache) are not fetched again.  This is off
+    by default, since an audit needs to see what the server says now.
+    Yields (block_id, consensus_hash) in order on success.
+    Yields a single {'error': ...} on failure, and stops.
+    """
+    if proxy is None:
+        proxy = get_default_proxy()
+
+    cache = None
+    if use_cache:
+        cache = get_consensus_hash_cache()
+
+    chunk_size = max(1, chunk_size)
+    server, port = BlockchainRecordCache.proxy_hostport(proxy)
+    if server is None or port is None:
+        cache = None
+
+    def fetch_chunk( chunk_range ):
+        chunk_start, chunk_end = chunk_range
+
+        consensus_hashes = {}
+        if cache is not None:
+            consensus_hashes = cache.get_range(server, port, chunk_start, chunk_end)
+
+        missing = [i for i in xrange(chunk_start, chunk_end+1) if i not in consensus_hashes]
+        if len(missing) > 0:
+            ch_range = get_consensus_hashes( missing, proxy=proxy )
+            if json_is_error(ch_range):
+                return ch_range
+
+            # verify that all blocks are included
+            for i in missing:
+                if ch_range.get(i, None) is None:
+                    return {'error': 'Missing consensus hashes'}
+
+                consensus_hashes[i] = ch_range[i]
+
+            if cache is not None:
+                cache.put_many( server, port, dict((i, ch_range[i]) for i in missing) )
+
+        return [(i, consensus_hashes[i]) for i in xrange(chunk_start, chunk_end+1)]
+
+    chunk_ranges = ( (i, min(i + chunk_size - 1, block_id_end)) for i in xrange(block_id_start, block_id_end+1, chunk_size) )
+    chunks = parallel_imap( fetch_chunk, chunk_ranges, max_workers=get_proxy_concurrency(proxy, max_workers) )
+
+    try:
+        for chunk in chunks:
+            if json_is_error(chunk):
+                yield chunk
+                return
+
+            for block_ch in chunk:
+                yield block_ch
+
+    finally:
+        # stop prefetching if the caller went away
+        chunks.close()
+
+
+def get_consensus_range(block_id_start, block_id_end, proxy=None, use_cache=False):
     """
     Get a range of consensus hashes.  The range is inclusive.
+    (see iter_consensus_range() for use_cache)
+    Return {block_id: consensus_hash} on success
+    Return {'error': ...} on error
     """
-    ch_range = get_consensus_hashes( range(block_id_start, block_id_end+1), proxy=proxy )
-    if 'error' in ch_range:
-        return ch_range
+    ch_range = {}
+    for block_ch in iter_consensus_range( block_id_start, block_id_end, proxy=proxy, use_cache=use_cache ):
+        if json_is_error(block_ch):
+            return block_ch
 
-    # verify that all blocks are included 
-    for i in range(block_id_start, block_id_end+1):
-        if i not in ch_range.keys():
-            return {'error': 'Missing consensus hashes'}
+        block_id, consensus_hash = block_ch
+        ch_range[block_id] = consensus_hash
 
     return ch_range
 
@@ -1367,9 +1864,178 @@ def get_name_blockchain_history(name, start_block, end_block, proxy=None):
     return ret
 
 
-def get_op_history_rows( name, proxy=None ):
+# what we have learned about how servers page history rows
+rpc_page_limits = {}        # (server, port, method) => {'page_size': ..., 'max_rows': ..., 'max_rows_at': ..., 'row_len': ...}
+rpc_page_limits_lock = threading.Lock()
+
+
+def get_rpc_page_size( proxy, method_name ):
+    """
+    How many rows should we ask for in one page of method_name?
+    We start with RPC_PAGE_SIZE_DEFAULT rows, which every server accepts,
+    and double it (up to RPC_PAGE_SIZE_MAX) each time the server sends a
+    full page.  Once we have seen the server's page limit, we use that
+    (for up to RPC_PAGE_LIMIT_TTL seconds, in case the server changes).
+    The page is scaled down so that its reply stays under RPC_PAGE_MAX_BYTES.
+    """
+    key = BlockchainRecordCache.proxy_hostport(proxy) + (method_name,)
+    with rpc_page_limits_lock:
+        limits = rpc_page_limits.get(key, {})
+        if limits.get('max_rows') is not None and time.time() - limits.get('max_rows_at', 0) > RPC_PAGE_LIMIT_TTL:
+            # try the server's limit again
+            limits['max_rows'] = None
+            limits['page_size'] = RPC_PAGE_SIZE_DEFAULT
+
+        limits = dict(limits)
+
+    page_size = limits.get('page_size', RPC_PAGE_SIZE_DEFAULT)
+    if limits.get('max_rows') is not None:
+        page_size = min(page_size, limits['max_rows'])
+
+    if limits.get('row_len') is not None:
+        page_size = min(page_size, RPC_PAGE_MAX_BYTES / max(1, limits['row_len']))
+
+    return max(1, page_size)
+
+
+def note_rpc_page( proxy, method_name, requested, rows, short ):
+    """
+    Learn from a page of rows that the server sent back.
+    If short is True, the server sent fewer rows than requested even
+    though more were available, so its page limit is len(rows).
+    """
+    if len(rows) == 0:
+        return
+
+    key = BlockchainRecordCache.proxy_hostport(proxy) + (method_name,)
+    row_len = len(json.dumps(rows)) / len(rows)
+
+    with rpc_page_limits_lock:
+        limits = rpc_page_limits.setdefault(key, {})
+        limits['row_len'] = max(row_len, limits.get('row_len', 0))
+
+        if short:
+            if limits.get('max_rows') is None or len(rows) < limits['max_rows']:
+                log.debug("Server page limit for %s is %s rows" % (method_name, len(rows)))
+                limits['max_rows'] = len(rows)
+                limits['max_rows_at'] = time.time()
+
+        elif len(rows) == requested and requested >= limits.get('page_size', RPC_PAGE_SIZE_DEFAULT):
+            # the server took a full page; try a bigger one next time
+            limits['page_size'] = min(2 * requested, RPC_PAGE_SIZE_MAX)
+
+
+def note_rpc_page_rejected( proxy, method_name, accepted ):
+    """
+    Learn that the server rejected a bigger page, but accepted
+    one of accepted rows, so we should ask for no more than that.
+    """
+    key = BlockchainRecordCache.proxy_hostport(proxy) + (method_name,)
+    with rpc_page_limits_lock:
+        limits = rpc_page_limits.setdefault(key, {})
+        if limits.get('max_rows') is None or accepted < limits['max_rows']:
+            log.debug("Server page limit for %s is %s rows" % (method_name, accepted))
+            limits['max_rows'] = accepted
+            limits['max_rows_at'] = time.time()
+
+
+def rpc_page_rejected( error ):
+    """
+    Is this error reply the server saying that the page was too big?
+    (as opposed to a network error, a missing record, etc.)
+    """
+    return re.search(RPC_PAGE_REJECTED_PATTERN, str(error.get('error', '')), re.IGNORECASE) is not None
+
+
+def get_paged_rows( proxy, method_name, get_page, num_rows, max_workers=RPC_MAX_CONCURRENCY, offset=0 ):
+    """
+    Fetch rows [offset, offset + num_rows) with get_page(offset, count),
+    which returns a list of rows or {'error': ...}.
+
+    The first page tells us how many rows the server will send
+    at once and how large they are; the remaining pages are then
+    sized accordingly and fetched concurrently.  If the server
+    says a page is too big, we retry with half as many rows.
+    Any other error is passed back as-is.
+
+    Return the list of rows on success, in order.
+    Return {'error': ...} on error.
+    """
+    def fetch_page( page_offset, request_size, remaining ):
+        rejected = False
+        while True:
+            page = get_page(page_offset, request_size)
+            if not json_is_error(page):
+                break
+
+            if request_size <= 1 or not rpc_page_rejected(page):
+                return page
+
+            # the page was too big for the server; try a smaller one
+            log.debug("Failed to get %s rows of %s at %s (%s); retrying with %s" % (request_size, method_name, page_offset, page['error'], request_size / 2))
+            rejected = True
+            request_size = request_size / 2
+
+        if rejected:
+            note_rpc_page_rejected(proxy, method_name, request_size)
+
+        if len(page) > request_size:
+            return {'error': 'server replied too much data'}
+
+        note_rpc_page(proxy, method_name, request_size, page, len(page) < min(request_size, remaining))
+        return page
+
+    def fetch_range( range_info ):
+        # fetch rows [range_offset, range_offset + count), following short pages
+        range_offset, count = range_info
+        rows = []
+        while len(rows) < count:
+            request_size = min(count - len(rows), get_rpc_page_size(proxy, method_name))
+            page = fetch_page(range_offset + len(rows), request_size, offset + num_rows - range_offset - len(rows))
+            if json_is_error(page):
+                return page
+
+            if len(page) == 0:
+                break
+
+            rows += page
+
+        return rows
+
+    if num_rows == 0:
+        return []
+
+    # one page to learn the server's limits
+    first_page = fetch_page( offset, min(num_rows, get_rpc_page_size(proxy, method_name)), num_rows )
+    if json_is_error(first_page):
+        return first_page
+
+    all_rows = first_page
+    if len(all_rows) > 0:
+        page_size = get_rpc_page_size(proxy, method_name)
+        ranges = [(offset + i, min(page_size, num_rows - i)) for i in xrange(len(all_rows), num_rows, page_size)]
+
+        for rows in parallel_imap( fetch_range, ranges, max_workers=get_proxy_concurrency(proxy, max_workers) ):
+            if json_is_error(rows):
+                return rows
+
+            all_rows += rows
+
+    if len(all_rows) != num_rows:
+        # something's wrong--we should have them all
+        log.error("Missing rows from %s: expected %s, got %s" % (method_name, num_rows, len(all_rows)))
+        return {'error': 'Missing rows: expected %s, got %s' % (num_rows, len(all_rows))}
+
+    return all_rows
+
+
+def get_op_history_rows( name, proxy=None, max_workers=RPC_MAX_CONCURRENCY ):
     """
     Get the history rows for a name or namespace.
+    Rows we have already fetched are served from the history cache;
+    only rows added since then are fetched.
+    Return the list of rows on success
+    Return {'error': ...} on error
     """
     history_schema = {
         'type': 'array',
@@ -1449,34 +2115,46 @@ def get_op_history_rows( name, proxy=None ):
         resp = json_traceback()
         return resp
 
-    history_rows = []
-    history_rows_count = history_rows_count['count']
-    page_size = 10
-    while len(history_rows) < history_rows_count:
+    def get_page( offset, count ):
         resp = {}
         try:
-            resp = proxy.get_op_history_rows(name, len(history_rows), page_size)
+            resp = proxy.get_op_history_rows(name, offset, count)
             resp = json_validate( resp_schema, resp )
             if json_is_error(resp):
                 return resp
 
-            history_rows += resp['history_rows']
-        
-            if os.environ.get("BLOCKSTACK_TEST", None) == "1":
-                if len(resp['history_rows']) != page_size:
-                    if len(history_rows) != history_rows_count:
-                        # something's wrong--we should have them all 
-                        raise Exception('Missing history rows: expected %s, got %s' % (history_rows_count, len(history_rows)))
-
         except ValidationError as e:
             log.exception(e)
             resp = json_traceback(resp.get('error'))
             return resp
 
+        return resp['history_rows']
+
+    # a history only grows, so if we have seen some of it, only fetch the rest
+    history_rows_count = history_rows_count['count']
+    server, port = BlockchainRecordCache.proxy_hostport(proxy)
+    cached_rows = None
+    if server is not None and port is not None:
+        cached_rows = op_history_cache.get(server, port, name)
+
+    if cached_rows is not None and len(cached_rows) == history_rows_count:
+        return list(cached_rows)
+
+    if cached_rows is None or len(cached_rows) > history_rows_count:
+        cached_rows = []
+
+    new_rows = get_paged_rows( proxy, 'get_op_history_rows', get_page, history_rows_count - len(cached_rows), max_workers=max_workers, offset=len(cached_rows) )
+    if json_is_error(new_rows):
+        return new_rows
+
+    history_rows = cached_rows + new_rows
+    if server is not None and port is not None:
+        op_history_cache.put(server, port, name, history_rows)
+
     return history_rows
 
 
-def get_nameops_affected_at( block_id, proxy=None ):
+def get_nameops_affected_at( block_id, proxy=None, max_workers=RPC_MAX_CONCURRENCY ):
     """
     Get the *current* states of the name records that were
     affected at the given block height.
@@ -1538,33 +2216,22 @@ def get_nameops_affected_at( block_id, proxy=None ):
         num_nameops = json_traceback()
         return num_nameops
 
-    num_nameops = num_nameops['count']
-
-    # grab at most 10 of these at a time
-    all_nameops = []
-    page_size = 10
-    while len(all_nameops) < num_nameops:
+    def get_page( offset, count ):
         resp = {}
         try:
-            resp = proxy.get_nameops_affected_at(block_id, len(all_nameops), page_size)
+            resp = proxy.get_nameops_affected_at(block_id, offset, count)
             resp = json_validate( nameop_schema, resp )
             if json_is_error(resp):
                 return resp
 
-            all_nameops += resp['nameops']
-
-            if os.environ.get("BLOCKSTACK_TEST", None) == "1":
-                if len(resp['nameops']) != page_size:
-                    if len(all_nameops) != num_nameops:
-                        # something's wrong--we should have them all 
-                        raise Exception('Missing nameops: expected %s, got %s' % (num_nameops, len(all_nameops)))
-            
         except ValidationError as e:
             log.exception(e)
             resp = json_traceback(resp.get('error'))
             return resp
 
-    return all_nameops
+        return resp['nameops']
+
+    return get_paged_rows( proxy, 'get_nameops_affected_at', get_page, num_nameops['count'], max_workers=max_workers )
 
 
 def get_nameops_at( block_id, proxy=None ):
@@ -1574,6 +2241,8 @@ def get_nameops_at( block_id, proxy=None ):
     Return the list of operations on success, ordered by transaction index.
     Return {'error': ...} on error.
     """
+    if proxy is None:
+        proxy = get_default_proxy()
 
     all_nameops = get_nameops_affected_at( block_id, proxy=proxy )
     if json_is_error(all_nameops):
@@ -1582,27 +2251,56 @@ def get_nameops_at( block_id, proxy=None ):
 
     log.debug("%s nameops at %s" % (len(all_nameops), block_id))
 
-    # get the history for each nameop 
+    # get the history for each name, several names at a time.
+    # If the nameop has a 'name' field, then it's not an outstanding preorder.
+    # Outstanding preorders have no history, so we don't need to worry about 
+    # getting history for them.
+    history_names = list(set([nameop['name'] for nameop in all_nameops if nameop.has_key('name')]))
+    get_history = lambda name: get_op_history_rows( name, proxy=proxy, max_workers=1 )
+
+    nameop_histories = {}
+    for (name, history_rows) in zip(history_names, parallel_imap( get_history, history_names, max_workers=get_proxy_concurrency(proxy) )):
+        if json_is_error(history_rows):
+            return history_rows
+
+        nameop_histories[name] = history_rows
+
+    # replay each name's history once, and keep the replay for the next block
+    # (a name's history only changes if it gets new rows)
+    server, port = BlockchainRecordCache.proxy_hostport(proxy)
+    nameop_replays = {}
+    for nameop in all_nameops:
+        if not nameop.has_key('name') or nameop_replays.has_key(nameop['name']):
+            continue
+
+        name = nameop['name']
+        history_rows = nameop_histories[name]
+
+        replay = None
+        if server is not None and port is not None:
+            replay = op_history_replay_cache.get(server, port, name, len(history_rows))
+
+        if replay is None:
+            # NOTE: restoring doesn't modify the history, so it can be shared
+            replay = NameHistoryReplay( nameop, nameop_history_extract( history_rows ) )
+            if server is not None and port is not None:
+                op_history_replay_cache.put(server, port, name, len(history_rows), replay)
+
+        nameop_replays[name] = replay
+
     nameops = []
-    nameop_histories = {}   # cache histories
     for nameop in all_nameops:
         # get history (if not a preorder)
         history_rows = []
         if nameop.has_key('name'):
-            # If the nameop has a 'name' field, then it's not an outstanding preorder.
-            # Outstanding preorders have no history, so we don't need to worry about 
-            # getting history for them.
-            history_rows = nameop_histories.get(nameop['name'])
-            if history_rows is None:
-                history_rows = get_op_history_rows( nameop['name'], proxy=proxy )
-                if json_is_error(history_rows):
-                    return history_rows
-
-                nameop_histories[nameop['name']] = history_rows
+            history_rows = nameop_histories[nameop['name']]
+            replay = nameop_replays[nameop['name']]
+        else:
+            replay = NameHistoryReplay( nameop, {} )
 
         # restore history
-        history = nameop_history_extract( history_rows )
-        historic_nameops = nameop_restore_from_history( nameop, history, block_id )
+        history = replay.name_history
+        historic_nameops = replay.restore( block_id )
 
         log.debug("%s had %s operations (%s history rows, %s historic nameops, txids: %s) at %s" % 
                 (nameop.get('name', "UNKNOWN"), len(history.get(block_id, [])), len(history_rows), len(historic_nameops), [op['txid'] for op in historic_nameops], block_id))
@@ -1659,13 +2357,32 @@ def get_nameops_hash_at(block_id, proxy=None):
     return resp['ops_hash']
 
 
-def get_name_blockchain_record(name, proxy=None):
+def get_name_blockchain_record(name, proxy=None, use_cache=True):
     """
     get_name_blockchain_record
     Return the blockchain-extracted information on success.
     Return {'error': ...} on error
+
+    The record is served from the in-process cache if it was
+    fetched at the current block height, unless use_cache is False.
     """
+    if proxy is None:
+        proxy = get_default_proxy()
+
+    if use_cache and BLOCKCHAIN_RECORD_CACHE_ENABLED:
+        fetch = lambda: get_name_blockchain_record(name, proxy=proxy, use_cache=False)
+        return blockchain_record_cache.lookup(proxy, 'name', name, fetch)
+
+    resp = proxy.get_name_blockchain_record(name)
+    return name_record_response_extract(resp)
 
+
+def name_record_response_extract( resp ):
+    """
+    Validate a server's (JSON-decoded) reply to get_name_blockchain_record
+    Return the name record on success
+    Return {'error': ...} on error
+    """
     nameop_schema = {
         'type': 'object',
         'properties': NAMEOP_SCHEMA_PROPERTIES,
@@ -1684,12 +2401,7 @@ def get_name_blockchain_record(name, proxy=None):
 
     resp_schema = json_response_schema( rec_schema )
 
-    if proxy is None:
-        proxy = get_default_proxy()
-
-    resp = {}
     try:
-        resp = proxy.get_name_blockchain_record(name)
         resp = json_validate(resp_schema, resp)
         if json_is_error(resp):
             return resp
@@ -1702,10 +2414,116 @@ def get_name_blockchain_record(name, proxy=None):
     return resp['record']
 
 
-def get_namespace_blockchain_record(namespace_id, proxy=None):
+def get_name_blockchain_records_multicall( names, proxy ):
+    """
+    Fetch name records in one round trip with system.multicall.
+    Return {name: record or {'error': ...}} on success
+    Raise on failure (i.e. if the server does not support system.multicall)
+    """
+    multicall = MultiCall(proxy.srv)
+    for name in names:
+        multicall.get_name_blockchain_record(name)
+
+    results = multicall()
+
+    ret = {}
+    for i in xrange(0, len(names)):
+        try:
+            resp = json.loads(results[i])
+        except Fault, f:
+            ret[names[i]] = {'error': 'Remote RPC error: %s' % f.faultString}
+            continue
+        except (ValueError, TypeError):
+            log.error('Server replied invalid JSON')
+            ret[names[i]] = {'error': 'Server replied invalid JSON'}
+            continue
+
+        ret[names[i]] = name_record_response_extract(resp)
+
+    return ret
+
+
+def get_name_blockchain_records( names, proxy=None, use_cache=True, batch_size=100 ):
+    """
+    Get the blockchain records for many names at once.
+    Uses system.multicall to fetch up to batch_size records per round trip
+    (several batches at once), and falls back to single lookups for a
+    batch if its multicall fails (i.e. the server does not support it).
+    Cached records are used if they are still fresh.
+
+    Return {name: record} on success.  A name whose record could
+    not be fetched maps to {'error': ...} instead.
+    """
+    if proxy is None:
+        proxy = get_default_proxy()
+
+    names = list(set(names))
+    ret = {}
+
+    block_height = None
+    if use_cache and BLOCKCHAIN_RECORD_CACHE_ENABLED:
+        block_height = blockchain_record_cache.get_block_height(proxy)
+
+    if block_height is not None:
+        for name in names:
+            rec = blockchain_record_cache.get(proxy, 'name', name, block_height)
+            if rec is not None:
+                ret[name] = rec
+
+    missing = [name for name in names if not ret.has_key(name)]
+    batches = [missing[i:i+batch_size] for i in xrange(0, len(missing), batch_size)]
+    max_workers = get_proxy_concurrency(proxy)
+
+    def fetch_one( name ):
+        try:
+            return get_name_blockchain_record(name, proxy=proxy, use_cache=False)
+        except Exception, e:
+            if DEBUG:
+                log.exception(e)
+
+            log.error("Failed to get name record for %s: %s" % (name, e))
+            return {'error': 'Failed to get name record: %s' % e}
+
+    def fetch_batch( batch ):
+        if hasattr(proxy, 'srv'):
+            try:
+                return get_name_blockchain_records_multicall(batch, proxy)
+            except Exception, e:
+                if DEBUG:
+                    log.exception(e)
+
+                log.debug("system.multicall failed for %s names; falling back to single lookups" % len(batch))
+
+        return dict( (name, fetch_one(name)) for name in batch )
+
+    fetched = {}
+    for res in parallel_imap( fetch_batch, batches, max_workers=max_workers ):
+        fetched.update(res)
+
+    for (name, rec) in fetched.items():
+        if block_height is not None and not json_is_error(rec):
+            blockchain_record_cache.put(proxy, 'name', name, block_height, rec)
+
+        ret[name] = rec
+
+    return ret
+
+
+def get_namespace_blockchain_record(namespace_id, proxy=None, use_cache=True):
     """
     get_namespace_blockchain_record
+    Return the namespace record on success.
+    Return {'error': ...} on error
+
+    The record is served from the in-process cache if it was
+    fetched at the current block height, unless use_cache is False.
     """
+    if proxy is None:
+        proxy = get_default_proxy()
+
+    if use_cache and BLOCKCHAIN_RECORD_CACHE_ENABLED:
+        fetch = lambda: get_namespace_blockchain_record(namespace_id, proxy=proxy, use_cache=False)
+        return blockchain_record_cache.lookup(proxy, 'namespace', namespace_id, fetch)
 
     namespace_schema = {
         'type': 'object',
@@ -1942,6 +2760,7 @@ def get_atlas_peers( hostport, timeout=30, my_hostport=None, proxy=None ):
 def get_zonefiles( hostport, zonefile_hashes, timeout=30, my_hostport=None, proxy=None ):
     """
     Get a set of zonefiles from the given server.
+    Zonefiles that do not match their hashes are left out.
     Return {'status': True, 'zonefiles': {hash: data, ...}} on success
     Return {'error': ...} on error
     """
@@ -1985,7 +2804,10 @@ def get_zonefiles( hostport, zonefile_hashes, timeout=30, my_hostport=None, prox
 
         for zf_hash, zf_data_b64 in zf_payload['zonefiles'].items():
             zf_data = base64.b64decode( zf_data_b64 )
-            assert storage.verify_zonefile( zf_data, zf_hash ), "Zonefile data mismatch"
+            if not storage.verify_zonefile( zf_data, zf_hash ):
+                # leave it out, so the caller can look for it elsewhere
+                log.error("Zonefile data mismatch for %s" % zf_hash)
+                continue
 
             # valid 
             decoded_zonefiles[ zf_hash ] = zf_data
@@ -29,6 +29,8 @@ import time
 import atexit
 import socket
 import types
+import threading
+import Queue
 
 from defusedxml import xmlrpc
 
@@ -40,6 +42,13 @@ import json
 import config as blockstack_config
 import backend
 import proxy
+import storage
+import immutable_cache
+import history_cache
+import snv_trust
+import spv_cache
+import consensus_cache
+import profile
 
 from method_parser import parse_methods
 
@@ -49,6 +58,12 @@ from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
 
 running = False
 
+# concurrency classes of RPC methods:
+# serial methods (i.e. anything that touches the wallet or the queues) run one at a time,
+# while parallel (read-only) methods run alongside everything else.
+RPC_CONCURRENCY_SERIAL = "serial"
+RPC_CONCURRENCY_PARALLEL = "parallel"
+
 if os.environ.get("BLOCKSTACK_RPC_INITIALIZED_METHODS", None) is None:
     RPC_INTERNAL_METHODS = None
 
@@ -197,6 +212,37 @@ def ping():
     return True
 
 
+# cache statistics
+def get_cache_stats():
+    """
+    Get hit/miss statistics for the client's caches,
+    and the state of the zonefile publishing circuit breakers
+    """
+    return {
+        'immutable_data': immutable_cache.get_immutable_cache_stats(),
+        'blockchain_records': proxy.get_blockchain_record_cache_stats(),
+        'history': history_cache.get_history_cache_stats(),
+        'history_replays': history_cache.get_history_replay_cache_stats(),
+        'connection_pool': proxy.get_connection_pool_stats(),
+        'storage_drivers': storage.get_storage_driver_stats(),
+        'snv_trust_store': snv_trust.get_snv_trust_store_stats(),
+        'spv_blocks': spv_cache.get_spv_block_cache_stats(),
+        'consensus_hashes': consensus_cache.get_consensus_hash_cache_stats(),
+        'atlas_server_breakers': profile.get_atlas_server_breaker_stats(),
+    }
+
+
+# endpoint statistics
+def get_rpc_stats():
+    """
+    Get the RPC endpoint's request queue depth and per-method latencies
+    """
+    if BlockstackAPIEndpoint.RPC_SERVER_INST is None:
+        return {'error': 'RPC endpoint is not running'}
+
+    return BlockstackAPIEndpoint.RPC_SERVER_INST.get_stats()
+
+
 class BlockstackAPIEndpointHandler(SimpleXMLRPCRequestHandler):
     """
     Hander to capture tracebacks
@@ -206,7 +252,7 @@ class BlockstackAPIEndpointHandler(SimpleXMLRPCRequestHandler):
             return json.dumps({'error': 'No such method'})
 
         try: 
-            res = self.server.funcs[str(method)](*params)
+            res = self.server.call_function(str(method), params)
 
             # lol jsonrpc within xmlrpc
             return json.dumps(res)
@@ -225,11 +271,12 @@ class BlockstackAPIEndpoint(SimpleXMLRPCServer):
 
     RPC_SERVER_INST = None
 
-    def register_function( self, func, name=None, server=True ):
+    def register_function( self, func, name=None, server=True, concurrency=RPC_CONCURRENCY_SERIAL ):
         """
         Register a function with the RPC server,
         and also with the internal RPC container.
         Optionall don't register on the server.
+        @concurrency is the function's concurrency class (serial or parallel)
         """
         if server:
             SimpleXMLRPCServer.register_function(self, func, name)
@@ -237,9 +284,183 @@ class BlockstackAPIEndpoint(SimpleXMLRPCServer):
         if name is None:
             name = func.__name__
 
+        self.method_concurrency[name] = concurrency
         setattr(self.internal_proxy, name, func)
 
 
+    def call_function( self, name, params ):
+        """
+        Call a registered function on behalf of a client,
+        respecting its concurrency class, and record its latency.
+        Return its result (raise if it raises)
+        """
+        func = self.funcs[name]
+        concurrency = self.method_concurrency.get(name, RPC_CONCURRENCY_SERIAL)
+
+        with self.stats_lock:
+            method_stats = self.get_method_stats(name)
+            method_stats['in_flight'] += 1
+
+        start = time.time()
+        wait_time = 0.0
+        failed = True
+        try:
+            if concurrency == RPC_CONCURRENCY_SERIAL:
+                with self.serial_lock:
+                    wait_time = time.time() - start
+                    res = func(*params)
+
+            else:
+                res = func(*params)
+
+            failed = isinstance(res, dict) and 'error' in res
+            return res
+
+        finally:
+            duration = time.time() - start
+            with self.stats_lock:
+                method_stats['in_flight'] -= 1
+                method_stats['calls'] += 1
+                method_stats['total_time'] += duration
+                method_stats['max_time'] = max(method_stats['max_time'], duration)
+                method_stats['wait_time'] += wait_time
+                if failed:
+                    method_stats['errors'] += 1
+
+
+    def _dispatch( self, method, params ):
+        """
+        Dispatch a call from system.multicall,
+        so it gets the same treatment as any other call.
+        """
+        if not self.funcs.has_key(method):
+            raise Exception('method "%s" is not supported' % method)
+
+        return self.call_function(method, params)
+
+
+    def get_method_stats( self, name ):
+        """
+        Get the counters for a method, creating them if need be.
+        Must be called with the stats lock held.
+        """
+        if not self.method_stats.has_key(name):
+            self.method_stats[name] = {
+                'calls': 0,
+                'errors': 0,
+                'in_flight': 0,
+                'total_time': 0.0,
+                'max_time': 0.0,
+                'wait_time': 0.0,
+            }
+
+        return self.method_stats[name]
+
+
+    def get_stats( self ):
+        """
+        Get the request queue depth and each method's latency
+        """
+        with self.stats_lock:
+            ret = {
+                'max_workers': self.max_workers,
+                'active_requests': self.active_requests,
+                'queued_requests': self.request_queue.qsize(),
+                'methods': {},
+            }
+
+            for (name, method_stats) in self.method_stats.items():
+                ret['methods'][name] = {
+                    'concurrency': self.method_concurrency.get(name, RPC_CONCURRENCY_SERIAL),
+                    'calls': method_stats['calls'],
+                    'errors': method_stats['errors'],
+                    'in_flight': method_stats['in_flight'],
+                    'mean_time': (method_stats['total_time'] / method_stats['calls']) if method_stats['calls'] > 0 else None,
+                    'max_time': method_stats['max_time'],
+                    'mean_wait_time': (method_stats['wait_time'] / method_stats['calls']) if method_stats['calls'] > 0 else None,
+                }
+
+        return ret
+
+
+    def process_request( self, request, client_address ):
+        """
+        Hand an accepted connection off to a worker thread
+        (or handle it here, if we only have one worker).
+        """
+        if self.max_workers <= 1:
+            return SimpleXMLRPCServer.process_request(self, request, client_address)
+
+        # if too many requests are waiting, stop accepting new ones
+        # until the workers catch up (NOTE: a timeout keeps us interruptible)
+        while True:
+            try:
+                self.request_queue.put( (request, client_address), timeout=1.0 )
+                break
+            except Queue.Full:
+                if not running:
+                    # shutting down; don't wait on the workers
+                    log.debug("Dropping request from %s: server is stopping" % str(client_address))
+                    self.shutdown_request(request)
+                    return
+
+                log.debug("%s requests waiting for a worker" % self.request_queue.qsize())
+
+
+    def request_worker( self ):
+        """
+        Worker thread: handle accepted connections until told to stop
+        """
+        while True:
+            item = self.request_queue.get()
+            if item is None:
+                return
+
+            request, client_address = item
+            with self.stats_lock:
+                self.active_requests += 1
+
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self.stats_lock:
+                    self.active_requests -= 1
+
+
+    def start_workers( self ):
+        """
+        Start the worker threads
+        """
+        if self.max_workers <= 1:
+            return
+
+        for i in xrange(0, self.max_workers):
+            t = threading.Thread(target=self.request_worker)
+            t.daemon = True
+            t.start()
+            self.workers.append(t)
+
+
+    def stop_workers( self ):
+        """
+        Stop the worker threads, once they finish the requests they already have
+        """
+        for t in self.workers:
+            try:
+                self.request_queue.put( None, timeout=self.timeout )
+            except Queue.Full:
+                log.error("Request queue is stuck; not waiting for workers")
+                return
+
+        for t in self.workers:
+            t.join( self.timeout )
+
+        self.workers = []
+
+
     @classmethod
     def get_internal_proxy(cls):
         return cls.RPC_SERVER_INST.internal_proxy
@@ -254,7 +475,13 @@ class BlockstackAPIEndpoint(SimpleXMLRPCServer):
         """
       
         # pinger 
-        self.register_function( ping, name="ping", server=server )
+        self.register_function( ping, name="ping", server=server, concurrency=RPC_CONCURRENCY_PARALLEL )
+
+        # cache statistics
+        self.register_function( get_cache_stats, name="get_cache_stats", server=server, concurrency=RPC_CONCURRENCY_PARALLEL )
+
+        # endpoint statistics
+        self.register_function( get_rpc_stats, name="get_rpc_stats", server=server, concurrency=RPC_CONCURRENCY_PARALLEL )
 
         # register the command-line methods (will all start with cli_)
         # methods will be named after their *action*
@@ -270,7 +497,11 @@ class BlockstackAPIEndpoint(SimpleXMLRPCServer):
 
             log.debug("Register CLI method '%s' as '%s'" % (method.__name__, method_name))
 
-            self.register_function( local_rpc_factory( method_info, config_path ), name=method_name, server=server )
+            concurrency = RPC_CONCURRENCY_SERIAL
+            if 'parallel' in method_info['pragmas']:
+                concurrency = RPC_CONCURRENCY_PARALLEL
+
+            self.register_function( local_rpc_factory( method_info, config_path ), name=method_name, server=server, concurrency=concurrency )
     
         # register all plugin methods 
         for plugin_or_plugin_name in plugins:
@@ -309,10 +540,18 @@ class BlockstackAPIEndpoint(SimpleXMLRPCServer):
                         method_list.append(method)
 
 
+            # read-only methods that can run alongside other requests
+            parallel_method_list = getattr(mod_plugin, "RPC_PARALLEL_METHODS", [])
+
             for method in method_list:
                 if callable(method) or hasattr(method, '__call__'):
                     log.debug("Register plugin method '%s_%s'" % (plugin_prefix, method.__name__))
-                    self.register_function( method, name=(plugin_prefix + "_" + method.__name__), server=server )
+
+                    concurrency = RPC_CONCURRENCY_SERIAL
+                    if method in parallel_method_list:
+                        concurrency = RPC_CONCURRENCY_PARALLEL
+
+                    self.register_function( method, name=(plugin_prefix + "_" + method.__name__), server=server, concurrency=concurrency )
 
                 else:
                     log.error("Skipping non-method '%s'" % method)
@@ -329,7 +568,8 @@ class BlockstackAPIEndpoint(SimpleXMLRPCServer):
         return True
 
 
-    def __init__(self, host='localhost', port=blockstack_config.DEFAULT_API_PORT, plugins=None, handler=BlockstackAPIEndpointHandler, config_path=blockstack_config.CONFIG_PATH, timeout=30, server=True ):
+    def __init__(self, host='localhost', port=blockstack_config.DEFAULT_API_PORT, plugins=None, handler=BlockstackAPIEndpointHandler, config_path=blockstack_config.CONFIG_PATH, timeout=30, server=True,
+                       max_workers=blockstack_config.API_ENDPOINT_MAX_WORKERS, max_queued=blockstack_config.API_ENDPOINT_MAX_QUEUED ):
         
         if server:
             SimpleXMLRPCServer.__init__( self, (host,port), handler, allow_none=True )
@@ -344,12 +584,30 @@ class BlockstackAPIEndpoint(SimpleXMLRPCServer):
         self.config_path = config_path
         self.internal_proxy = RPCInternalProxy()
 
+        # concurrency control and statistics
+        self.max_workers = max_workers
+        self.request_queue = Queue.Queue( max(1, max_queued) )
+        self.workers = []
+        self.serial_lock = threading.Lock()
+        self.method_concurrency = {}
+        self.stats_lock = threading.Lock()
+        self.method_stats = {}
+        self.active_requests = 0
+
         self.register_api_functions( config_path, plugins, server=server ) 
 
         if server:
             self.register_introspection_functions()
             self.register_multicall_functions()
 
+            # system.* methods dispatch to (or describe) other methods, which take care of their own locking
+            for name in self.funcs.keys():
+                if name.startswith("system."):
+                    self.method_concurrency[name] = RPC_CONCURRENCY_PARALLEL
+
+            BlockstackAPIEndpoint.RPC_SERVER_INST = self
+            self.start_workers()
+
 
     def shutdown_plugins(self):
         """
@@ -371,19 +629,20 @@ def get_default_plugins():
     return [backend]
 
 
-def make_local_rpc_server( portnum, config_path=blockstack_config.CONFIG_PATH, plugins=None ):
+def make_local_rpc_server( portnum, config_path=blockstack_config.CONFIG_PATH, plugins=None, max_workers=blockstack_config.API_ENDPOINT_MAX_WORKERS ):
     """
     Make a local RPC server instance.
     It will be derived from BaseHTTPServer.HTTPServer.
     @plugins can be a list of modules, or a list of strings that
     identify module names to import.
+    @max_workers is the number of requests to handle at once.
 
     Returns the global server instance on success.
     """
     plugins = [] if plugins is None else plugins
 
     plugins = get_default_plugins() + plugins 
-    srv = BlockstackAPIEndpoint( port=portnum, config_path=config_path, plugins=plugins )
+    srv = BlockstackAPIEndpoint( port=portnum, config_path=config_path, plugins=plugins, max_workers=max_workers )
     return srv
 
 
@@ -419,6 +678,7 @@ def local_rpc_server_stop( srv ):
     """
     Stop a running RPC server
     """
+    srv.stop_workers()
     srv.shutdown_plugins()
 
 
@@ -658,9 +918,18 @@ def local_rpc_start( portnum, config_dir=blockstack_config.CONFIG_DIR, foregroun
     load_rpc_internal_methods( config_path )
     log.debug("Finished loading RPC methods")
 
+    # how many requests to handle at once?
+    conf = blockstack_config.get_config( config_path )
+    max_workers = blockstack_config.API_ENDPOINT_MAX_WORKERS
+    if conf is not None and conf.has_key('api_endpoint_max_workers'):
+        try:
+            max_workers = max(1, int(conf['api_endpoint_max_workers']))
+        except ValueError:
+            log.error("Invalid api_endpoint_max_workers '%s'; using %s" % (conf['api_endpoint_max_workers'], max_workers))
+
     # make server
     try:
-        rpc_srv = make_local_rpc_server( portnum, config_path=config_path ) 
+        rpc_srv = make_local_rpc_server( portnum, config_path=config_path, max_workers=max_workers ) 
     except socket.error, se:
         if os.environ.get("BLOCKSTACK_DEBUG", None) == "1":
             log.exception(se)
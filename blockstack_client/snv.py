@@ -38,6 +38,8 @@ import blockstack_profiles
 import urllib
 
 from .backend.blockchain import get_bitcoind_client
+from .snv_trust import get_trusted_consensus_store
+from .spv_cache import get_spv_block_cache, get_spv_header_sync, get_spv_header_index
 
 from keys import *
 from proxy import *
@@ -65,7 +67,9 @@ def txid_to_block_data(txid, bitcoind_proxy, proxy=None):
     Given a txid, get its block's data.
 
     Use SPV to verify the information we receive from the (untrusted)
-    bitcoind host.
+    bitcoind host.  Blocks that have already been verified are
+    remembered in the SPV block cache, in which case the block data
+    only has the block's 'hash', 'height', 'merkleroot' and 'tx' (txids).
 
     @bitcoind_proxy must be a BitcoindConnection (from virtualchain.lib.session)
 
@@ -76,11 +80,21 @@ def txid_to_block_data(txid, bitcoind_proxy, proxy=None):
     if proxy is None:
         proxy = get_default_proxy()
 
+    block_cache = get_spv_block_cache()
+    header_index = get_spv_header_index(proxy.spv_headers_path)
+
     timeout = 1.0
     while True:
         try:
             untrusted_tx_data = bitcoind_proxy.getrawtransaction(txid, 1)
             untrusted_block_hash = untrusted_tx_data['blockhash']
+
+            if block_cache is not None:
+                cached_block_data = block_cache.get(block_hash=untrusted_block_hash, header_index=header_index)
+                if cached_block_data is not None and txid in cached_block_data['tx']:
+                    # already verified
+                    return (untrusted_block_hash, cached_block_data, untrusted_tx_data)
+
             untrusted_block_data = bitcoind_proxy.getblock(untrusted_block_hash)
             break
         except (OSError, IOError), ie:
@@ -95,7 +109,7 @@ def txid_to_block_data(txid, bitcoind_proxy, proxy=None):
 
     # first, can we trust this block? is it in the SPV headers?
     untrusted_block_header_hex = virtualchain.block_header_to_hex(untrusted_block_data, untrusted_block_data['previousblockhash'])
-    block_id = SPVClient.block_header_index(proxy.spv_headers_path, (untrusted_block_header_hex + "00").decode('hex'))
+    block_id = header_index.block_header_index((untrusted_block_header_hex + "00").decode('hex'))
     if block_id < 0:
         # bad header
         log.error("Block header '%s' is not in the SPV headers (%s)" % (untrusted_block_header_hex, proxy.spv_headers_path))
@@ -116,6 +130,9 @@ def txid_to_block_data(txid, bitcoind_proxy, proxy=None):
     block_data = untrusted_block_data
     tx_data = untrusted_tx_data
 
+    if block_cache is not None:
+        block_cache.put(block_hash, block_id, block_data['merkleroot'], block_data['tx'])
+
     return (block_hash, block_data, tx_data)
 
 
@@ -124,6 +141,7 @@ def serial_number_to_tx(serial_number, bitcoind_proxy, proxy=None):
     Convert a serial number into its transaction in the blockchain.
     Use an untrusted bitcoind connection to get the list of transactions,
     and use trusted SPV headers to ensure that the transaction obtained is on the main chain.
+    Blocks that have already been verified are remembered in the SPV block cache.
     @bitcoind_proxy must be a BitcoindConnection (from virtualchain.lib.session)
 
     Return the SPV-verified transaction object (as a dict) on success
@@ -137,53 +155,70 @@ def serial_number_to_tx(serial_number, bitcoind_proxy, proxy=None):
     block_id = int(parts[0])
     tx_index = int(parts[1])
 
-    timeout = 1.0
-    while True:
-        try:
-            block_hash = bitcoind_proxy.getblockhash(block_id)
-            block_data = bitcoind_proxy.getblock(block_hash)
-            break
-        except Exception, e:
-            log.error("Unable to obtain block data; retrying...")
-            time.sleep(timeout)
-            timeout = timeout * 2 + random.random() * timeout
+    block_cache = get_spv_block_cache()
+    block_txids = None
+
+    if block_cache is not None:
+        block_data = block_cache.get(block_height=block_id, header_index=get_spv_header_index(proxy.spv_headers_path))
+        if block_data is not None:
+            # already verified
+            block_txids = block_data['tx']
+
+    if block_txids is None:
+        # only waits on a sync if the headers are behind block_id
+        header_sync = get_spv_header_sync(proxy.spv_headers_path, bitcoind_proxy.opts['bitcoind_server'], proxy.conf['path'])
+        rc = header_sync.ensure_height(block_id)
+        if not rc:
+            log.error("Failed to synchronize SPV header chain up to %s" % block_id)
+            return None
+
+        timeout = 1.0
+        while True:
+            try:
+                block_hash = bitcoind_proxy.getblockhash(block_id)
+                block_data = bitcoind_proxy.getblock(block_hash)
+                break
+            except Exception, e:
+                log.error("Unable to obtain block data; retrying...")
+                time.sleep(timeout)
+                timeout = timeout * 2 + random.random() * timeout
 
-    rc = SPVClient.sync_header_chain(proxy.spv_headers_path, bitcoind_proxy.opts['bitcoind_server'], block_id)
-    if not rc:
-        log.error("Failed to synchronize SPV header chain up to %s" % block_id)
-        return None
+        # verify block header
+        rc = SPVClient.block_header_verify(proxy.spv_headers_path, block_id, block_hash, block_data)
+        if not rc:
+            log.error("Failed to verify block header for %s against SPV headers" % block_id)
+            return None
 
-    # verify block header
-    rc = SPVClient.block_header_verify(proxy.spv_headers_path, block_id, block_hash, block_data)
-    if not rc:
-        log.error("Failed to verify block header for %s against SPV headers" % block_id)
-        return None
+        # verify block txs
+        rc = SPVClient.block_verify(block_data, block_data['tx'])
+        if not rc:
+            log.error("Failed to verify block transaction IDs for %s against SPV headers" % block_id)
+            return None
 
-    # verify block txs
-    rc = SPVClient.block_verify(block_data, block_data['tx'])
-    if not rc:
-        log.error("Failed to verify block transaction IDs for %s against SPV headers" % block_id)
-        return None
+        block_txids = block_data['tx']
+
+        if block_cache is not None:
+            block_cache.put(block_hash, block_id, block_data['merkleroot'], block_txids)
 
     # sanity check
-    if tx_index >= len(block_data['tx']):
-        log.error("Serial number %s references non-existant transaction %s (out of %s txs)" % (serial_number, tx_index, len(block_data['tx'])))
+    if tx_index >= len(block_txids):
+        log.error("Serial number %s references non-existant transaction %s (out of %s txs)" % (serial_number, tx_index, len(block_txids)))
         return None
 
     # obtain transaction
-    txid = block_data['tx'][tx_index]
+    txid = block_txids[tx_index]
     tx = bitcoind_proxy.getrawtransaction(txid, 1)
 
     # verify tx
-    rc = SPVClient.tx_verify(block_data['tx'], tx)
+    rc = SPVClient.tx_verify(block_txids, tx)
     if not rc:
         log.error("Failed to verify block transaction %s against SPV headers" % txid)
         return None
 
     # verify tx index
-    if tx_index != SPVClient.tx_index(block_data['tx'], tx):
+    if tx_index != SPVClient.tx_index(block_txids, tx):
         log.error("TX index mismatch: serial number identifies transaction number %s (%s), but got transaction %s" % \
-                (tx_index, block_data['tx'][tx_index], block_data['tx'][ SPVClient.tx_index(block_data['tx'], tx) ]))
+                (tx_index, block_txids[tx_index], block_txids[ SPVClient.tx_index(block_txids, tx) ]))
         return None
 
     # success!
@@ -249,12 +284,38 @@ def get_consensus_hash_from_tx(tx):
         return consensus_hash
 
 
-def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, consensus_hash, proxy=None):
+def snv_verified_hashes(current_block_id, current_consensus_hash):
+    """
+    Make a container for the consensus hashes and ops hashes verified from
+    a trusted block ID and consensus hash, so several snv_get_nameops_at()
+    calls against the same trust root can share their skip-list walks.
+    """
+    return {
+        'block_id': current_block_id,
+        'consensus_hash': current_consensus_hash,
+        'consensus_hashes': {
+            current_block_id: current_consensus_hash
+        },
+        'nameops_hashes': {},
+    }
+
+
+def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, consensus_hash, proxy=None, trust_store=None, verified_hashes=None):
     """
     Simple name verification (snv) lookup:
     Use a known-good "current" consensus hash and block ID to
     look up a set of name operations from the past, given the previous
     point in time's untrusted block ID and consensus hash.
+
+    Consensus hashes and ops hashes verified along the way are remembered
+    in @trust_store (default: the persistent SNV trust store, if enabled),
+    so later lookups can stop walking as soon as they reach a block
+    that has already been verified.
+
+    If @verified_hashes is given (from snv_verified_hashes(), for the same
+    trusted block ID and consensus hash), the walk starts from everything
+    verified by earlier calls that shared it, and adds to it what this
+    call verifies.
     """
 
     log.debug("verify %s-%s to %s-%s" % (current_block_id, current_consensus_hash, block_id, consensus_hash))
@@ -262,6 +323,9 @@ def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, conse
     if proxy is None:
         proxy = get_default_proxy()
 
+    if trust_store is None:
+        trust_store = get_trusted_consensus_store()
+
     # work backwards in time, using a Merkle skip-list constructed
     # by blockstackd over the set of consensus hashes.
     next_block_id = current_block_id
@@ -271,9 +335,50 @@ def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, conse
         next_block_id: current_consensus_hash
     }
 
+    # blocks whose consensus hash has been checked against their ops hash and prior consensus hashes
+    verified_block_ids = set([])
+    verified_any = False
+
+    if verified_hashes is not None:
+        assert verified_hashes['block_id'] == current_block_id and verified_hashes['consensus_hash'] == current_consensus_hash, "Verified hashes are from a different trust root"
+
+        # NOTE: copies, since we only share what we manage to verify
+        prev_nameops_hashes.update( verified_hashes['nameops_hashes'] )
+        prev_consensus_hashes.update( verified_hashes['consensus_hashes'] )
+        verified_block_ids.update( verified_hashes['nameops_hashes'].keys() )
+
+    # trust root in the trust store that agrees with ours (see find_anchor())
+    anchor = None
+
     # print "next_block_id = %s, block_id = %s" % (next_block_id, block_id)
     while next_block_id >= block_id:
 
+        if trust_store is not None:
+            if anchor is None:
+                anchor = trust_store.find_anchor( next_block_id, prev_consensus_hashes[next_block_id] )
+                if anchor is not None:
+                    log.debug("Consensus hash at %s was already verified" % next_block_id)
+
+            if anchor is not None:
+                # skip ahead to the earliest block (at or after block_id) that we have already verified
+                trusted = trust_store.find_lowest( anchor, block_id, next_block_id )
+                if trusted is not None:
+                    trusted_block_id, trusted_consensus_hash, trusted_nameops_hash = trusted
+                    if prev_consensus_hashes.get(trusted_block_id, trusted_consensus_hash) != trusted_consensus_hash:
+                        log.error("Consensus hash mismatch at %s: expected %s, but the trust store has %s" % (trusted_block_id, prev_consensus_hashes[trusted_block_id], trusted_consensus_hash))
+                        return {'error': 'Consensus hash mismatch'}
+
+                    prev_consensus_hashes[trusted_block_id] = trusted_consensus_hash
+                    if trusted_nameops_hash is not None:
+                        prev_nameops_hashes[trusted_block_id] = trusted_nameops_hash
+                        verified_block_ids.add(trusted_block_id)
+
+                    next_block_id = trusted_block_id
+
+        if next_block_id == block_id and next_block_id in verified_block_ids:
+            # verified in an earlier lookup
+            break
+
         # get nameops_at[ next_block_id ], and all consensus_hash[ next_block_id - 2^i ] such that block_id - 2*i > block_id (start at i = 1)
         i = 0
         nameops_hash = None
@@ -346,6 +451,9 @@ def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, conse
             log.error("Consensus hash mismatch at %s: expected %s, got %s (from %s, %s)" % (next_block_id, expected_ch, ch, nameops_hash, prev_consensus_hashes))
             return {'error': 'Consensus hash mismatch'}
 
+        verified_block_ids.add(next_block_id)
+        verified_any = True
+
         # advance!
         # find the smallest known consensus hash whose block is greater than block_id
         current_candidate = next_block_id
@@ -363,6 +471,19 @@ def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, conse
 
         next_block_id = current_candidate
 
+    new_consensus_hashes = prev_consensus_hashes
+    new_nameops_hashes = prev_nameops_hashes
+    if verified_hashes is not None:
+        new_consensus_hashes = dict( [(b, ch) for (b, ch) in prev_consensus_hashes.items() if not verified_hashes['consensus_hashes'].has_key(b)] )
+        new_nameops_hashes = dict( [(b, oh) for (b, oh) in prev_nameops_hashes.items() if not verified_hashes['nameops_hashes'].has_key(b)] )
+
+        verified_hashes['consensus_hashes'].update( new_consensus_hashes )
+        verified_hashes['nameops_hashes'].update( new_nameops_hashes )
+
+    if trust_store is not None and verified_any:
+        # remember what we verified, so we don't have to do it again
+        trust_store.put_many( current_block_id, current_consensus_hash, new_consensus_hashes, new_nameops_hashes )
+
     # get the final nameops
     historic_nameops = get_nameops_at(block_id, proxy=proxy)
     if type(historic_nameops) == dict and 'error' in historic_nameops:
@@ -392,25 +513,14 @@ def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, conse
     return historic_nameops
 
 
-def snv_name_verify(name, current_block_id, current_consensus_hash, block_id, consensus_hash, trusted_txid=None, trusted_txindex=None, proxy=None):
+def snv_match_nameops(name, historic_nameops, trusted_txid=None, trusted_txindex=None):
     """
-    Use SNV to verify that a name existed at a particular block ID in the past,
-    given a later known-good block ID and consensus hash (as well as the previous
-    untrusted consensus hash)
+    Find a name's operations among the (verified) name operations of a block.
 
-    Return the name's historic nameop(s) on success.
+    Return {'status': True, 'nameops': [...]} on success.
     If there are multiple matches, multiple nameops will be returned.
-    The return value takes the form of {'status': True, 'nameops': [...]}
-    Return a dict with {'error'} on error
+    Return {'error': ...} if the name is not there
     """
-
-    if proxy is None:
-        proxy = get_default_proxy()
-
-    historic_nameops = snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, consensus_hash, proxy=proxy)
-    if 'error' in historic_nameops:
-        return historic_nameops
-
     matching_nameops = []
 
     # find the one we asked for
@@ -434,44 +544,45 @@ def snv_name_verify(name, current_block_id, current_consensus_hash, block_id, co
 
     if len(matching_nameops) == 0:
         # not found
-        log.error("Not found at block %s: '%s'" % (block_id, name))
         return {'error': 'Name not found'}
     else:
         return {'status': True, 'nameops': matching_nameops}
 
 
-def snv_lookup(verify_name, verify_block_id, trusted_serial_number_or_txid_or_consensus_hash, proxy=None, trusted_txid=None):
+def snv_name_verify(name, current_block_id, current_consensus_hash, block_id, consensus_hash, trusted_txid=None, trusted_txindex=None, proxy=None):
     """
-    High-level call to simple name verification:
-    Given a trusted serial number, txid, or consensus_hash, use it as a trust root to verify that
-    a previously-registered but untrusted name (@verify_name) exists and was processed
-    at a given block (@verify_block_id)
+    Use SNV to verify that a name existed at a particular block ID in the past,
+    given a later known-good block ID and consensus hash (as well as the previous
+    untrusted consensus hash)
 
-    Basically, use the trust root to derive a "current" block ID and consensus hash, and
-    use the untrusted (name, block_id) pair to derive an earlier untrusted block ID and
-    consensus hash.  Then, use the snv_get_nameops_at() method to verify that the name
-    existed at the given block ID.
+    Return the name's historic nameop(s) on success.
+    If there are multiple matches, multiple nameops will be returned.
+    The return value takes the form of {'status': True, 'nameops': [...]}
+    Return a dict with {'error'} on error
+    """
 
-    The Blockstack node is not trusted.  This algorithm prevents a malicious Blockstack node
-    from getting the caller to falsely trust @verify_name and @verify_block_id by
-    using SNV to confirm that:
-    * the consensus hash at the trust root's block is consistent with @verify_name's
-    corresponding NAMESPACE_PREORDER or NAME_PREORDER;
-    * the consensus hash at @trusted_serial_number's block is consistent with @verify_name's
-    consensus hash (from @verify_serial_number)
+    if proxy is None:
+        proxy = get_default_proxy()
 
-    The only way a Blockstack node working with a malicious Sybil can trick the caller is if
-    both can create a parallel history of name operations such that the final consensus hash
-    at @trusted_serial_number's block collides.  This is necessary, since the client uses
-    the hash over a block's operations and prior consensus hashes to transitively trust
-    prior consensus hashes--if the later consensus hash is assumed out-of-band to be valid,
-    then the transitive closure of all prior consensus hashes will be assumed valid as well.
-    This means that the only way to drive the valid consensus hash from a prior invalid
-    consensus hash is to force a hash collision somewhere in the transitive closure, which is infeasible.
+    historic_nameops = snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, consensus_hash, proxy=proxy)
+    if 'error' in historic_nameops:
+        return historic_nameops
 
-    NOTE: @trusted_txid is needed for isolating multiple operations in the same name within a single block.
+    res = snv_match_nameops(name, historic_nameops, trusted_txid=trusted_txid, trusted_txindex=trusted_txindex)
+    if 'error' in res:
+        log.error("Not found at block %s: '%s'" % (block_id, name))
 
-    Return the list of nameops in the given verify_block_id that match.
+    return res
+
+
+def snv_resolve_trust_root(trusted_serial_number_or_txid_or_consensus_hash, bitcoind_proxy, proxy=None):
+    """
+    Given a trusted serial number, txid, or consensus hash, find the
+    trusted block ID and consensus hash to verify names against.
+
+    Return {'status': True, 'block_id': ..., 'consensus_hash': ..., 'txid': ..., 'tx_index': ...} on success
+    ('txid' is only set if we were given a txid, and 'tx_index' only if we were given a serial number)
+    Return {'error': ...} on error
     """
 
     if proxy is None:
@@ -479,8 +590,7 @@ def snv_lookup(verify_name, verify_block_id, trusted_serial_number_or_txid_or_co
 
     trusted_serial_number_or_txid_or_consensus_hash = str(trusted_serial_number_or_txid_or_consensus_hash)
 
-    bitcoind_proxy = get_bitcoind_client( config_path=proxy.conf['path'] )
-    trusted_serial_number = None
+    trusted_txid = None
     trusted_tx_index = None
     trusted_consensus_hash = None
     trusted_block_id = None
@@ -503,6 +613,9 @@ def snv_lookup(verify_name, verify_block_id, trusted_serial_number_or_txid_or_co
         # but that's okay--if the consensus hash in this tx is inauthentic, it will be unreachable
         # from the other consensus hash [short of a SHA256 collision])
         trusted_block_id = get_block_from_consensus(trusted_consensus_hash, proxy=proxy)
+        if type(trusted_block_id) == dict and 'error' in trusted_block_id:
+            # got error back
+            return trusted_block_id
 
 
     elif len(trusted_serial_number_or_txid_or_consensus_hash) == 32 and is_hex(trusted_serial_number_or_txid_or_consensus_hash):
@@ -545,6 +658,64 @@ def snv_lookup(verify_name, verify_block_id, trusted_serial_number_or_txid_or_co
     else:
         return {'error': 'Did not receive a valid txid, consensus hash, or serial number (%s)' % trusted_serial_number_or_txid_or_consensus_hash}
 
+    return {
+        'status': True,
+        'block_id': trusted_block_id,
+        'consensus_hash': trusted_consensus_hash,
+        'txid': trusted_txid,
+        'tx_index': trusted_tx_index,
+    }
+
+
+def snv_lookup(verify_name, verify_block_id, trusted_serial_number_or_txid_or_consensus_hash, proxy=None, trusted_txid=None):
+    """
+    High-level call to simple name verification:
+    Given a trusted serial number, txid, or consensus_hash, use it as a trust root to verify that
+    a previously-registered but untrusted name (@verify_name) exists and was processed
+    at a given block (@verify_block_id)
+
+    Basically, use the trust root to derive a "current" block ID and consensus hash, and
+    use the untrusted (name, block_id) pair to derive an earlier untrusted block ID and
+    consensus hash.  Then, use the snv_get_nameops_at() method to verify that the name
+    existed at the given block ID.
+
+    The Blockstack node is not trusted.  This algorithm prevents a malicious Blockstack node
+    from getting the caller to falsely trust @verify_name and @verify_block_id by
+    using SNV to confirm that:
+    * the consensus hash at the trust root's block is consistent with @verify_name's
+    corresponding NAMESPACE_PREORDER or NAME_PREORDER;
+    * the consensus hash at @trusted_serial_number's block is consistent with @verify_name's
+    consensus hash (from @verify_serial_number)
+
+    The only way a Blockstack node working with a malicious Sybil can trick the caller is if
+    both can create a parallel history of name operations such that the final consensus hash
+    at @trusted_serial_number's block collides.  This is necessary, since the client uses
+    the hash over a block's operations and prior consensus hashes to transitively trust
+    prior consensus hashes--if the later consensus hash is assumed out-of-band to be valid,
+    then the transitive closure of all prior consensus hashes will be assumed valid as well.
+    This means that the only way to drive the valid consensus hash from a prior invalid
+    consensus hash is to force a hash collision somewhere in the transitive closure, which is infeasible.
+
+    NOTE: @trusted_txid is needed for isolating multiple operations in the same name within a single block.
+
+    Return the list of nameops in the given verify_block_id that match.
+    """
+
+    if proxy is None:
+        proxy = get_default_proxy()
+
+    bitcoind_proxy = get_bitcoind_client( config_path=proxy.conf['path'] )
+
+    trust_root = snv_resolve_trust_root(trusted_serial_number_or_txid_or_consensus_hash, bitcoind_proxy, proxy=proxy)
+    if 'error' in trust_root:
+        return trust_root
+
+    trusted_block_id = trust_root['block_id']
+    trusted_consensus_hash = trust_root['consensus_hash']
+    trusted_tx_index = trust_root['tx_index']
+    if trust_root['txid'] is not None:
+        trusted_txid = trust_root['txid']
+
     if trusted_block_id < verify_block_id:
         return {'error': 'Trusted block/consensus hash came before the untrusted block/consensus hash'}
 
@@ -559,6 +730,76 @@ def snv_lookup(verify_name, verify_block_id, trusted_serial_number_or_txid_or_co
         return historic_namerecs['nameops']
 
 
+def snv_lookup_many(names_and_block_ids, trusted_serial_number_or_txid_or_consensus_hash, proxy=None):
+    """
+    Use simple name verification to verify many (name, block ID) pairs against one
+    trusted serial number, txid, or consensus hash (see snv_lookup()).
+
+    The trust root is resolved once.  Blocks are verified from the most recent one
+    down, sharing one skip-list walk (so each consensus hash is fetched and checked
+    at most once), and each block's name operations are fetched once no matter how
+    many names are in it.
+
+    NOTE: unlike snv_lookup(), names are matched by name only.  The trust root's
+    txid or serial number identifies the trust root's transaction, not the names'
+    transactions, so it is not used to pick out one of a name's operations.  If a
+    name has several operations in its block, all of them are returned, whereas
+    snv_lookup() may narrow them down to the one matching the trust root's txid.
+
+    Yields (name, block_id, nameops) for each pair as soon as its block is verified,
+    where nameops is the list of the name's verified operations in that block
+    (or {'error': ...} on error).
+    """
+
+    if proxy is None:
+        proxy = get_default_proxy()
+
+    names_and_block_ids = [(str(name), int(block_id)) for (name, block_id) in names_and_block_ids]
+
+    bitcoind_proxy = get_bitcoind_client( config_path=proxy.conf['path'] )
+
+    trust_root = snv_resolve_trust_root(trusted_serial_number_or_txid_or_consensus_hash, bitcoind_proxy, proxy=proxy)
+    if 'error' in trust_root:
+        for (name, block_id) in names_and_block_ids:
+            yield (name, block_id, trust_root)
+
+        return
+
+    trusted_block_id = trust_root['block_id']
+    trusted_consensus_hash = trust_root['consensus_hash']
+
+    # block ID => names to find in it
+    block_names = {}
+    for (name, block_id) in names_and_block_ids:
+        if not block_names.has_key(block_id):
+            block_names[block_id] = []
+
+        block_names[block_id].append(name)
+
+    verified_hashes = snv_verified_hashes(trusted_block_id, trusted_consensus_hash)
+
+    for block_id in sorted(block_names.keys(), reverse=True):
+        if trusted_block_id < block_id:
+            historic_nameops = {'error': 'Trusted block/consensus hash came before the untrusted block/consensus hash'}
+
+        else:
+            # NOTE: the untrusted consensus hash is not needed to verify the block
+            historic_nameops = snv_get_nameops_at(trusted_block_id, trusted_consensus_hash, block_id, None, proxy=proxy, verified_hashes=verified_hashes)
+
+        for name in block_names[block_id]:
+            if 'error' in historic_nameops:
+                yield (name, block_id, historic_nameops)
+                continue
+
+            res = snv_match_nameops(name, historic_nameops)
+            if 'error' in res:
+                log.error("Not found at block %s: '%s'" % (block_id, name))
+                yield (name, block_id, res)
+
+            else:
+                yield (name, block_id, res['nameops'])
+
+
 # backwards compatibility
 lookup_snv = snv_lookup
 
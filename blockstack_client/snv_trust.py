@@ -0,0 +1,203 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sqlite3
+import threading
+
+from config import get_logger, SNV_TRUST_STORE_ENABLED, SNV_TRUST_STORE_PATH
+
+log = get_logger()
+
+SNV_TRUST_STORE_SQL = [
+"""
+CREATE TABLE IF NOT EXISTS snv_trusted( root_block_id INTEGER NOT NULL,
+                                        root_consensus_hash TEXT NOT NULL,
+                                        block_id INTEGER NOT NULL,
+                                        consensus_hash TEXT NOT NULL,
+                                        ops_hash TEXT,
+                                        PRIMARY KEY(root_block_id, root_consensus_hash, block_id) );
+""",
+"""
+CREATE INDEX IF NOT EXISTS snv_trusted_consensus_hash_index ON snv_trusted(block_id, consensus_hash);
+"""
+]
+
+
+class TrustedConsensusStore(object):
+    """
+    Persistent store of the consensus hashes (and ops hashes) that SNV
+    has already verified, grouped by the trust root they were verified from.
+
+    A consensus hash commits to every consensus hash before it, so once
+    SNV derives the same consensus hash at block B as the one stored under
+    some trust root, everything stored under that root at or below B is
+    trusted too, and SNV can skip straight to it.  Entries stored above B
+    are not (they may belong to a different fork), which is why entries
+    are kept per trust root.
+    """
+    def __init__(self, path=SNV_TRUST_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.initialized = False
+
+
+    def open(self):
+        """
+        Open a connection to the store, creating it if need be
+        """
+        if not self.initialized:
+            dirpath = os.path.dirname(self.path)
+            if not os.path.exists(dirpath):
+                os.makedirs(dirpath, 0700)
+
+        con = sqlite3.connect( self.path, isolation_level=None, timeout=10 )
+
+        if not self.initialized:
+            for sql in SNV_TRUST_STORE_SQL:
+                con.execute( sql )
+
+            self.initialized = True
+
+        return con
+
+
+    def find_anchor(self, block_id, consensus_hash):
+        """
+        Find a trust root whose verified consensus hash at block_id is consensus_hash.
+        Return (root_block_id, root_consensus_hash, block_id) on success; everything
+        stored under that root at or below block_id is trusted.
+        Return None if there is no such root.
+        """
+        try:
+            con = self.open()
+            res = con.execute( "SELECT root_block_id, root_consensus_hash FROM snv_trusted WHERE block_id = ? AND consensus_hash = ? LIMIT 1;", (block_id, str(consensus_hash)) ).fetchone()
+            con.close()
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to query SNV trust store")
+            return None
+
+        with self.lock:
+            if res is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+        return (res[0], str(res[1]), block_id)
+
+
+    def find_lowest(self, anchor, low_block_id, high_block_id):
+        """
+        Find the lowest block in [low_block_id, high_block_id] with a consensus hash
+        trusted via the given anchor (from find_anchor()).
+        Return (block_id, consensus_hash, ops_hash or None) on success
+        Return None if there is none
+        """
+        root_block_id, root_consensus_hash, anchor_block_id = anchor
+        high_block_id = min(high_block_id, anchor_block_id)
+
+        try:
+            con = self.open()
+            res = con.execute( "SELECT block_id, consensus_hash, ops_hash FROM snv_trusted WHERE root_block_id = ? AND root_consensus_hash = ? AND block_id >= ? AND block_id <= ? " + \
+                               "ORDER BY block_id ASC LIMIT 1;", (root_block_id, root_consensus_hash, low_block_id, high_block_id) ).fetchone()
+            con.close()
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to query SNV trust store")
+            return None
+
+        if res is None:
+            return None
+
+        return (res[0], str(res[1]), str(res[2]) if res[2] is not None else None)
+
+
+    def put_many(self, root_block_id, root_consensus_hash, consensus_hashes, ops_hashes):
+        """
+        Remember the consensus hashes ({block_id: consensus hash}) and
+        ops hashes ({block_id: ops hash}) verified from the given trust root.
+        Return True on success
+        Return False on error
+        """
+        rows = [(root_block_id, str(root_consensus_hash), block_id, str(ch), ops_hashes.get(block_id, None)) for (block_id, ch) in consensus_hashes.items()]
+        ops_rows = [(str(ops_hash), root_block_id, str(root_consensus_hash), block_id) for (block_id, ops_hash) in ops_hashes.items()]
+
+        try:
+            con = self.open()
+            con.execute( "BEGIN;" )
+            con.executemany( "INSERT OR IGNORE INTO snv_trusted (root_block_id, root_consensus_hash, block_id, consensus_hash, ops_hash) VALUES (?,?,?,?,?);", rows )
+            con.executemany( "UPDATE snv_trusted SET ops_hash = ? WHERE root_block_id = ? AND root_consensus_hash = ? AND block_id = ? AND ops_hash IS NULL;", ops_rows )
+            con.execute( "COMMIT;" )
+            con.close()
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to write to SNV trust store")
+            return False
+
+        with self.lock:
+            self.writes += len(rows)
+
+        return True
+
+
+    def get_stats(self):
+        """
+        Get store statistics
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (float(self.hits) / lookups) if lookups > 0 else 0.0,
+                'writes': self.writes,
+                'path': self.path,
+            }
+
+
+trusted_consensus_store = None
+if SNV_TRUST_STORE_ENABLED:
+    trusted_consensus_store = TrustedConsensusStore()
+
+
+def get_trusted_consensus_store():
+    """
+    Get the SNV trust store, if it is enabled.
+    Return None if not.
+    """
+    return trusted_consensus_store
+
+
+def get_snv_trust_store_stats():
+    """
+    Get hit-rate statistics for the SNV trust store
+    """
+    if trusted_consensus_store is None:
+        return {}
+
+    return trusted_consensus_store.get_stats()
@@ -0,0 +1,694 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import mmap
+import fcntl
+import time
+import struct
+import hashlib
+import sqlite3
+import threading
+
+from virtualchain import SPVClient
+
+from config import get_logger, SPV_BLOCK_CACHE_ENABLED, SPV_BLOCK_CACHE_PATH, SPV_BLOCK_CACHE_MAX_BLOCKS, \
+    SPV_HEADER_SYNC_INTERVAL
+
+from .backend.blockchain import get_block_height
+
+log = get_logger()
+
+SPV_BLOCK_CACHE_SQL = [
+"""
+CREATE TABLE IF NOT EXISTS spv_blocks( block_hash TEXT NOT NULL,
+                                       block_height INTEGER NOT NULL,
+                                       merkle_root TEXT NOT NULL,
+                                       txids TEXT NOT NULL,
+                                       last_used REAL NOT NULL,
+                                       PRIMARY KEY(block_hash) );
+""",
+"""
+CREATE INDEX IF NOT EXISTS spv_blocks_height_index ON spv_blocks(block_height);
+""",
+"""
+CREATE INDEX IF NOT EXISTS spv_blocks_last_used_index ON spv_blocks(last_used);
+"""
+]
+
+
+class SPVBlockCache(object):
+    """
+    Bounded on-disk cache of blocks whose transaction IDs have already
+    been checked against the SPV headers (i.e. the block hash is in the
+    header chain, and the txids hash to its Merkle root).
+
+    Only the block hash, height, Merkle root and txid list are kept,
+    since that's all SNV needs to check a transaction against the block.
+    The cache holds at most max_blocks blocks; when it gets full, the
+    least-recently-used ones are dropped.
+
+    A block that was on the header chain when it was cached may not be
+    any longer (e.g. after a reorg), so get() can check the cached hash
+    against the header at its height before returning it.
+    """
+    def __init__(self, path=SPV_BLOCK_CACHE_PATH, max_blocks=SPV_BLOCK_CACHE_MAX_BLOCKS):
+        self.path = path
+        self.max_blocks = max_blocks
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.stale = 0
+        self.initialized = False
+
+
+    def open(self):
+        """
+        Open a connection to the cache, creating it if need be
+        """
+        if not self.initialized:
+            dirpath = os.path.dirname(self.path)
+            if not os.path.exists(dirpath):
+                os.makedirs(dirpath, 0700)
+
+        con = sqlite3.connect( self.path, isolation_level=None, timeout=10 )
+
+        if not self.initialized:
+            for sql in SPV_BLOCK_CACHE_SQL:
+                con.execute( sql )
+
+            self.initialized = True
+
+        return con
+
+
+    def get(self, block_hash=None, block_height=None, header_index=None):
+        """
+        Get a verified block by hash or by height.
+        If header_index (an SPVHeaderIndex) is given, only return the block
+        if it is still the block at its height in the SPV headers.
+        Return {'hash': ..., 'height': ..., 'merkleroot': ..., 'tx': [txids]} on success
+        Return None if not cached
+        """
+        assert block_hash is not None or block_height is not None
+
+        stale = False
+        try:
+            con = self.open()
+            if block_hash is not None:
+                res = con.execute( "SELECT block_hash, block_height, merkle_root, txids FROM spv_blocks WHERE block_hash = ?;", (str(block_hash),) ).fetchone()
+            else:
+                res = con.execute( "SELECT block_hash, block_height, merkle_root, txids FROM spv_blocks WHERE block_height = ?;", (int(block_height),) ).fetchone()
+
+            if res is not None and header_index is not None and header_index.block_hash_at(res[1]) != str(res[0]):
+                # no longer on the header chain
+                log.debug("Cached block %s is not at height %s in %s" % (res[0], res[1], header_index.headers_path))
+                con.execute( "DELETE FROM spv_blocks WHERE block_hash = ?;", (res[0],) )
+                res = None
+                stale = True
+
+            if res is not None:
+                # mark most-recently used
+                con.execute( "UPDATE spv_blocks SET last_used = ? WHERE block_hash = ?;", (time.time(), res[0]) )
+
+            con.close()
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to query SPV block cache")
+            return None
+
+        with self.lock:
+            if res is None:
+                self.misses += 1
+                if stale:
+                    self.stale += 1
+
+                return None
+
+            self.hits += 1
+
+        return {
+            'hash': str(res[0]),
+            'height': res[1],
+            'merkleroot': str(res[2]),
+            'tx': [str(txid) for txid in json.loads(res[3])]
+        }
+
+
+    def put(self, block_hash, block_height, merkle_root, txids):
+        """
+        Remember a block whose txids have been verified against the SPV headers.
+        Return True on success
+        Return False on error
+        """
+        try:
+            con = self.open()
+            con.execute( "BEGIN;" )
+
+            # a block at this height on another fork is no longer on the header chain
+            con.execute( "DELETE FROM spv_blocks WHERE block_height = ? AND block_hash != ?;", (int(block_height), str(block_hash)) )
+            con.execute( "INSERT OR REPLACE INTO spv_blocks (block_hash, block_height, merkle_root, txids, last_used) VALUES (?,?,?,?,?);", \
+                         (str(block_hash), int(block_height), str(merkle_root), json.dumps([str(txid) for txid in txids]), time.time()) )
+
+            cur = con.execute( "DELETE FROM spv_blocks WHERE block_hash NOT IN (SELECT block_hash FROM spv_blocks ORDER BY last_used DESC LIMIT ?);", (self.max_blocks,) )
+            evicted = cur.rowcount
+
+            con.execute( "COMMIT;" )
+            con.close()
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to write to SPV block cache")
+            return False
+
+        with self.lock:
+            self.writes += 1
+            self.evictions += max(0, evicted)
+
+        return True
+
+
+    def get_stats(self):
+        """
+        Get cache statistics
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (float(self.hits) / lookups) if lookups > 0 else 0.0,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'stale': self.stale,
+                'path': self.path,
+            }
+
+
+class SPVHeaderSync(object):
+    """
+    Keep the SPV headers file synchronized with the blockchain.
+
+    The first lookup past the end of the headers syncs them up to the
+    block it needs, and then starts a thread that keeps syncing them
+    to bitcoind's latest block every sync_interval seconds.  After that,
+    lookups only have to wait on a sync if they ask for a block
+    the thread has not gotten to yet.
+    """
+    def __init__(self, headers_path, bitcoind_server, config_path, sync_interval=SPV_HEADER_SYNC_INTERVAL):
+        self.headers_path = headers_path
+        self.bitcoind_server = bitcoind_server
+        self.config_path = config_path
+        self.sync_interval = sync_interval
+        self.sync_lock = threading.Lock()
+        self.height = None
+        self.thread = None
+        self.syncs = 0
+
+
+    def get_height(self):
+        """
+        Get the height of the headers we have.
+        Return -1 if we have none
+        """
+        height = SPVClient.height(self.headers_path)
+        if height is None:
+            return -1
+
+        return height
+
+
+    def sync(self, block_id):
+        """
+        Synchronize the headers up to (at least) block_id.
+        Return True on success
+        Return False on error
+        """
+        with self.sync_lock:
+            if self.height is None:
+                self.height = self.get_height()
+
+            if self.height >= block_id:
+                return True
+
+            log.debug("Synchronize SPV headers from %s to %s" % (self.height, block_id))
+            rc = SPVClient.sync_header_chain(self.headers_path, self.bitcoind_server, block_id)
+            self.syncs += 1
+            self.height = self.get_height()
+
+            if not rc or self.height < block_id:
+                return False
+
+            return True
+
+
+    def run(self):
+        """
+        Background sync loop
+        """
+        while True:
+            time.sleep(self.sync_interval)
+
+            block_id = get_block_height(config_path=self.config_path)
+            if block_id is None:
+                log.error("Failed to get block height; will retry SPV header sync later")
+                continue
+
+            try:
+                rc = self.sync(block_id)
+                if not rc:
+                    log.error("Failed to synchronize SPV header chain up to %s" % block_id)
+
+            except Exception, e:
+                log.exception(e)
+                log.error("Failed to synchronize SPV header chain up to %s" % block_id)
+
+
+    def ensure_height(self, block_id):
+        """
+        Make sure we have the headers up to block_id, and
+        keep them synchronized in the background from now on.
+        Return True on success
+        Return False on error
+        """
+        if self.height is None or self.height < block_id:
+            rc = self.sync(block_id)
+            if not rc:
+                return False
+
+        if self.thread is None:
+            with self.sync_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run)
+                    self.thread.daemon = True
+                    self.thread.start()
+
+        return True
+
+
+SPV_HEADER_RECORD_SIZE = 81         # each header in the SPV headers file is 80 bytes, plus a 0 tx count
+SPV_HEADER_INDEX_MAGIC = 'BSHI'
+SPV_HEADER_INDEX_VERSION = 1
+SPV_HEADER_INDEX_PREAMBLE = '<4sIII32s'   # magic, version, number of slots, number of headers indexed, hash of the last header indexed
+SPV_HEADER_INDEX_PREAMBLE_SIZE = struct.calcsize(SPV_HEADER_INDEX_PREAMBLE)
+SPV_HEADER_INDEX_SLOT_SIZE = 4
+SPV_HEADER_INDEX_MIN_SLOTS = 65536
+
+
+class SPVHeaderIndex(object):
+    """
+    Index from block hash to height for an SPV headers file, so we can
+    tell whether or not a block header is in the header chain without
+    scanning the whole file (like SPVClient.block_header_index() does).
+
+    The index is an open-addressed hash table in a file next to the
+    headers file (mmap'ed), with one slot per block: the height (plus 1;
+    0 means empty) of a header, at the slot given by its block hash.
+    Lookups read back the header at the candidate height to confirm
+    the match, so the index only needs to hold heights.
+
+    Headers appended to the headers file are added to the index as they
+    show up.  If the headers file shrinks, or its last indexed header
+    no longer matches what the index recorded (i.e. it got rewritten),
+    the index is rebuilt from scratch.
+
+    Several processes can share the index, so it is only read or updated
+    while holding an flock on a lock file next to it, and the number of
+    headers indexed is re-read from the index file each time the lock
+    is taken.
+    """
+    def __init__(self, headers_path, index_path=None):
+        if index_path is None:
+            index_path = headers_path + ".index"
+
+        self.headers_path = headers_path
+        self.index_path = index_path
+        self.lock_path = index_path + ".lock"
+        self.lock = threading.Lock()
+        self.lock_file = None
+        self.index_file = None
+        self.index_map = None
+        self.num_slots = 0
+        self.count = 0
+        self.last_hash = None
+        self.rebuilds = 0
+
+
+    @classmethod
+    def header_hash(cls, header):
+        """
+        Get the (binary, little-endian) block hash of a header
+        """
+        return hashlib.sha256(hashlib.sha256(header[0:80]).digest()).digest()
+
+
+    def close(self):
+        """
+        Close the index.
+        Must be called with the lock held.
+        """
+        if self.index_map is not None:
+            self.index_map.close()
+            self.index_map = None
+
+        if self.index_file is not None:
+            self.index_file.close()
+            self.index_file = None
+
+
+    def open_index(self):
+        """
+        Open and mmap the index file.
+        Must be called with the lock held.
+        Return True on success
+        Return False if there is no usable index file
+        """
+        self.close()
+        if not os.path.exists(self.index_path):
+            return False
+
+        f = open(self.index_path, "r+b")
+        preamble = f.read(SPV_HEADER_INDEX_PREAMBLE_SIZE)
+        if len(preamble) != SPV_HEADER_INDEX_PREAMBLE_SIZE:
+            f.close()
+            return False
+
+        magic, version, num_slots, count, last_hash = struct.unpack(SPV_HEADER_INDEX_PREAMBLE, preamble)
+        if magic != SPV_HEADER_INDEX_MAGIC or version != SPV_HEADER_INDEX_VERSION or num_slots == 0 or (num_slots & (num_slots - 1)) != 0 or \
+           os.fstat(f.fileno()).st_size != SPV_HEADER_INDEX_PREAMBLE_SIZE + num_slots * SPV_HEADER_INDEX_SLOT_SIZE:
+            f.close()
+            return False
+
+        self.index_file = f
+        self.index_map = mmap.mmap(f.fileno(), 0)
+        self.num_slots = num_slots
+        self.count = count
+        self.last_hash = last_hash
+        return True
+
+
+    def reload(self):
+        """
+        Pick up any changes other processes made to the index.
+        Must be called with the lock and the lock file held.
+        Return True if there is a usable index
+        Return False if not
+        """
+        if self.index_file is not None:
+            try:
+                index_ino = os.stat(self.index_path).st_ino
+            except OSError:
+                index_ino = None
+
+            if index_ino != os.fstat(self.index_file.fileno()).st_ino:
+                # another process rebuilt it
+                self.close()
+
+        if self.index_map is None:
+            return self.open_index()
+
+        _, _, _, self.count, self.last_hash = struct.unpack_from(SPV_HEADER_INDEX_PREAMBLE, self.index_map, 0)
+        return True
+
+
+    def write_preamble(self):
+        """
+        Write back the number of headers indexed.
+        Must be called with the lock held.
+        """
+        self.index_map[0:SPV_HEADER_INDEX_PREAMBLE_SIZE] = struct.pack(SPV_HEADER_INDEX_PREAMBLE, SPV_HEADER_INDEX_MAGIC, SPV_HEADER_INDEX_VERSION,
+                                                                       self.num_slots, self.count, self.last_hash)
+        self.index_map.flush()
+
+
+    def insert(self, block_hash, height):
+        """
+        Add a header's height to the index (if it is not there already).
+        Must be called with the lock held.
+        """
+        mask = self.num_slots - 1
+        slot = struct.unpack('<Q', block_hash[0:8])[0] & mask
+        for i in xrange(0, self.num_slots):
+            offset = SPV_HEADER_INDEX_PREAMBLE_SIZE + slot * SPV_HEADER_INDEX_SLOT_SIZE
+            value = struct.unpack_from('<I', self.index_map, offset)[0]
+            if value == height + 1:
+                return
+
+            if value == 0:
+                struct.pack_into('<I', self.index_map, offset, height + 1)
+                return
+
+            slot = (slot + 1) & mask
+
+        raise Exception("SPV header index %s is full" % self.index_path)
+
+
+    def index_headers(self, headers_file, num_headers):
+        """
+        Add headers [self.count, num_headers) to the index.
+        Must be called with the lock held.
+        """
+        batch = 2016
+        headers_file.seek(self.count * SPV_HEADER_RECORD_SIZE)
+        while self.count < num_headers:
+            n = min(batch, num_headers - self.count)
+            data = headers_file.read(n * SPV_HEADER_RECORD_SIZE)
+            for i in xrange(0, n):
+                block_hash = self.header_hash(data[i * SPV_HEADER_RECORD_SIZE: (i + 1) * SPV_HEADER_RECORD_SIZE])
+                self.insert(block_hash, self.count + i)
+                self.last_hash = block_hash
+
+            self.count += n
+
+        self.write_preamble()
+
+
+    def rebuild(self, headers_file, num_headers):
+        """
+        Build a new index for the first num_headers headers,
+        with room to grow (at most 50% full).
+        Must be called with the lock held.
+        """
+        num_slots = SPV_HEADER_INDEX_MIN_SLOTS
+        while num_slots < 4 * num_headers:
+            num_slots *= 2
+
+        log.debug("Rebuild SPV header index %s (%s headers, %s slots)" % (self.index_path, num_headers, num_slots))
+        self.close()
+
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack(SPV_HEADER_INDEX_PREAMBLE, SPV_HEADER_INDEX_MAGIC, SPV_HEADER_INDEX_VERSION, num_slots, 0, '\x00' * 32))
+            f.truncate(SPV_HEADER_INDEX_PREAMBLE_SIZE + num_slots * SPV_HEADER_INDEX_SLOT_SIZE)
+
+        os.rename(tmp_path, self.index_path)
+        self.open_index()
+        self.rebuilds += 1
+
+        self.index_headers(headers_file, num_headers)
+
+
+    def refresh(self, headers_file):
+        """
+        Bring the index up to date with the headers file.
+        Must be called with the lock and the lock file held.
+        """
+        num_headers = os.fstat(headers_file.fileno()).st_size / SPV_HEADER_RECORD_SIZE
+
+        if not self.reload():
+            self.rebuild(headers_file, num_headers)
+            return
+
+        if self.count > num_headers:
+            # headers file got truncated
+            self.rebuild(headers_file, num_headers)
+            return
+
+        if self.count > 0:
+            headers_file.seek((self.count - 1) * SPV_HEADER_RECORD_SIZE)
+            if self.header_hash(headers_file.read(SPV_HEADER_RECORD_SIZE)) != self.last_hash:
+                # headers file got rewritten
+                self.rebuild(headers_file, num_headers)
+                return
+
+        if num_headers > self.count:
+            if 2 * num_headers > self.num_slots:
+                self.rebuild(headers_file, num_headers)
+            else:
+                self.index_headers(headers_file, num_headers)
+
+
+    def find(self, block_hash, headers_file):
+        """
+        Find the height of the header with the given (binary, little-endian) block hash.
+        Must be called with the lock held.
+        Return the height on success
+        Return -1 if not found
+        """
+        mask = self.num_slots - 1
+        slot = struct.unpack('<Q', block_hash[0:8])[0] & mask
+        for i in xrange(0, self.num_slots):
+            offset = SPV_HEADER_INDEX_PREAMBLE_SIZE + slot * SPV_HEADER_INDEX_SLOT_SIZE
+            value = struct.unpack_from('<I', self.index_map, offset)[0]
+            if value == 0:
+                return -1
+
+            height = value - 1
+            headers_file.seek(height * SPV_HEADER_RECORD_SIZE)
+            if self.header_hash(headers_file.read(SPV_HEADER_RECORD_SIZE)) == block_hash:
+                return height
+
+            slot = (slot + 1) & mask
+
+        return -1
+
+
+    def lookup(self, block_hash):
+        """
+        Find the height of the header with the given (binary, little-endian) block hash.
+        Return the height on success
+        Return -1 if not found
+        """
+        if not os.path.exists(self.headers_path):
+            return -1
+
+        with self.lock:
+            if self.lock_file is None:
+                self.lock_file = open(self.lock_path, "a")
+
+            # other processes may be using (or rebuilding) the index too
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                with open(self.headers_path, "rb") as headers_file:
+                    self.refresh(headers_file)
+                    return self.find(block_hash, headers_file)
+
+            finally:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+
+
+    def block_hash_at(self, height):
+        """
+        Get the (hex) block hash of the header at the given height in the headers file.
+        Return None if there is no header at that height
+        """
+        try:
+            with open(self.headers_path, "rb") as headers_file:
+                headers_file.seek(height * SPV_HEADER_RECORD_SIZE)
+                header = headers_file.read(SPV_HEADER_RECORD_SIZE)
+
+        except (OSError, IOError), e:
+            log.exception(e)
+            return None
+
+        if len(header) != SPV_HEADER_RECORD_SIZE:
+            return None
+
+        return self.header_hash(header)[::-1].encode('hex')
+
+
+    def block_header_index(self, header):
+        """
+        Find the height of the given (serialized) header in the headers file.
+        Drop-in replacement for SPVClient.block_header_index(); falls back to it
+        if the index can't be used.
+        Return the height on success
+        Return -1 if not found
+        """
+        try:
+            height = self.lookup(self.header_hash(header))
+            if height < 0:
+                return -1
+
+            # same check as SPVClient.block_header_index()
+            with open(self.headers_path, "rb") as headers_file:
+                headers_file.seek(height * SPV_HEADER_RECORD_SIZE)
+                if headers_file.read(SPV_HEADER_RECORD_SIZE) != header:
+                    return -1
+
+            return height
+
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to use SPV header index %s; scanning %s" % (self.index_path, self.headers_path))
+            with self.lock:
+                self.close()
+
+            return SPVClient.block_header_index(self.headers_path, header)
+
+
+spv_block_cache = None
+if SPV_BLOCK_CACHE_ENABLED:
+    spv_block_cache = SPVBlockCache()
+
+spv_header_syncs = {}
+spv_header_syncs_lock = threading.Lock()
+
+spv_header_indexes = {}
+spv_header_indexes_lock = threading.Lock()
+
+
+def get_spv_block_cache():
+    """
+    Get the SPV block cache, if it is enabled.
+    Return None if not.
+    """
+    return spv_block_cache
+
+
+def get_spv_header_sync(headers_path, bitcoind_server, config_path):
+    """
+    Get the (shared) SPV header synchronizer for a headers file
+    """
+    with spv_header_syncs_lock:
+        header_sync = spv_header_syncs.get(headers_path, None)
+        if header_sync is None:
+            header_sync = SPVHeaderSync(headers_path, bitcoind_server, config_path)
+            spv_header_syncs[headers_path] = header_sync
+
+    return header_sync
+
+
+def get_spv_header_index(headers_path):
+    """
+    Get the (shared) block hash index for a headers file
+    """
+    with spv_header_indexes_lock:
+        header_index = spv_header_indexes.get(headers_path, None)
+        if header_index is None:
+            header_index = SPVHeaderIndex(headers_path)
+            spv_header_indexes[headers_path] = header_index
+
+    return header_index
+
+
+def get_spv_block_cache_stats():
+    """
+    Get hit-rate statistics for the SPV block cache
+    """
+    if spv_block_cache is None:
+        return {}
+
+    return spv_block_cache.get_stats()
@@ -38,14 +38,19 @@ import json
 import hashlib
 import urllib
 import urllib2
+import time
+import threading
+import Queue
 import blockstack_zones
 from collections import defaultdict
 
 import blockstack_profiles 
 
-from config import LENGTH_MAX_NAME, get_logger, CONFIG_PATH
+from config import LENGTH_MAX_NAME, get_logger, CONFIG_PATH, STORAGE_PARALLEL_READS, STORAGE_READ_MAX_WORKERS, \
+        STORAGE_DRIVER_FAILURE_PENALTY, STORAGE_LATENCY_BUCKETS, STORAGE_VERIFY_WORKERS, STORAGE_NEWEST_WINS_WAIT
 from scripts import is_name_valid
 import keys
+from immutable_cache import immutable_cache_get, immutable_cache_put
 
 log = get_logger()
 
@@ -61,6 +66,238 @@ URLENCODED_CLASS = '[a-zA-Z0-9\-_.~%]'
 storage_handlers = []
 
 
+class StorageDriverStats(object):
+    """
+    Tracks how long each storage driver takes to answer reads,
+    so we can try the fast and reliable ones first.
+
+    Each driver gets a latency histogram (successful reads only),
+    success/miss/failure counts, and a moving average of the time it takes
+    to get an answer from it.  A failed read counts as taking
+    STORAGE_DRIVER_FAILURE_PENALTY seconds; a miss (the driver cleanly
+    reported that it does not have the data) counts as its actual latency.
+    """
+    def __init__(self, buckets=STORAGE_LATENCY_BUCKETS, failure_penalty=STORAGE_DRIVER_FAILURE_PENALTY, alpha=0.2):
+        self.buckets = buckets
+        self.failure_penalty = failure_penalty
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.drivers = {}
+
+
+    def record(self, driver_name, latency, success, miss=False):
+        """
+        Record the outcome of a read
+        """
+        cost = latency if (success or miss) else max(latency, self.failure_penalty)
+        with self.lock:
+            if not self.drivers.has_key(driver_name):
+                self.drivers[driver_name] = {
+                    'histogram': [0] * (len(self.buckets) + 1),
+                    'successes': 0,
+                    'misses': 0,
+                    'failures': 0,
+                    'avg_cost': cost,
+                }
+
+            stats = self.drivers[driver_name]
+            stats['avg_cost'] = (1 - self.alpha) * stats['avg_cost'] + self.alpha * cost
+
+            if success:
+                stats['successes'] += 1
+                i = 0
+                while i < len(self.buckets) and latency > self.buckets[i]:
+                    i += 1
+
+                stats['histogram'][i] += 1
+
+            elif miss:
+                stats['misses'] += 1
+
+            else:
+                stats['failures'] += 1
+
+
+    def order(self, drivers, get_name=lambda d: d.__name__):
+        """
+        Sort drivers so that the ones that usually answer fastest come first.
+        Drivers we know nothing about go first, so we learn about them;
+        ties keep their original (i.e. configured) order.
+        """
+        with self.lock:
+            costs = dict( (name, stats['avg_cost']) for (name, stats) in self.drivers.items() )
+
+        return sorted( drivers, key=lambda d: costs.get(get_name(d), 0.0) )
+
+
+    def get_stats(self):
+        """
+        Get a copy of the per-driver statistics
+        """
+        with self.lock:
+            ret = {}
+            for (name, stats) in self.drivers.items():
+                ret[name] = {
+                    'successes': stats['successes'],
+                    'misses': stats['misses'],
+                    'failures': stats['failures'],
+                    'avg_cost': stats['avg_cost'],
+                    'histogram': zip( [str(b) for b in self.buckets] + ['inf'], stats['histogram'] ),
+                }
+
+            return ret
+
+
+storage_driver_stats = StorageDriverStats()
+
+
+def get_storage_driver_stats():
+    """
+    Get per-driver read latency statistics
+    """
+    return storage_driver_stats.get_stats()
+
+
+class StorageReadMiss(Exception):
+    """
+    Raised by a read function when its driver cleanly
+    reports that it does not have the data.
+    """
+    pass
+
+
+# serializes reads on drivers that don't declare READ_THREAD_SAFE = True
+storage_driver_read_locks = {}
+storage_driver_read_locks_lock = threading.Lock()
+
+
+def storage_driver_read( handler, read_method, *args, **kw ):
+    """
+    Call handler.read_method(*args, **kw).
+    Drivers are only called from several threads at once
+    if they declare READ_THREAD_SAFE = True.
+    """
+    method = getattr(handler, read_method)
+    if getattr(handler, 'READ_THREAD_SAFE', False):
+        return method(*args, **kw)
+
+    with storage_driver_read_locks_lock:
+        lock = storage_driver_read_locks.get(handler.__name__, None)
+        if lock is None:
+            lock = threading.Lock()
+            storage_driver_read_locks[handler.__name__] = lock
+
+    with lock:
+        return method(*args, **kw)
+
+
+def timed_storage_read( driver_name, read_func ):
+    """
+    Call read_func(), which returns a verified result or None
+    (or raises StorageReadMiss if the data isn't there),
+    and record how long it took.
+    Return its result (None if it missed or raised)
+    """
+    start = time.time()
+    result = None
+    miss = False
+    try:
+        result = read_func()
+    except StorageReadMiss:
+        miss = True
+        result = None
+    except Exception, e:
+        log.exception(e)
+        log.debug("Read with %s failed" % driver_name)
+        result = None
+
+    storage_driver_stats.record( driver_name, time.time() - start, result is not None, miss=miss )
+    return result
+
+
+class StorageReadPool(object):
+    """
+    Fixed set of threads, shared by all parallel storage reads.
+
+    Reads wait in a queue for a free thread, so no matter how many
+    reads are in flight, at most max_workers driver calls run at once.
+    """
+    def __init__(self, max_workers=STORAGE_READ_MAX_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self.tasks = Queue.Queue()
+        self.lock = threading.Lock()
+        self.threads = []
+
+
+    def worker(self):
+        """
+        Run tasks forever
+        """
+        while True:
+            task = self.tasks.get()
+            try:
+                task()
+            except Exception, e:
+                log.exception(e)
+
+
+    def submit(self, task):
+        """
+        Run task() on one of the pool's threads
+        """
+        with self.lock:
+            while len(self.threads) < self.max_workers:
+                t = threading.Thread( target=self.worker, name="storage-read-%s" % len(self.threads) )
+                t.daemon = True
+                t.start()
+                self.threads.append(t)
+
+        self.tasks.put(task)
+
+
+storage_read_pool = StorageReadPool()
+
+
+def race_storage_reads( attempts ):
+    """
+    Given a list of (driver name, read function) pairs, run them all at once
+    on the shared storage read pool.
+    Each read function returns a verified result, or None.
+    Return (driver name, result) for the first non-None result.
+    Return (None, None) if they all fail.
+
+    Reads that have not started by the time we have a result are skipped.
+    Reads already underway are not waited on (there's no way to cancel them),
+    but they still run to completion in the pool, so their latencies are recorded.
+    """
+    if len(attempts) == 0:
+        return (None, None)
+
+    results = Queue.Queue()
+    state = {'done': False}
+
+    def run_attempt( driver_name, read_func ):
+        if state['done']:
+            results.put( (driver_name, None) )
+            return
+
+        results.put( (driver_name, timed_storage_read(driver_name, read_func)) )
+
+    for (driver_name, read_func) in attempts:
+        storage_read_pool.submit( lambda driver_name=driver_name, read_func=read_func: run_attempt(driver_name, read_func) )
+
+    try:
+        for i in xrange(0, len(attempts)):
+            driver_name, result = results.get()
+            if result is not None:
+                return (driver_name, result)
+
+    finally:
+        state['done'] = True
+
+    return (None, None)
+
+
 def is_b40(s):
     return (isinstance(s, str) and (re.match(B40_REGEX, s) is not None))
 
@@ -272,7 +509,7 @@ def register_storage( storage_impl ):
    return True
 
 
-def get_immutable_data( data_hash, data_url=None, hash_func=get_data_hash, fqu=None, data_id=None, zonefile=False, deserialize=True, drivers=None ):
+def get_immutable_data( data_hash, data_url=None, hash_func=get_data_hash, fqu=None, data_id=None, zonefile=False, deserialize=True, drivers=None, parallel=None ):
    """
    Given the hash of the data, go through the list of
    immutable data handlers and look it up.
@@ -280,6 +517,14 @@ def get_immutable_data( data_hash, data_url=None, hash_func=get_data_hash, fqu=N
    Optionally pass the fully-qualified name (@fqu), human-readable data ID (data_id),
    and whether or not this is a zonefile request (zonefile) as hints to the driver.
 
+   The local immutable data cache is checked first, and is
+   filled in with whatever we fetch.
+
+   If parallel is True (default: STORAGE_PARALLEL_READS), ask the URL hint and every
+   driver at once (on the shared storage read pool) and take the first reply that
+   matches data_hash.  Otherwise, try the URL hint, and then each driver in turn
+   (fastest first).
+
    Return the data (as a dict) on success.
    Return None on failure
    """
@@ -289,6 +534,9 @@ def get_immutable_data( data_hash, data_url=None, hash_func=get_data_hash, fqu=N
        log.debug("No storage handlers registered")
        return None
 
+   if parallel is None:
+       parallel = STORAGE_PARALLEL_READS
+
    handlers_to_use = []
    if drivers is not None and len(drivers) > 0:
        # whitelist of drivers to try 
@@ -300,15 +548,35 @@ def get_immutable_data( data_hash, data_url=None, hash_func=get_data_hash, fqu=N
    else:
        handlers_to_use = storage_handlers
 
-   log.debug("get_immutable %s" % data_hash)
+   handlers_to_use = [h for h in handlers_to_use if hasattr(h, "get_immutable_handler")]
+   handlers_to_use = storage_driver_stats.order( handlers_to_use )
 
-   for handler in [data_url] + handlers_to_use:
+   log.debug("get_immutable %s" % data_hash)
 
-      if handler is None:
-         continue
+   def deserialize_data( data ):
+      if not deserialize:
+         return data
 
+      try:
+         return json.loads(data)
+      except ValueError:
+         log.error("Invalid JSON for %s" % data_hash)
+         return None
+
+   # it never changes, so check our local copy first
+   data = immutable_cache_get( data_hash, hash_func )
+   if data is not None:
+      data_dict = deserialize_data( data )
+      if data_dict is not None:
+         log.debug("loaded %s from cache" % data_hash)
+         return data_dict
+
+   def read_from( handler ):
+      # fetch and verify the data with a handler (or the URL hint).
+      # return (data, deserialized data)
       data = None
       data_dict = None
+      handler_name = handler if handler == data_url else handler.__name__
 
       if handler == data_url:
          # url hint
@@ -320,25 +588,21 @@ def get_immutable_data( data_hash, data_url=None, hash_func=get_data_hash, fqu=N
          except Exception, e:
             log.exception(e)
             log.error("Failed to load profile from '%s'" % data_url)
-            continue
+            return None
 
       else:
          # handler
-         if not hasattr( handler, "get_immutable_handler" ):
-            log.debug("No method: %s.get_immutable_handler(%s)" % (handler, data_hash))
-            continue
-
          log.debug("Try %s (%s)" % (handler.__name__, data_hash))
          try:
-            data = handler.get_immutable_handler( data_hash, data_id=data_id, zonefile=zonefile, fqu=fqu )
+            data = storage_driver_read( handler, "get_immutable_handler", data_hash, data_id=data_id, zonefile=zonefile, fqu=fqu )
          except Exception, e:
             log.exception( e )
             log.debug("Method failed: %s.get_immutable_handler(%s)" % (handler, data_hash))
-            continue
+            return None
 
       if data is None:
-         log.debug("No data: %s.get_immutable_handler(%s)" % (handler.__name__, data_hash))
-         continue
+         log.debug("No data: %s.get_immutable_handler(%s)" % (handler_name, data_hash))
+         raise StorageReadMiss()
 
       # validate
       dh = hash_func(data)
@@ -349,25 +613,41 @@ def get_immutable_data( data_hash, data_url=None, hash_func=get_data_hash, fqu=N
          else:
              log.error("Invalid data hash from %s.get_immutable_handler" % (handler.__name__))
 
-         continue
+         return None
 
       # deserialize 
-      if deserialize:
-          try:
-              data_dict = json.loads(data)
-          except ValueError:
-              log.error("Invalid JSON for %s" % data_hash)
-              continue
+      data_dict = deserialize_data( data )
+      if data_dict is None:
+         return None
 
-      else:
-          data_dict = data
+      log.debug("loaded %s with %s" % (data_hash, handler_name))
+      return (data, data_dict)
 
-      log.debug("loaded %s with %s" % (data_hash, handler.__name__))
-      return data_dict
+   candidates = [data_url] + handlers_to_use
+   attempts = []
+   for handler in candidates:
+      if handler is None:
+         continue
 
-   return None
+      handler_name = 'url' if handler == data_url else handler.__name__
+      attempts.append( (handler_name, lambda handler=handler: read_from(handler)) )
 
+   result = None
+   if parallel:
+      handler_name, result = race_storage_reads( attempts )
 
+   else:
+      for (handler_name, read_func) in attempts:
+         result = timed_storage_read( handler_name, read_func )
+         if result is not None:
+            break
+
+   if result is None:
+      return None
+
+   data, data_dict = result
+   immutable_cache_put( data_hash, data, hash_func )
+   return data_dict
 
 
 def sign_raw_data(raw_data, privatekey):
@@ -479,10 +759,53 @@ def get_drivers_for_url( url ):
     return ret
 
 
-def get_mutable_data( fq_data_id, data_pubkey, urls=None, data_address=None, owner_address=None, drivers=None, decode=True ):
+def get_mutable_data_issued_at( mutable_data_json_txt ):
+   """
+   Get the time at which a serialized piece of mutable data was signed
+   (the latest 'issuedAt' of its tokens).  This is an ISO 8601 string,
+   so later times sort after earlier ones.
+
+   The signatures are NOT checked here; only use this on data that
+   parse_mutable_data() has verified.
+
+   Return the time on success
+   Return None if it could not be found
+   """
+   try:
+       token_records = json.loads(mutable_data_json_txt)
+       if type(token_records) != list:
+           token_records = [token_records]
+
+       issued_at = []
+       for token_record in token_records:
+           payload = str(token_record['token']).split('.')[1]
+           payload += '=' * (-len(payload) % 4)
+           claims = json.loads( base64.urlsafe_b64decode(payload) )
+           issued_at.append( str(claims['issuedAt']) )
+
+       if len(issued_at) == 0:
+           return None
+
+       return max(issued_at)
+
+   except Exception, e:
+       log.debug("Could not find issuedAt: %s" % e)
+       return None
+
+
+def get_mutable_data( fq_data_id, data_pubkey, urls=None, data_address=None, owner_address=None, drivers=None, decode=True, parallel=None, newest=False ):
    """
    Given a mutable data's zonefile, go fetch the data.
 
+   If parallel is True (default: STORAGE_PARALLEL_READS), fetch from every
+   (driver, URL) pair at once on the shared storage read pool, and verify
+   the replies as they arrive.  Otherwise, try each pair in turn (fastest driver first).
+
+   By default, return the first reply that verifies.  If newest is True,
+   return the most recently-signed reply instead; in parallel mode, this
+   waits at most STORAGE_NEWEST_WINS_WAIT seconds for other replies once
+   the first valid one arrives.
+
    Return a mutable data dict on success
    Return None on error
    """
@@ -492,6 +815,9 @@ def get_mutable_data( fq_data_id, data_pubkey, urls=None, data_address=None, own
    fq_data_id = str(fq_data_id)
    assert is_fq_data_id( fq_data_id ) or is_name_valid( fq_data_id ), "Need either a fully-qualified data ID or a blockchain ID: '%s'" % fq_data_id
 
+   if parallel is None:
+       parallel = STORAGE_PARALLEL_READS
+
    fqu = None
    if is_fq_data_id(fq_data_id):
        fqu = fq_data_id.split(":")[0]
@@ -509,13 +835,17 @@ def get_mutable_data( fq_data_id, data_pubkey, urls=None, data_address=None, own
    else:
        handlers_to_use = storage_handlers
 
+   handlers_to_use = storage_driver_stats.order( handlers_to_use )
+
    log.debug("get_mutable %s" % fq_data_id)
+
+   # which (handler, URL) pairs to attempt?
+   attempts = []
    for storage_handler in handlers_to_use:
 
       if not hasattr(storage_handler, "get_mutable_handler"):
          continue
 
-      # which URLs to attempt?
       try_urls = []
       if urls is None:
         
@@ -545,46 +875,171 @@ def get_mutable_data( fq_data_id, data_pubkey, urls=None, data_address=None, own
                   try_urls.append(url)
 
       for url in try_urls:
+          attempts.append( (storage_handler, url) )
+
+   def fetch( storage_handler, url ):
+      # get the raw data from a (handler, URL) pair.
+      # raise StorageReadMiss if it isn't there
+      log.debug("Try %s (%s)" % (storage_handler.__name__, url))
+      try:
+         data_json = storage_driver_read( storage_handler, "get_mutable_handler", url, fqu=fqu )
+      except UnhandledURLException, uue:
+         # handler doesn't handle this URL
+         log.debug("Storage handler %s does not handle URLs like %s" % (storage_handler.__name__, url ))
+         raise StorageReadMiss()
+
+      except Exception, e:
+         log.exception( e )
+         return None
+
+      if data_json is None:
+         # no data
+         log.debug("No data from %s (%s)" % (storage_handler.__name__, url))
+         raise StorageReadMiss()
+
+      return data_json
+
+   def verify( storage_handler, url, data_json ):
+      # parse it, if desired
+      if decode:
+          data = parse_mutable_data( data_json, data_pubkey, public_key_hash=data_address )
+          if data is None:
+             # maybe try owner address?
+             if owner_address is not None:
+                 data = parse_mutable_data( data_json, data_pubkey, public_key_hash=owner_address )
+
+             if data is None:
+                 log.error("Unparseable data from '%s'" % url)
+                 return None
+
+          log.debug("loaded '%s' with %s" % (url, storage_handler.__name__))
+      else:
+          data = data_json
+          log.debug("fetched (but did not decode) '%s' with '%s'" % (url, storage_handler.__name__))
 
-         data_json = None
+      return data
+
+   if parallel:
+      return race_mutable_data_reads( attempts, fetch, verify, newest )
+
+   best = None
+   for (storage_handler, url) in attempts:
+
+      start = time.time()
+      data_json = None
+      data = None
+      miss = False
+      try:
+         data_json = fetch( storage_handler, url )
+      except StorageReadMiss:
+         miss = True
+
+      if data_json is not None:
+         data = verify( storage_handler, url, data_json )
+
+      storage_driver_stats.record( storage_handler.__name__, time.time() - start, data is not None, miss=miss )
+
+      if data is None:
+         continue
+
+      if not newest:
+         return data
+
+      issued_at = get_mutable_data_issued_at( data_json )
+      if best is None or issued_at > best[0]:
+         best = (issued_at, data)
+
+   if best is not None:
+      return best[1]
+
+   return None
+
+
+# bounds how many mutable data signatures are verified at once
+storage_verify_slots = threading.Semaphore(STORAGE_VERIFY_WORKERS)
+
+
+def race_mutable_data_reads( attempts, fetch, verify, newest ):
+   """
+   Fetch mutable data from all (handler, URL) pairs in attempts at once
+   on the shared storage read pool, using fetch(handler, url) (which returns
+   the raw data or None, or raises StorageReadMiss).
+   Verify replies as they arrive with verify(handler, url, raw data)
+   (which returns the parsed data or None); at most STORAGE_VERIFY_WORKERS
+   replies are verified at once.
+
+   Return the first verified data, or if newest is True, the most
+   recently-signed data that verified within STORAGE_NEWEST_WINS_WAIT
+   seconds of the first one.
+   Return None if nothing verified.
+   """
+   if len(attempts) == 0:
+      return None
+
+   verified = Queue.Queue()     # (raw data, data)
+   state = {'done': False}
+
+   def run_attempt( storage_handler, url ):
+      if state['done']:
+         # already have our answer
+         verified.put( (None, None) )
+         return
+
+      start = time.time()
+      data_json = None
+      data = None
+      miss = False
+      try:
+         data_json = fetch( storage_handler, url )
+         if data_json is not None:
+            with storage_verify_slots:
+               data = verify( storage_handler, url, data_json )
+
+      except StorageReadMiss:
+         miss = True
+
+      except Exception, e:
+         log.exception(e)
          data = None
 
-         log.debug("Try %s (%s)" % (storage_handler.__name__, url))
+      storage_driver_stats.record( storage_handler.__name__, time.time() - start, data is not None, miss=miss )
+      verified.put( (data_json, data) )
+
+   for (storage_handler, url) in attempts:
+      storage_read_pool.submit( lambda storage_handler=storage_handler, url=url: run_attempt(storage_handler, url) )
+
+   best = None
+   deadline = None
+   try:
+      for i in xrange(0, len(attempts)):
          try:
+            if deadline is None:
+               data_json, data = verified.get()
+            else:
+               data_json, data = verified.get( True, max(0, deadline - time.time()) )
 
-            data_json = storage_handler.get_mutable_handler( url, fqu=fqu )
-         except UnhandledURLException, uue:
-            # handler doesn't handle this URL
-            log.debug("Storage handler %s does not handle URLs like %s" % (storage_handler.__name__, url ))
-            continue
+         except Queue.Empty:
+            log.debug("Stopped waiting for newer mutable data")
+            break
 
-         except Exception, e:
-            log.exception( e )
+         if data is None:
             continue
 
-         if data_json is None:
-            # no data
-            log.debug("No data from %s (%s)" % (storage_handler.__name__, url))
-            continue
+         if not newest:
+            return data
 
-         # parse it, if desired
-         if decode:
-             data = parse_mutable_data( data_json, data_pubkey, public_key_hash=data_address )
-             if data is None:
-                # maybe try owner address?
-                if owner_address is not None:
-                    data = parse_mutable_data( data_json, data_pubkey, public_key_hash=owner_address )
+         issued_at = get_mutable_data_issued_at( data_json )
+         if best is None or issued_at > best[0]:
+            best = (issued_at, data)
 
-                if data is None:
-                    log.error("Unparseable data from '%s'" % url)
-                    continue
+         if deadline is None:
+            deadline = time.time() + STORAGE_NEWEST_WINS_WAIT
 
-             log.debug("loaded '%s' with %s" % (url, storage_handler.__name__))
-         else:
-             data = data_json
-             log.debug("fetched (but did not decode) '%s' with '%s'" % (url, storage_handler.__name__))
+   finally:
+      state['done'] = True
 
-         return data
+   if best is not None:
+      return best[1]
 
    return None
 
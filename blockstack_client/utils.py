@@ -22,8 +22,10 @@
 """
 
 import json
+import sys
+import threading
 
-from config import get_logger
+from config import get_logger, RPC_MAX_CONCURRENCY
 log = get_logger()
 
 def exit_with_error(error_message, help_message=None):
@@ -92,3 +94,124 @@ def btc_to_satoshis(btc):
 
     return int(btc / 0.00000001)
 
+
+def parallel_imap(func, args_iter, max_workers=RPC_MAX_CONCURRENCY, max_pending=None):
+    """
+    Call func(arg) for each arg in args_iter, using up to
+    max_workers threads, and yield the results in the same
+    order as args_iter.
+
+    At most max_pending results (default: 2 * max_workers) are
+    computed ahead of the caller, so memory use stays bounded
+    no matter how long args_iter is.
+
+    If func (or args_iter) raises, the exception is re-raised to
+    the caller when its result would have been yielded.  If the caller
+    stops iterating early, the outstanding work is abandoned.
+    """
+    if max_pending is None:
+        max_pending = 2 * max_workers
+
+    max_workers = max(1, max_workers)
+    max_pending = max(max_workers, max_pending)
+
+    args_iter = iter(args_iter)
+    args_lock = threading.Lock()
+    cv = threading.Condition()
+    slots = threading.Semaphore(max_pending)
+    results = {}
+    state = {
+        'submitted': 0,
+        'exhausted': False,
+        'stopped': False,
+    }
+
+    def worker():
+        while True:
+            slots.acquire()
+
+            # NOTE: args_iter can be slow (i.e. it is another parallel_imap),
+            # so don't hold cv while pulling from it
+            with args_lock:
+                with cv:
+                    if state['stopped'] or state['exhausted']:
+                        slots.release()
+                        return
+
+                try:
+                    arg = args_iter.next()
+                except StopIteration:
+                    with cv:
+                        state['exhausted'] = True
+                        cv.notify_all()
+
+                    slots.release()
+                    return
+
+                except Exception:
+                    # args_iter failed;
+                    # pass its error on to the caller in order, instead of ending early
+                    with cv:
+                        results[state['submitted']] = (False, sys.exc_info())
+                        state['submitted'] += 1
+                        state['exhausted'] = True
+                        cv.notify_all()
+
+                    return
+
+                with cv:
+                    idx = state['submitted']
+                    state['submitted'] += 1
+
+            try:
+                res = (True, func(arg))
+            except Exception:
+                res = (False, sys.exc_info())
+
+            with cv:
+                results[idx] = res
+                cv.notify_all()
+
+    threads = []
+    for i in xrange(0, max_workers):
+        t = threading.Thread(target=worker)
+        t.daemon = True
+        t.start()
+        threads.append(t)
+
+    i = 0
+    try:
+        while True:
+            with cv:
+                while i not in results and not (state['exhausted'] and i >= state['submitted']):
+                    # NOTE: a timeout keeps us interruptible
+                    cv.wait(1.0)
+
+                if i not in results:
+                    break
+
+                ok, res = results.pop(i)
+
+            slots.release()
+            i += 1
+
+            if not ok:
+                raise res[0], res[1], res[2]
+
+            yield res
+
+    finally:
+        with cv:
+            state['stopped'] = True
+
+        # wake up any workers blocked on a slot, so they can exit
+        for t in threads:
+            slots.release()
+
+
+def parallel_map(func, args_list, max_workers=RPC_MAX_CONCURRENCY):
+    """
+    Like map(), but call func on up to max_workers threads.
+    Results are in the same order as args_list.
+    """
+    return list(parallel_imap(func, args_list, max_workers=max_workers))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2014 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import copy
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), "tools"))
+
+from blockstack_client.operations import NameHistoryReplay, nameop_restore_from_history
+from bench_history_replay import legacy_restore_from_history, make_history
+
+
+class NameHistoryReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        self.name_rec = make_history( 500 )
+        self.history = self.name_rec['history']
+        self.block_ids = sorted(self.history.keys())
+
+    def legacy(self, block_id):
+        # the legacy code modifies the history it is given
+        return legacy_restore_from_history( self.name_rec, copy.deepcopy(self.history), block_id )
+
+    def test_every_block(self):
+        """ Check a shared replay against the legacy code, newest block first
+        """
+
+        replay = NameHistoryReplay( self.name_rec, self.history )
+        for block_id in reversed(self.block_ids):
+            self.assertEqual( self.legacy(block_id), replay.restore(block_id), msg="Mismatch at %s" % block_id )
+
+    def test_random_blocks(self):
+        """ Check a shared replay and single calls against the legacy code, in any order
+        """
+
+        replay = NameHistoryReplay( self.name_rec, self.history )
+        first_block = self.block_ids[0]
+        last_block = self.block_ids[-1]
+        for i in xrange(0, 200):
+            block_id = random.randint(first_block - 5, last_block + 5)
+            expected = self.legacy(block_id)
+            self.assertEqual( expected, replay.restore(block_id), msg="Mismatch at %s" % block_id )
+            self.assertEqual( expected, nameop_restore_from_history( self.name_rec, self.history, block_id ), msg="Mismatch at %s" % block_id )
+
+    def test_results_are_copies(self):
+        """ Check that changing a restored state does not change the replay or the history
+        """
+
+        history_before = copy.deepcopy(self.history)
+        replay = NameHistoryReplay( self.name_rec, self.history )
+        block_id = self.block_ids[len(self.block_ids) / 2]
+
+        for state in replay.restore(block_id):
+            state['value_hash'] = 'changed'
+            state['nested'] = {'changed': True}
+
+        self.assertEqual( self.legacy(block_id), replay.restore(block_id) )
+        self.assertEqual( history_before, self.history )
+
+
+if __name__ == '__main__':
+
+    unittest.main()
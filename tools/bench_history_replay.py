@@ -0,0 +1,204 @@
+#!/usr/bin/env python2
+"""
+    Blockstack-client
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Benchmark the history replay engine (operations.NameHistoryReplay)
+against the original deepcopy-based nameop_restore_from_history, on
+synthetic name histories.  Checks that both give the same answers.
+
+Usage: bench_history_replay.py [NUM_ENTRIES [NUM_QUERIES]]
+"""
+
+import os
+import sys
+import copy
+import time
+import random
+
+# Hack around absolute paths
+current_dir = os.path.abspath(os.path.dirname(__file__))
+parent_dir = os.path.abspath(current_dir + "/../")
+
+sys.path.insert(0, parent_dir)
+
+from blockstack_client.operations import NameHistoryReplay, nameop_restore_from_history
+
+
+def legacy_restore_from_history( name_rec, name_history, block_id ):
+    """
+    The original algorithm:  deep-copy the current record,
+    and replay every later block on each call.
+    (The no-history and abort cases are left out.)
+    """
+    block_history = list( reversed( sorted( name_history.keys() ) ) )
+
+    historical_rec = copy.deepcopy( name_rec )
+    if 'history' in historical_rec:
+        del historical_rec['history']
+
+    if block_id > block_history[0]:
+        return [historical_rec]
+
+    if block_id < name_rec['block_number']:
+        return None
+
+    last_block = len(block_history)
+    for i in xrange( 0, len(block_history) ):
+        if block_id >= block_history[i]:
+            last_block = i
+            break
+
+    i = 0
+    while i < last_block:
+        diff_list = list( reversed( name_history[ block_history[i] ] ) )
+        for diff in diff_list:
+            if diff.has_key('history_snapshot'):
+                historical_rec = copy.deepcopy( diff )
+                del historical_rec['history_snapshot']
+
+            else:
+                if diff.has_key('block_number'):
+                    del diff['block_number']
+
+                historical_rec.update( diff )
+
+        i += 1
+
+    updates = [ copy.deepcopy( historical_rec ) ]
+
+    if i < len(block_history):
+        diff_list = list( reversed( name_history[ block_history[i] ] ) )
+        if len(diff_list) > 1:
+            for diff in diff_list[:-1]:
+                if diff.has_key('block_number'):
+                    del diff['block_number']
+
+                if diff.has_key('history_snapshot'):
+                    historical_rec = copy.deepcopy( diff )
+                    del historical_rec['history_snapshot']
+
+                else:
+                    historical_rec.update( diff )
+
+                updates.append( copy.deepcopy(historical_rec) )
+
+    return list( reversed( updates ) )
+
+
+def make_history( num_entries, first_block=400000 ):
+    """
+    Make a synthetic name record with num_entries history diffs.
+    Some blocks get several operations; a few diffs are snapshots.
+    """
+    name_rec = {
+        'name': 'bench.id',
+        'block_number': first_block,
+        'op': '+',
+        'txid': '%064x' % random.getrandbits(256),
+        'vtxindex': 1,
+        'value_hash': '%040x' % random.getrandbits(160),
+        'address': '1BenchAddressXXXXXXXXXXXXXXXXXXXXX',
+        'sender': '76a914%040x88ac' % random.getrandbits(160),
+        'op_fee': 6400000,
+        'first_registered': first_block + 1,
+        'last_renewed': first_block + 1,
+        'revoked': False,
+    }
+
+    history = {}
+    block_id = first_block
+    for i in xrange(0, num_entries):
+        diff = {
+            'op': '+',
+            'txid': '%064x' % random.getrandbits(256),
+            'vtxindex': random.randint(1, 100),
+            'value_hash': '%040x' % random.getrandbits(160),
+            'block_number': block_id,
+        }
+
+        if random.random() < 0.05:
+            snapshot = dict(name_rec)
+            snapshot.update(diff)
+            snapshot['history_snapshot'] = True
+            diff = snapshot
+
+        history.setdefault(block_id, []).append(diff)
+
+        if random.random() < 0.7:
+            block_id += random.randint(1, 10)
+
+    name_rec['history'] = history
+    return name_rec
+
+
+def bench( label, func, queries ):
+    """
+    Time func(block_id) over queries.
+    Return (results, seconds)
+    """
+    start = time.time()
+    results = [func(block_id) for block_id in queries]
+    elapsed = time.time() - start
+    print "%-40s %8.3fs" % (label, elapsed)
+    return results, elapsed
+
+
+if __name__ == "__main__":
+    num_entries = 2000
+    num_queries = 200
+
+    if len(sys.argv) > 1:
+        num_entries = int(sys.argv[1])
+
+    if len(sys.argv) > 2:
+        num_queries = int(sys.argv[2])
+
+    random.seed(0)
+    name_rec = make_history( num_entries )
+    history = name_rec['history']
+    block_ids = sorted(history.keys())
+    queries = [random.choice(block_ids) for i in xrange(0, num_queries)]
+
+    print "%s history entries over %s blocks; %s queries" % (num_entries, len(block_ids), num_queries)
+
+    # the legacy code modifies the history, so give it its own copy each time
+    # (made ahead of time, so we don't time the copying)
+    history_copies = iter([copy.deepcopy(history) for b in queries])
+    legacy, legacy_time = bench( "legacy, one call per query", lambda b: legacy_restore_from_history( name_rec, history_copies.next(), b ), queries )
+    single, single_time = bench( "nameop_restore_from_history", lambda b: nameop_restore_from_history( name_rec, history, b ), queries )
+
+    replay = NameHistoryReplay( name_rec, history )
+    shared, shared_time = bench( "NameHistoryReplay, shared", replay.restore, queries )
+
+    # every block, newest first (i.e. find_last_transfer_consensus_hash)
+    all_blocks = list(reversed(block_ids))
+    history_copies = iter([copy.deepcopy(history) for b in all_blocks])
+    legacy_all, legacy_all_time = bench( "legacy, every block", lambda b: legacy_restore_from_history( name_rec, history_copies.next(), b ), all_blocks )
+    replay = NameHistoryReplay( name_rec, history )
+    shared_all, shared_all_time = bench( "NameHistoryReplay, every block", replay.restore, all_blocks )
+
+    assert legacy == single, "nameop_restore_from_history disagrees with the legacy code"
+    assert legacy == shared, "NameHistoryReplay disagrees with the legacy code"
+    assert legacy_all == shared_all, "NameHistoryReplay disagrees with the legacy code on every block"
+
+    print "speedup: %.1fx (single calls), %.1fx (shared), %.1fx (every block)" % \
+            (legacy_time / max(single_time, 1e-6), legacy_time / max(shared_time, 1e-6), legacy_all_time / max(shared_all_time, 1e-6))